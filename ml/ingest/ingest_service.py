@@ -37,6 +37,20 @@ class IngestService:
             )
         return sources
 
+    def get_knowledge_source(self, source_id: int):
+        self.cursor.execute(
+            "SELECT * FROM knowledge_sources WHERE id = ?", (source_id,)
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "file_urls": json.loads(row[1]) if row[1] else [],
+            "created_at": row[2],
+            "updated_at": row[3],
+        }
+
     def update_knowledge_source(self, source_id: int, file_urls: list[str]):
         if file_urls is None:
             return False  # Don't update if no file_urls provided
@@ -6,7 +6,7 @@ from fastapi.staticfiles import StaticFiles
 
 from gender_bias import gender_bias_router
 from ingest import ingest_controller
-from rag import rag_controller, rag_service
+from rag import rag_controller, rag_service, model_registry, scanner_pool
 from continuous_learning import continuous_learning_router
 from referral import referral_content_router
 from webscrape import web_scrape, webscrape_router
@@ -61,6 +61,14 @@ app.include_router(builder_router)
 app.include_router(intent_router)
 app.include_router(cover_letter_router)
 
+
+@app.on_event("startup")
+def warm_up_models():
+    # Load shared models once per worker before serving requests
+    model_registry.warm_up()
+    scanner_pool.warm_up()
+
+
 # Initial ingest
 # print("Initial ingesting data...")
 # rag_service.ingest()
@@ -0,0 +1,84 @@
+import hashlib
+import os
+from typing import Any, Iterable, Optional
+
+import diskcache
+
+from rag.semantic_cache import normalize_question
+
+
+class AnswerCache:
+    """
+    Disk-backed answer cache split into independent namespaces.
+
+    Each namespace lives in its own diskcache directory, so callers that
+    store different value formats never read each other's entries. Keys
+    combine the normalized question with the index and prompt versions, so
+    a re-ingest or prompt change makes older entries unreachable; they are
+    then dropped by TTL or culled by the namespace size limit.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        namespaces: Iterable[str],
+        size_limit_mb: int = 256,
+        ttl: float = 3600,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self._caches = {}
+        for namespace in namespaces:
+            cache = diskcache.Cache(
+                os.path.join(directory, namespace),
+                size_limit=size_limit_mb * 1024 * 1024,
+            )
+            cache.stats(enable=True)
+            self._caches[namespace] = cache
+
+    @staticmethod
+    def make_key(
+        question: str, index_version: int, prompt_version: str, scope: str = ""
+    ) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode()).hexdigest()
+        return f"v{index_version}:{prompt_version}:{scope}:{digest}"
+
+    def get(
+        self,
+        namespace: str,
+        question: str,
+        index_version: int,
+        prompt_version: str,
+        scope: str = "",
+    ) -> Optional[Any]:
+        key = self.make_key(question, index_version, prompt_version, scope)
+        return self._caches[namespace].get(key)
+
+    def set(
+        self,
+        namespace: str,
+        question: str,
+        index_version: int,
+        prompt_version: str,
+        value: Any,
+        scope: str = "",
+    ):
+        key = self.make_key(question, index_version, prompt_version, scope)
+        self._caches[namespace].set(key, value, expire=self.ttl)
+
+    def clear(self):
+        for cache in self._caches.values():
+            cache.clear()
+
+    def stats(self) -> dict:
+        stats = {}
+        for namespace, cache in self._caches.items():
+            hits, misses = cache.stats()
+            stats[namespace] = {
+                "entries": len(cache),
+                "size_bytes": cache.volume(),
+                "size_limit_bytes": cache.size_limit,
+                "hits": hits,
+                "misses": misses,
+            }
+        return stats
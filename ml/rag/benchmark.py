@@ -0,0 +1,368 @@
+"""
+Offline benchmark of the RAG pipeline.
+
+LlamaParse, Gemini (GoogleGenAI) and litellm.completion are replaced by
+deterministic local stubs and the corpus is a set of generated PDFs, so a
+run needs no API keys or network access beyond the local models (embedding,
+reranker and guardrail scanners). Reports ingest throughput, index load time
+and per-stage query latency percentiles, written as JSON so runs can be
+compared.
+
+Run from the ml directory:
+
+    python -m rag.benchmark --docs 20 --pages 5 --queries 50 --out bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import textwrap
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import ClassVar, List
+
+# Make `rag` importable after chdir-ing into the work directory
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_DIR not in sys.path:
+    sys.path.insert(0, ML_DIR)
+
+VOCABULARY = (
+    "resume experience education skills project leadership python analytics "
+    "internship certification teamwork communication portfolio interview "
+    "recruiter salary negotiation networking mentorship cloud security design "
+    "research publication volunteer management budget stakeholder roadmap "
+    "delivery agile testing deployment automation customer growth strategy "
+    "marketing finance operations compliance training onboarding promotion "
+    "feedback review objective achievement metric impact initiative"
+).split()
+
+# Stage timings the query engine reports in metadata["timings"]
+STAGES = (
+    "input_scan_ms",
+    "retrieval_ms",
+    "context_ms",
+    "image_load_ms",
+    "synthesis_ms",
+    "output_scan_ms",
+)
+
+
+# Synthetic corpus
+def page_text(rng: random.Random, doc: int, page: int) -> str:
+    """Deterministic page text with a unique, queryable section header."""
+    topic = rng.sample(VOCABULARY, 2)
+    sentences = [f"Section {doc}-{page} covers {topic[0]} and {topic[1]}."]
+    for _ in range(rng.randint(12, 20)):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 16))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def generate_corpus(directory: str, docs: int, pages: int, seed: int) -> List[str]:
+    """
+    Writes `docs` PDFs of `pages` pages each and returns one question per
+    page. Each PDF gets a `.pages.json` sidecar holding its page texts,
+    which the LlamaParse stub returns as the parse result.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    questions = []
+    for doc in range(docs):
+        path = os.path.join(directory, f"synthetic-{doc:04d}.pdf")
+        texts = [page_text(rng, doc, page + 1) for page in range(pages)]
+
+        # invariant=1 keeps the bytes (and so the content hash) reproducible
+        pdf = canvas.Canvas(path, pagesize=letter, invariant=1)
+        for text in texts:
+            y = 750
+            for line in textwrap.wrap(text, 90):
+                pdf.drawString(40, y, line)
+                y -= 14
+            pdf.showPage()
+        pdf.save()
+
+        with open(f"{path}.pages.json", "w") as f:
+            json.dump(texts, f)
+        for page, text in enumerate(texts, start=1):
+            topic = text.split(" covers ")[1].split(".")[0]
+            questions.append(f"What does section {doc}-{page} say about {topic}?")
+    return questions
+
+
+# Stubs
+class StubLlamaParse:
+    """LlamaParse stand-in returning a PDF's sidecar page texts."""
+
+    latency_seconds = 0.0
+
+    def __init__(self, api_key=None, result_type="text", **kwargs):
+        self.result_type = result_type
+
+    @staticmethod
+    def _pages(file_path: str) -> List[str]:
+        with open(f"{file_path}.pages.json", "r") as f:
+            return json.load(f)
+
+    def load_data(self, file_path: str):
+        from llama_index.core import Document
+
+        time.sleep(self.latency_seconds)
+        return [Document(text="\n---\n".join(self._pages(file_path)))]
+
+    def get_json_result(self, file_path: str):
+        time.sleep(self.latency_seconds)
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        pages = [
+            {
+                "page": n,
+                "md": f"# Page {n}\n\n{text}",
+                "images": [{"name": f"{stem}-page-{n}.jpg"}],
+            }
+            for n, text in enumerate(self._pages(file_path), start=1)
+        ]
+        return [{"pages": pages, "file_path": file_path}]
+
+    def get_images(self, json_result, download_path: str):
+        from PIL import Image, ImageDraw
+
+        os.makedirs(download_path, exist_ok=True)
+        images = []
+        for result in json_result:
+            for page in result["pages"]:
+                for image in page["images"]:
+                    path = os.path.join(download_path, image["name"])
+                    if not os.path.exists(path):
+                        canvas = Image.new("RGB", (1224, 1584), "white")
+                        draw = ImageDraw.Draw(canvas)
+                        draw.text((60, 60), page["md"][:200], fill="black")
+                        canvas.save(path, format="JPEG", quality=90)
+                    images.append(
+                        {**image, "path": path, "page_number": page["page"]}
+                    )
+        return images
+
+
+def make_stub_gemini(latency_seconds: float = 0.0):
+    """
+    Returns a GoogleGenAI instance whose completions are computed locally:
+    the answer quotes the start of the context and cites its first page.
+    It is a real GoogleGenAI subclass so the query engine accepts it.
+    """
+    from llama_index.core.base.llms.types import CompletionResponse
+    from llama_index.llms.google_genai import GoogleGenAI
+
+    class StubGemini(GoogleGenAI):
+        latency: ClassVar[float] = latency_seconds
+
+        @staticmethod
+        def _answer(prompt: str) -> str:
+            page = "1"
+            for line in prompt.splitlines():
+                if line.startswith("page_num:"):
+                    page = line.split(":", 1)[1].strip()
+                    break
+            words = prompt.split()[:40]
+            return f"According to the context (Page {page}): {' '.join(words)}"
+
+        def complete(self, prompt, formatted=False, **kwargs):
+            time.sleep(self.latency)
+            return CompletionResponse(text=self._answer(prompt))
+
+        async def acomplete(self, prompt, formatted=False, **kwargs):
+            await asyncio.sleep(self.latency)
+            return CompletionResponse(text=self._answer(prompt))
+
+        def stream_complete(self, prompt, formatted=False, **kwargs):
+            time.sleep(self.latency)
+            text = ""
+            for word in self._answer(prompt).split(" "):
+                delta = word if not text else f" {word}"
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+    # model_construct skips GoogleGenAI.__init__, which needs an API key
+    return StubGemini.model_construct(model="models/gemini-2.0-flash")
+
+
+def stub_completion(model=None, messages=None, **kwargs):
+    """litellm.completion stand-in echoing the last user message."""
+    content = messages[-1]["content"] if messages else ""
+    message = SimpleNamespace(content=f"Reference answer: {content[:200]}")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+# Measurement
+def summarize(samples_ms: List[float]) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def percentile(p):
+        # Nearest-rank percentile
+        rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+        return round(ordered[min(rank, len(ordered)) - 1], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "min": round(ordered[0], 3),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def run(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    # rag_service keeps its caches and data under relative _data/ paths
+    os.chdir(workdir)
+    os.environ.setdefault("LLAMACLOUD_API_KEY", "offline")
+    os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+    from rag import model_registry
+
+    model_registry.get_or_load(
+        ("llm", model_registry.LLM_MODEL_NAME),
+        lambda: make_stub_gemini(args.llm_latency_ms / 1000),
+    )
+
+    from rag import rag_service
+
+    StubLlamaParse.latency_seconds = args.parse_latency_ms / 1000
+    rag_service.LlamaParse = StubLlamaParse
+    rag_service.completion = stub_completion
+
+    data_dir = os.path.join(workdir, "_data", "files")
+    storage_dir = os.path.join(workdir, "_data", "vector")
+    image_dir = os.path.join(workdir, "_data", "data_images")
+
+    print(f"Generating {args.docs} PDFs x {args.pages} pages in {data_dir}")
+    questions = generate_corpus(data_dir, args.docs, args.pages, args.seed)
+    scanners = {"input_scanners": None, "output_scanners": None}
+    if args.skip_guardrails:
+        scanners = {"input_scanners": [], "output_scanners": []}
+
+    def new_pipeline():
+        pipeline = rag_service.RAGPipeline(
+            storage_dir=storage_dir, image_dir=image_dir, **scanners
+        )
+        if args.skip_guardrails:
+            # An empty list would fall back to the default scanners
+            pipeline.input_scanners, pipeline.output_scanners = [], []
+        return pipeline
+
+    # Ingest
+    pipeline = new_pipeline()
+    start = time.perf_counter()
+    summary = pipeline.ingest_data(data_dir, max_workers=args.ingest_workers)
+    ingest_seconds = time.perf_counter() - start
+    pages = args.docs * args.pages
+    ingest = {
+        "seconds": round(ingest_seconds, 3),
+        "documents": args.docs,
+        "pages": pages,
+        "documents_per_second": round(args.docs / ingest_seconds, 3),
+        "pages_per_second": round(pages / ingest_seconds, 3),
+        "summary": summary,
+    }
+
+    # Index load
+    load_ms = []
+    for _ in range(args.load_repeats):
+        start = time.perf_counter()
+        loaded = new_pipeline()
+        loaded.load_index()
+        load_ms.append((time.perf_counter() - start) * 1000)
+
+    # Queries, against the engine directly so answer caches don't interfere
+    engine, _ = loaded._query_engine(loaded._live_snapshot())
+
+    rng = random.Random(args.seed)
+    sampled = [rng.choice(questions) for _ in range(args.queries)]
+    for question in sampled[: args.warmup]:
+        engine.query(question)
+
+    latencies = {"total": [], **{s.removesuffix("_ms"): [] for s in STAGES}}
+    latencies["other"] = []
+    statuses = {}
+    for question in sampled:
+        start = time.perf_counter()
+        response = engine.query(question)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        timings = response.metadata.get("timings", {})
+        stage_ms = {s: timings.get(s, 0.0) for s in STAGES}
+        latencies["total"].append(total_ms)
+        for stage, ms in stage_ms.items():
+            latencies[stage.removesuffix("_ms")].append(ms)
+        # Prompt formatting and engine overhead
+        latencies["other"].append(max(0.0, total_ms - sum(stage_ms.values())))
+        status = (response.metadata or {}).get("response_status", "unknown")
+        statuses[status] = statuses.get(status, 0) + 1
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "ingest": ingest,
+        "index_load_ms": summarize(load_ms),
+        "query": {
+            "statuses": statuses,
+            "latency_ms": {stage: summarize(v) for stage, v in latencies.items()},
+        },
+    }
+    if not args.workdir and not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--ingest-workers", type=int, default=4)
+    parser.add_argument("--parse-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--skip-guardrails", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep data here instead of a temp dir")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp dir")
+    parser.add_argument("--out", help="JSON output path (default: stdout only)")
+    args = parser.parse_args(argv)
+    if args.load_repeats < 1:
+        # Queries run against the last index loaded
+        parser.error("--load-repeats must be at least 1")
+
+    out_path = os.path.abspath(args.out) if args.out else None
+    result = run(args)
+
+    report = json.dumps(result, indent=2, default=str)
+    print(report)
+    if out_path:
+        with open(out_path, "w") as f:
+            f.write(report)
+        print(f"Benchmark results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
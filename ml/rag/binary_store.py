@@ -0,0 +1,771 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.kvstore.types import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COLLECTION,
+    BaseKVStore,
+)
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+# File names inside an index directory
+KV_STORE_FNAME = "index.sqlite"
+VECTORS_FNAME = "vectors.bin"
+SCALES_FNAME = "vectors.scale"
+HEADER_FNAME = "vectors.json"
+ROWS_FNAME = "vectors.sqlite"
+# Array files of any generation: vectors.bin, vectors.3.bin, vectors.3.scale
+ARRAY_FNAME_PATTERN = re.compile(r"^vectors(?:\.(\d+))?\.(?:bin|scale)$")
+
+# Metadata keys kept next to each vector row, and filterable on
+ROW_METADATA_KEYS = ("file_name", "page_num")
+
+# Rows scored per chunk, bounds the float32 working set for int8 stores
+SCORE_CHUNK_ROWS = 65536
+# Rewrite the vector file once this share of its rows is deleted
+COMPACT_DELETED_RATIO = 0.3
+
+
+class SQLiteKVStore(BaseKVStore):
+    """
+    Key-value store on a single SQLite table, used as the docstore and index
+    store backend. Every put is a row-level upsert, so adding nodes never
+    rewrites the whole store the way the JSON-backed stores do.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                collection TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (collection, key)
+            )
+        """
+        )
+        self._conn.commit()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(
+        self, key: str, val: dict, collection: str = DEFAULT_COLLECTION
+    ) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        # One transaction for the whole call, whatever the batch size
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                [(collection, key, json.dumps(val)) for key, val in kv_pairs],
+            )
+            self._conn.commit()
+
+    async def aput_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?",
+                (collection, key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(
+        self, key: str, collection: str = DEFAULT_COLLECTION
+    ) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+
+def metadata_index_value(key: str, value: Any) -> str:
+    """
+    Normalizes a row metadata value for the metadata index. File names are
+    matched on their base name, so a filter may name a file by path or URL.
+    """
+    if key == "file_name":
+        return os.path.basename(str(value).rstrip("/"))
+    return str(value)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _quantize(matrix: np.ndarray):
+    """Symmetric per-row int8 quantization: row ~= q * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+    return quantized, scales
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store persisted as one contiguous row-major array.
+
+    Vectors are unit-normalized and stored as float32, or as int8 with a
+    float32 scale per row. The persisted array is memory-mapped on load, so
+    startup cost doesn't depend on corpus size. Row ids and a little
+    metadata live in a small SQLite table. New vectors are appended to the
+    file on `persist()` and deletions are tombstones, so an ingest never
+    rewrites the existing rows (until enough rows are deleted to compact).
+
+    The row metadata (ROW_METADATA_KEYS) is also indexed in memory, value to
+    rows, so a query with metadata filters only scores the matching rows
+    instead of filtering the top-k of a full scan.
+
+    Compaction renumbers rows, so it writes a new generation of the array
+    files and row table beside the current one. The header names the live
+    generation and is written last, which makes the switch atomic: after a
+    crash `_load` finds either generation complete and removes the other.
+    """
+
+    stores_text: bool = False
+    directory: str
+    dtype: str = "float32"
+
+    _lock: Any = PrivateAttr()
+    _conn: Any = PrivateAttr()
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _count: int = PrivateAttr(default=0)
+    _generation: int = PrivateAttr(default=0)
+    _vectors: Any = PrivateAttr(default=None)
+    _scales: Any = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _row_of: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _ref_doc_of: Dict[str, Optional[str]] = PrivateAttr(default_factory=dict)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _row_metadata: Dict[int, dict] = PrivateAttr(default_factory=dict)
+    _metadata_index: Dict[str, Dict[str, set]] = PrivateAttr(default_factory=dict)
+    _pending: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _pending_rows: List[tuple] = PrivateAttr(default_factory=list)
+    _pending_deletes: set = PrivateAttr(default_factory=set)
+
+    def __init__(self, directory: str, dtype: str = "float32", **kwargs: Any):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        super().__init__(directory=directory, dtype=dtype, **kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(directory, ROWS_FNAME), check_same_thread=False
+        )
+        self._load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def _path(self, fname: str) -> str:
+        return os.path.join(self.directory, fname)
+
+    def _array_path(self, fname: str, generation: Optional[int] = None) -> str:
+        """Path of an array file (VECTORS_FNAME or SCALES_FNAME) of a generation."""
+        generation = self._generation if generation is None else generation
+        if generation:
+            stem, ext = os.path.splitext(fname)
+            fname = f"{stem}.{generation}{ext}"
+        return self._path(fname)
+
+    def _rows_table(self, generation: Optional[int] = None) -> str:
+        generation = self._generation if generation is None else generation
+        return f"rows_{generation}" if generation else "rows"
+
+    def _create_rows_table(self, generation: Optional[int] = None):
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self._rows_table(generation)} (
+                row INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                ref_doc_id TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+        """
+        )
+        self._conn.commit()
+
+    def _remove_stale_generations(self):
+        """Drops array files and row tables of generations other than the live one."""
+        tables = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+            " AND (name = 'rows' OR name LIKE 'rows!_%' ESCAPE '!')"
+        ).fetchall()
+        for (table,) in tables:
+            if table != self._rows_table():
+                self._conn.execute(f"DROP TABLE {table}")
+        self._conn.commit()
+        for fname in os.listdir(self.directory):
+            match = ARRAY_FNAME_PATTERN.match(fname)
+            if match and int(match.group(1) or 0) != self._generation:
+                os.remove(self._path(fname))
+
+    def _load(self):
+        header_path = self._path(HEADER_FNAME)
+        if os.path.exists(header_path):
+            with open(header_path, "r") as f:
+                header = json.load(f)
+            if header["dtype"] != self.dtype:
+                print(
+                    f"Vector store in {self.directory} is {header['dtype']}, "
+                    f"ignoring requested {self.dtype}"
+                )
+                self.dtype = header["dtype"]
+            self._dim = header["dim"]
+            self._count = header["count"]
+            self._generation = header.get("generation", 0)
+        self._create_rows_table()
+        # Leftovers of an interrupted compaction, or of the one before it
+        self._remove_stale_generations()
+
+        table = self._rows_table()
+        # Rows past the header count come from an interrupted persist
+        self._conn.execute(f"DELETE FROM {table} WHERE row >= ?", (self._count,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            f"SELECT row, node_id, ref_doc_id, metadata, deleted FROM {table}"
+            " ORDER BY row"
+        ).fetchall()
+        self._ids = [node_id for _, node_id, _, _, _ in rows]
+        self._deleted = {row for row, _, _, _, deleted in rows if deleted}
+        self._row_of = {
+            node_id: row for row, node_id, _, _, deleted in rows if not deleted
+        }
+        self._ref_doc_of = {
+            node_id: ref_doc_id
+            for _, node_id, ref_doc_id, _, deleted in rows
+            if not deleted
+        }
+        self._index_metadata(
+            (row, json.loads(metadata or "{}"))
+            for row, _, _, metadata, deleted in rows
+            if not deleted
+        )
+        self._map_vectors()
+
+    def _index_metadata(self, rows):
+        """Rebuilds the metadata index from (row, metadata) pairs."""
+        self._row_metadata = {}
+        self._metadata_index = {key: {} for key in ROW_METADATA_KEYS}
+        for row, metadata in rows:
+            self._add_metadata(row, metadata)
+
+    def _add_metadata(self, row: int, metadata: dict):
+        self._row_metadata[row] = metadata
+        for key, value in metadata.items():
+            value = metadata_index_value(key, value)
+            self._metadata_index[key].setdefault(value, set()).add(row)
+
+    def _remove_metadata(self, row: int):
+        for key, value in self._row_metadata.pop(row, {}).items():
+            value = metadata_index_value(key, value)
+            rows = self._metadata_index[key].get(value)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._metadata_index[key][value]
+
+    def _map_vectors(self):
+        if not self._count:
+            self._vectors = None
+            self._scales = None
+            return
+        self._vectors = np.memmap(
+            self._array_path(VECTORS_FNAME),
+            dtype=np.int8 if self.dtype == "int8" else np.float32,
+            mode="r",
+            shape=(self._count, self._dim),
+        )
+        self._scales = (
+            np.memmap(
+                self._array_path(SCALES_FNAME),
+                dtype=np.float32,
+                mode="r",
+                shape=(self._count,),
+            )
+            if self.dtype == "int8"
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory held for scoring: the mapped vectors (resident
+        once scanned) plus pending vectors; ids and the metadata index are
+        counted at a rough per-row overhead.
+        """
+        with self._lock:
+            itemsize = 1 if self.dtype == "int8" else 4
+            dim = self._dim or 0
+            persisted = self._count * dim * itemsize
+            if self._scales is not None:
+                persisted += self._count * 4
+            pending = len(self._pending) * dim * 4
+            return persisted + pending + len(self._ids) * 256
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        matrix = _normalize_rows(
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        )
+        with self._lock:
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} does not match "
+                    f"the store's {self._dim}"
+                )
+
+            for node, vector in zip(nodes, matrix):
+                if node.node_id in self._row_of:
+                    self._mark_deleted(node.node_id)
+                row = len(self._ids)
+                metadata = {
+                    k: node.metadata[k] for k in ROW_METADATA_KEYS if k in node.metadata
+                }
+                self._ids.append(node.node_id)
+                self._row_of[node.node_id] = row
+                self._ref_doc_of[node.node_id] = node.ref_doc_id
+                self._add_metadata(row, metadata)
+                self._pending.append(vector)
+                self._pending_rows.append(
+                    (row, node.node_id, node.ref_doc_id, json.dumps(metadata))
+                )
+        return [node.node_id for node in nodes]
+
+    def _mark_deleted(self, node_id: str):
+        row = self._row_of.pop(node_id, None)
+        self._ref_doc_of.pop(node_id, None)
+        if row is not None:
+            self._deleted.add(row)
+            self._pending_deletes.add(row)
+            self._remove_metadata(row)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            for node_id in [
+                n for n, ref in self._ref_doc_of.items() if ref == ref_doc_id
+            ]:
+                self._mark_deleted(node_id)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Any = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        if filters is not None:
+            raise ValueError("Metadata filters are not supported by MmapVectorStore")
+        with self._lock:
+            for node_id in node_ids or []:
+                self._mark_deleted(node_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            for node_id in list(self._row_of):
+                self._mark_deleted(node_id)
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Returns float32 vectors for the given row numbers."""
+        out = np.empty((len(rows), self._dim or 0), dtype=np.float32)
+        persisted = rows < self._count
+        if persisted.any():
+            idx = rows[persisted]
+            block = np.asarray(self._vectors[idx], dtype=np.float32)
+            if self._scales is not None:
+                block *= np.asarray(self._scales[idx])[:, None]
+            out[persisted] = block
+        if (~persisted).any():
+            pending = np.stack(self._pending)
+            out[~persisted] = pending[rows[~persisted] - self._count]
+        return out
+
+    def _all_scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """
+        Scores every row against a (dim,) query vector, or a (dim, n) matrix
+        of n queries at once, which returns a (rows, n) matrix.
+        """
+        parts = []
+        for start in range(0, self._count, SCORE_CHUNK_ROWS):
+            block = self._vectors[start : start + SCORE_CHUNK_ROWS]
+            scores = np.asarray(block, dtype=np.float32) @ query_vector
+            if self._scales is not None:
+                scales = np.asarray(self._scales[start : start + SCORE_CHUNK_ROWS])
+                scores *= scales.reshape(scales.shape + (1,) * (scores.ndim - 1))
+            parts.append(scores)
+        if self._pending:
+            parts.append(np.stack(self._pending) @ query_vector)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+
+    def get(self, text_id: str) -> List[float]:
+        return self.get_embeddings([text_id])[0].tolist()
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Returns the stored (unit-normalized) embeddings as one matrix."""
+        with self._lock:
+            rows = np.asarray([self._row_of[n] for n in node_ids], dtype=np.int64)
+            return self._row_vectors(rows)
+
+    def _filtered_rows(self, filters: MetadataFilters) -> set:
+        """
+        Returns the live rows matching the filters, looked up in the metadata
+        index. Supports EQ and IN filters on ROW_METADATA_KEYS, combined with
+        AND or OR.
+        """
+        row_sets = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                row_sets.append(self._filtered_rows(metadata_filter))
+                continue
+            key = metadata_filter.key
+            if key not in ROW_METADATA_KEYS:
+                raise ValueError(f"MmapVectorStore can't filter on {key!r}")
+            if metadata_filter.operator == FilterOperator.EQ:
+                values = [metadata_filter.value]
+            elif metadata_filter.operator == FilterOperator.IN:
+                values = metadata_filter.value
+            else:
+                raise ValueError(
+                    f"MmapVectorStore can't filter with {metadata_filter.operator}"
+                )
+            index = self._metadata_index[key]
+            rows = set()
+            for value in values:
+                rows |= index.get(metadata_index_value(key, value), set())
+            row_sets.append(rows)
+
+        if not row_sets:
+            return set(self._row_of.values())
+        if filters.condition == FilterCondition.OR:
+            return set().union(*row_sets)
+        return set.intersection(*row_sets)
+
+    def node_ids(self, filters: MetadataFilters) -> List[str]:
+        """Returns the ids of the nodes matching the filters."""
+        with self._lock:
+            return [self._ids[row] for row in sorted(self._filtered_rows(filters))]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+
+        with self._lock:
+            allowed_rows = None
+            if query.filters is not None:
+                allowed_rows = self._filtered_rows(query.filters)
+            node_ids = query.node_ids
+            if node_ids and len(node_ids) >= len(self._row_of):
+                # VectorIndexRetriever passes every node id of the index with
+                # each query; a list covering the store restricts nothing and
+                # the chunked full scan is cheaper than gathering every row
+                node_ids = None
+            if node_ids or query.doc_ids:
+                allowed_ids = set(node_ids or [])
+                if query.doc_ids:
+                    doc_ids = set(query.doc_ids)
+                    allowed_ids |= {
+                        n for n, ref in self._ref_doc_of.items() if ref in doc_ids
+                    }
+                id_rows = {self._row_of[n] for n in allowed_ids if n in self._row_of}
+                allowed_rows = (
+                    id_rows if allowed_rows is None else allowed_rows & id_rows
+                )
+
+            if allowed_rows is not None:
+                # Only the allowed rows are read and scored
+                rows = np.asarray(sorted(allowed_rows), dtype=np.int64)
+                scores = self._row_vectors(rows) @ query_vector if len(rows) else None
+            else:
+                rows = None
+                scores = self._all_scores(query_vector)
+                if self._deleted:
+                    scores[list(self._deleted)] = -np.inf
+
+            if scores is None or not len(self._row_of):
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+            top_k = min(query.similarity_top_k, len(scores), len(self._row_of))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            top_rows = rows[top] if rows is not None else top
+            return VectorStoreQueryResult(
+                nodes=None,
+                similarities=[float(scores[i]) for i in top],
+                ids=[self._ids[row] for row in top_rows],
+            )
+
+    def query_batch(
+        self, query_embeddings: Sequence[List[float]], similarity_top_k: int
+    ) -> List[VectorStoreQueryResult]:
+        """
+        Runs several unfiltered queries with one pass over the vectors: each
+        chunk of rows is scored against all queries in a single matrix
+        product instead of once per query.
+        """
+        queries = np.array(query_embeddings, dtype=np.float32).reshape(
+            len(query_embeddings), -1
+        )
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            if not len(self._row_of) or not len(queries):
+                return [
+                    VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+                    for _ in queries
+                ]
+            scores = self._all_scores(queries.T)
+            if self._deleted:
+                scores[list(self._deleted)] = -np.inf
+
+            top_k = min(similarity_top_k, len(scores), len(self._row_of))
+            top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+            results = []
+            for column in range(len(queries)):
+                column_scores = scores[:, column]
+                rows = top[:, column]
+                rows = rows[np.argsort(-column_scores[rows])]
+                results.append(
+                    VectorStoreQueryResult(
+                        nodes=None,
+                        similarities=[float(column_scores[r]) for r in rows],
+                        ids=[self._ids[r] for r in rows],
+                    )
+                )
+            return results
+
+    def _write_vectors(
+        self, matrix: np.ndarray, generation: Optional[int] = None, mode: str = "ab"
+    ):
+        if self.dtype == "int8":
+            quantized, scales = _quantize(matrix)
+            with open(self._array_path(VECTORS_FNAME, generation), mode) as f:
+                f.write(quantized.tobytes())
+            with open(self._array_path(SCALES_FNAME, generation), mode) as f:
+                f.write(scales.tobytes())
+        else:
+            with open(self._array_path(VECTORS_FNAME, generation), mode) as f:
+                f.write(matrix.astype(np.float32).tobytes())
+
+    def _truncate_to_count(self):
+        # Drop bytes an interrupted persist appended past the header count
+        row_bytes = self._dim * (1 if self.dtype == "int8" else 4)
+        sizes = {VECTORS_FNAME: self._count * row_bytes}
+        if self.dtype == "int8":
+            sizes[SCALES_FNAME] = self._count * 4
+        for fname, size in sizes.items():
+            path = self._array_path(fname)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _write_header(self):
+        tmp_path = self._path(HEADER_FNAME + ".tmp")
+        header = {
+            "dim": self._dim,
+            "dtype": self.dtype,
+            "count": self._count,
+            "generation": self._generation,
+        }
+        with open(tmp_path, "w") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self._path(HEADER_FNAME))
+
+    def persist(self, persist_path: str = None, fs: Any = None) -> None:
+        """Appends pending vectors to the array files and records deletions."""
+        with self._lock:
+            if not self._pending and not self._pending_deletes:
+                return
+
+            if self._pending:
+                self._truncate_to_count()
+                self._write_vectors(np.stack(self._pending))
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self._rows_table()}"
+                    " (row, node_id, ref_doc_id, metadata) VALUES (?, ?, ?, ?)",
+                    self._pending_rows,
+                )
+
+            self._conn.executemany(
+                f"UPDATE {self._rows_table()} SET deleted = 1 WHERE row = ?",
+                [(row,) for row in self._pending_deletes],
+            )
+            self._conn.commit()
+
+            # The header is written last: it is what makes the new rows visible
+            self._count = len(self._ids)
+            self._write_header()
+            self._pending = []
+            self._pending_rows = []
+            self._pending_deletes = set()
+            self._map_vectors()
+
+            if self._count and len(self._deleted) / self._count > COMPACT_DELETED_RATIO:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrites the array files without deleted rows, as the next generation.
+        Nothing of the live generation is touched until the header switches
+        to the new one.
+        """
+        with self._lock:
+            self.persist()
+            live = [row for row in range(self._count) if row not in self._deleted]
+            print(f"Compacting vector store: {self._count} -> {len(live)} rows")
+
+            metadata = dict(
+                self._conn.execute(
+                    f"SELECT row, metadata FROM {self._rows_table()}"
+                ).fetchall()
+            )
+            ids = [self._ids[row] for row in live]
+            rows = [
+                (new_row, node_id, self._ref_doc_of.get(node_id), metadata.get(old_row))
+                for new_row, (old_row, node_id) in enumerate(zip(live, ids))
+            ]
+
+            generation = self._generation + 1
+            if live:
+                matrix = self._row_vectors(np.asarray(live, dtype=np.int64))
+                self._write_vectors(matrix, generation, mode="wb")
+            table = self._rows_table(generation)
+            self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._create_rows_table(generation)
+            self._conn.executemany(
+                f"INSERT INTO {table} (row, node_id, ref_doc_id, metadata)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+            # The commit point: from here on the new generation is the live one
+            count = self._count
+            self._count, self._generation = len(ids), generation
+            try:
+                self._write_header()
+            except Exception:
+                self._count, self._generation = count, generation - 1
+                raise
+
+            self._ids = ids
+            self._row_of = {node_id: row for row, node_id in enumerate(ids)}
+            self._ref_doc_of = {node_id: ref for _, node_id, ref, _ in rows}
+            self._index_metadata(
+                (row, json.loads(metadata or "{}")) for row, _, _, metadata in rows
+            )
+            self._deleted = set()
+            self._map_vectors()
+            self._remove_stale_generations()
+
+
+def binary_storage_context(directory: str, dtype: str = "float32") -> StorageContext:
+    """Storage context backed by MmapVectorStore and a SQLite docstore/index store."""
+    os.makedirs(directory, exist_ok=True)
+    kvstore = SQLiteKVStore(os.path.join(directory, KV_STORE_FNAME))
+    return StorageContext.from_defaults(
+        docstore=KVDocumentStore(kvstore),
+        index_store=KVIndexStore(kvstore),
+        vector_store=MmapVectorStore(directory, dtype=dtype),
+    )
+
+
+def has_binary_store(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, HEADER_FNAME))
+
+
+def has_json_store(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, "docstore.json"))
+
+
+def migrate_json_store(
+    directory: str, index_id: str, embed_model, dtype: str = "float32"
+) -> VectorStoreIndex:
+    """
+    Converts an index persisted with the default JSON stores into the binary
+    format in the same directory. The JSON files are left in place.
+    """
+    print(f"Migrating JSON index in {directory} to the binary vector store...")
+    legacy_index = load_index_from_storage(
+        StorageContext.from_defaults(persist_dir=directory),
+        index_id=index_id,
+        embed_model=embed_model,
+    )
+    nodes = []
+    for node_id, node in legacy_index.docstore.docs.items():
+        node = node.model_copy()
+        node.embedding = legacy_index.vector_store.get(node_id)
+        nodes.append(node)
+
+    index = VectorStoreIndex(
+        nodes,
+        storage_context=binary_storage_context(directory, dtype=dtype),
+        embed_model=embed_model,
+    )
+    index.set_index_id(index_id)
+    index.storage_context.persist(directory)
+    print(f"Migrated {len(nodes)} nodes")
+    return index
@@ -0,0 +1,112 @@
+import hashlib
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tiktoken
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+# Metadata that only bloats the prompt: the markdown duplicates parsed_text
+# and image paths mean nothing to the model (images are attached separately)
+LLM_EXCLUDED_METADATA_KEYS = ("parsed_text_markdown", "image_path")
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt context from ranked nodes under a token budget.
+
+    Nodes are taken in retrieval order. A node is skipped when its text
+    repeats a kept node or its stored embedding is at least
+    `dedupe_threshold` similar to one, and assembly stops at the first node
+    that would exceed `token_budget`. Tokens are counted with tiktoken,
+    which approximates the Gemini tokenizer closely enough for budgeting.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        dedupe_threshold: float = 0.95,
+        encoding_name: str = "cl100k_base",
+        embeddings_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+        separator: str = "\n\n",
+    ):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.embeddings_fn = embeddings_fn
+        self.separator = separator
+        self._separator_tokens = len(self.encoding.encode(separator))
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def render(self, node: NodeWithScore) -> str:
+        """Returns the LLM view of a node, without the excluded metadata."""
+        excluded = set(node.node.excluded_llm_metadata_keys)
+        node.node.excluded_llm_metadata_keys = sorted(
+            excluded.union(LLM_EXCLUDED_METADATA_KEYS)
+        )
+        return node.node.get_content(metadata_mode=MetadataMode.LLM)
+
+    def _embeddings(self, nodes: Sequence[NodeWithScore]) -> Optional[np.ndarray]:
+        if self.embeddings_fn is None or not nodes:
+            return None
+        try:
+            return np.asarray(
+                self.embeddings_fn([n.node.node_id for n in nodes]), dtype=np.float32
+            )
+        except (KeyError, ValueError) as e:
+            print(f"Skipping embedding deduplication: {e}")
+            return None
+
+    def build(
+        self, nodes: Sequence[NodeWithScore]
+    ) -> Tuple[str, List[NodeWithScore], dict]:
+        """
+        Returns (context_str, kept_nodes, stats) for nodes in ranked order.
+        """
+        embeddings = self._embeddings(nodes)
+        if embeddings is not None:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        chunks, kept, kept_rows, seen_texts = [], [], [], set()
+        tokens = 0
+        duplicates = 0
+        over_budget = 0
+        for row, node in enumerate(nodes):
+            text = self.render(node)
+            digest = hashlib.sha256(text.encode()).digest()
+            if digest in seen_texts:
+                duplicates += 1
+                continue
+            if embeddings is not None and kept_rows:
+                similarity = embeddings[kept_rows] @ embeddings[row]
+                if similarity.max() >= self.dedupe_threshold:
+                    duplicates += 1
+                    continue
+
+            cost = self.count_tokens(text) + (self._separator_tokens if kept else 0)
+            if tokens + cost > self.token_budget:
+                if not kept:
+                    # Always keep the best node, cut down to the budget
+                    text = self.encoding.decode(
+                        self.encoding.encode(text)[: self.token_budget]
+                    )
+                    cost = self.token_budget
+                else:
+                    over_budget = len(nodes) - row
+                    break
+
+            seen_texts.add(digest)
+            chunks.append(text)
+            kept.append(node)
+            kept_rows.append(row)
+            tokens += cost
+
+        stats = {
+            "context_tokens": tokens,
+            "context_nodes": len(kept),
+            "duplicates_dropped": duplicates,
+            "over_budget_dropped": over_budget,
+        }
+        return self.separator.join(chunks), kept, stats
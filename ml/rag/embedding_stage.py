@@ -0,0 +1,86 @@
+import os
+import time
+from typing import List, Optional
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from rag.model_registry import EMBED_BATCH_SIZE
+
+# Torch intra-op threads used while embedding; unset keeps the torch default.
+# Note that torch applies this process-wide.
+EMBED_THREADS = os.environ.get("RAG_EMBED_THREADS")
+
+
+class EmbeddingStage:
+    """
+    Embeds ingestion nodes in large batches that may span several files.
+
+    Nodes are queued with `add()`; every full batch is embedded right away
+    and the remainder is embedded by `flush()`. Embedded nodes carry their
+    `embedding`, so inserting them into the index doesn't embed them again.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        batch_size: int = EMBED_BATCH_SIZE,
+        num_threads: Optional[int] = None,
+    ):
+        self.embed_model = embed_model
+        self.batch_size = max(1, batch_size)
+        self._queue: List[BaseNode] = []
+
+        num_threads = num_threads or (int(EMBED_THREADS) if EMBED_THREADS else None)
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+
+        self.nodes = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def add(self, nodes: List[BaseNode]):
+        """Queues nodes and embeds every full batch."""
+        self._queue.extend(n for n in nodes if n.embedding is None)
+        while len(self._queue) >= self.batch_size:
+            batch = self._queue[: self.batch_size]
+            self._queue = self._queue[self.batch_size :]
+            self._embed_batch(batch)
+
+    def flush(self):
+        """Embeds whatever is still queued."""
+        if self._queue:
+            batch, self._queue = self._queue, []
+            self._embed_batch(batch)
+
+    def clear(self):
+        """Drops queued nodes without embedding them."""
+        self._queue = []
+
+    def _embed_batch(self, batch: List[BaseNode]):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+
+        start = time.perf_counter()
+        embeddings = self.embed_model.get_text_embedding_batch(texts)
+        elapsed = time.perf_counter() - start
+
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+        self.nodes += len(batch)
+        self.batches += 1
+        self.seconds += elapsed
+        print(
+            f"[embed] batch {self.batches}: {len(batch)} nodes in {elapsed:.2f}s "
+            f"({len(batch) / elapsed if elapsed else 0:.1f} nodes/s)"
+        )
+
+    def summary(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "nodes_per_second": self.nodes / self.seconds if self.seconds else 0.0,
+            "seconds_per_batch": self.seconds / self.batches if self.batches else 0.0,
+        }
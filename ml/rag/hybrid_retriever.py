@@ -0,0 +1,335 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilters, VectorStoreQuery
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Metadata holding a page's text; node text itself is empty
+SEARCH_TEXT_KEYS = ("parsed_text", "parsed_text_markdown")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def node_search_text(node: BaseNode) -> str:
+    """Returns the text a node is keyword-searched and reranked on."""
+    parts = [node.metadata.get(k) for k in SEARCH_TEXT_KEYS]
+    text = "\n".join(p for p in parts if p)
+    return text or node.get_content()
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 keyword index over node ids.
+
+    Built from the nodes at ingest and kept in step with the vector index
+    through `add()` and `remove()`. `save()` writes the per-node term
+    counts next to the index so loading it doesn't read and re-tokenize
+    every node of the docstore.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[BaseNode], **kwargs) -> "BM25Index":
+        bm25 = cls(**kwargs)
+        bm25.add(nodes)
+        return bm25
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Loads an index written by `save()`."""
+        with open(path, "r") as f:
+            data = json.load(f)
+        bm25 = cls(k1=data["k1"], b=data["b"])
+        for node_id, terms in data["doc_terms"].items():
+            terms = Counter(terms)
+            bm25._doc_terms[node_id] = terms
+            bm25._doc_len[node_id] = sum(terms.values())
+            bm25._total_len += bm25._doc_len[node_id]
+            for term, tf in terms.items():
+                bm25._postings.setdefault(term, {})[node_id] = tf
+        return bm25
+
+    def save(self, path: str):
+        with self._lock:
+            data = {"k1": self.k1, "b": self.b, "doc_terms": self._doc_terms}
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def memory_bytes(self) -> int:
+        """Approximate size: one posting and one term count per (term, doc)."""
+        with self._lock:
+            entries = sum(len(terms) for terms in self._doc_terms.values())
+            # dict entry, int and string references in both structures
+            return entries * 2 * 100 + len(self._postings) * 120
+
+    def add(self, nodes: Iterable[BaseNode]):
+        with self._lock:
+            for node in nodes:
+                self._remove(node.node_id)
+                terms = Counter(tokenize(node_search_text(node)))
+                self._doc_terms[node.node_id] = terms
+                self._doc_len[node.node_id] = sum(terms.values())
+                self._total_len += self._doc_len[node.node_id]
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[node.node_id] = tf
+
+    def remove(self, node_ids: Iterable[str]):
+        with self._lock:
+            for node_id in node_ids:
+                self._remove(node_id)
+
+    def _remove(self, node_id: str):
+        terms = self._doc_terms.pop(node_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(node_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[node_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(
+        self, query: str, top_k: int, allowed_ids: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to top_k (node_id, score) pairs, best first, only among
+        `allowed_ids` when given.
+        """
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for node_id, tf in postings.items():
+                    if allowed_ids is not None and node_id not in allowed_ids:
+                        continue
+                    norm = self.k1 * (
+                        1 - self.b + self.b * self._doc_len[node_id] / avg_len
+                    )
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (
+                        self.k1 + 1
+                    ) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses vector and BM25 results, then reranks them with a local
+    cross-encoder.
+
+    Both retrievers contribute `candidate_k` results, merged with reciprocal
+    rank fusion. The reranker scores every candidate against the query and
+    only candidates scoring at least `cutoff` are kept (at most `max_k`, at
+    least `min_k`), so the number of chunks put into the prompt adapts to
+    how many are actually relevant.
+
+    With `filters`, both retrievers only consider matching nodes: the vector
+    store applies the filters before scoring and BM25 is restricted to the
+    node ids the filters resolve to.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        bm25: BM25Index,
+        docstore,
+        reranker=None,
+        vector_store=None,
+        candidate_k: int = 12,
+        cutoff: float = 0.3,
+        max_k: int = 6,
+        min_k: int = 1,
+        rrf_k: int = 60,
+        filters: Optional[MetadataFilters] = None,
+    ):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25 = bm25
+        self.docstore = docstore
+        self.reranker = reranker
+        self.vector_store = vector_store
+        self.candidate_k = candidate_k
+        self.cutoff = cutoff
+        self.max_k = max_k
+        self.min_k = min_k
+        self.rrf_k = rrf_k
+        self.filters = filters
+        self.allowed_ids = (
+            set(vector_store.node_ids(filters)) if filters is not None else None
+        )
+
+    def _rrf(self, vector_ids: List[str], keyword_ids: List[str]) -> Dict[str, float]:
+        fused: Dict[str, float] = {}
+        for ranked in (vector_ids, keyword_ids):
+            for rank, node_id in enumerate(ranked):
+                fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        return fused
+
+    def _load_nodes(self, node_ids: Iterable[str], nodes: Dict[str, BaseNode]):
+        """Adds the docstore nodes of ids missing from `nodes`."""
+        missing = [node_id for node_id in node_ids if node_id not in nodes]
+        if missing:
+            for node in self.docstore.get_nodes(missing, raise_error=False):
+                if node is not None:
+                    nodes[node.node_id] = node
+
+    @staticmethod
+    def _ranked(fused: Dict[str, float], nodes: Dict[str, BaseNode]):
+        return sorted(
+            (
+                NodeWithScore(node=nodes[node_id], score=score)
+                for node_id, score in fused.items()
+                if node_id in nodes
+            ),
+            key=lambda n: n.score,
+            reverse=True,
+        )
+
+    def _fuse(self, query_str: str) -> List[NodeWithScore]:
+        vector_results = self.vector_retriever.retrieve(query_str)
+        keyword_results = self.bm25.search(
+            query_str, self.candidate_k, self.allowed_ids
+        )
+
+        nodes: Dict[str, BaseNode] = {r.node.node_id: r.node for r in vector_results}
+        fused = self._rrf(
+            [r.node.node_id for r in vector_results],
+            [node_id for node_id, _ in keyword_results],
+        )
+        # Keyword-only hits aren't loaded yet
+        self._load_nodes(fused, nodes)
+        return self._ranked(fused, nodes)
+
+    def _select(self, reranked: List[NodeWithScore]) -> List[NodeWithScore]:
+        reranked = sorted(reranked, key=lambda n: n.score, reverse=True)
+        kept = [n for n in reranked[: self.max_k] if n.score >= self.cutoff]
+        return kept if len(kept) >= self.min_k else reranked[: self.min_k]
+
+    def _rerank_batch(
+        self, query_strs: List[str], candidate_lists: List[List[NodeWithScore]]
+    ) -> List[List[NodeWithScore]]:
+        """Reranks the candidates of several queries with one predict call."""
+        if self.reranker is None:
+            return [candidates[: self.max_k] for candidates in candidate_lists]
+
+        pairs = [
+            (query_str, node_search_text(n.node))
+            for query_str, candidates in zip(query_strs, candidate_lists)
+            for n in candidates
+        ]
+        # The reranker applies a sigmoid (see get_reranker): scores are in [0, 1]
+        scores = iter(self.reranker.predict(pairs) if pairs else [])
+        return [
+            self._select(
+                [
+                    NodeWithScore(node=n.node, score=float(next(scores)))
+                    for n in candidates
+                ]
+            )
+            for candidates in candidate_lists
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        query_str = query_bundle.query_str
+        return self._rerank_batch([query_str], [self._fuse(query_str)])[0]
+
+    def retrieve_batch(
+        self, query_strs: List[str], query_embeddings: List[List[float]]
+    ) -> List[List[NodeWithScore]]:
+        """
+        Retrieves for many queries at once: the vector search scores all
+        queries in one matrix operation (when the vector store supports
+        `query_batch`), nodes are loaded with one docstore read and all
+        candidates are reranked in one call.
+        """
+        if hasattr(self.vector_store, "query_batch") and self.filters is None:
+            vector_results = self.vector_store.query_batch(
+                query_embeddings, self.candidate_k
+            )
+        else:
+            vector_results = [
+                self.vector_store.query(
+                    VectorStoreQuery(
+                        query_embedding=list(embedding),
+                        similarity_top_k=self.candidate_k,
+                        filters=self.filters,
+                    )
+                )
+                for embedding in query_embeddings
+            ]
+
+        fused_lists = []
+        for query_str, result in zip(query_strs, vector_results):
+            keyword_results = self.bm25.search(
+                query_str, self.candidate_k, self.allowed_ids
+            )
+            fused_lists.append(
+                self._rrf(
+                    list(result.ids or []),
+                    [node_id for node_id, _ in keyword_results],
+                )
+            )
+        nodes: Dict[str, BaseNode] = {}
+        self._load_nodes({n for fused in fused_lists for n in fused}, nodes)
+        return self._rerank_batch(
+            query_strs, [self._ranked(fused, nodes) for fused in fused_lists]
+        )
+
+
+def build_hybrid_retriever(
+    index,
+    bm25: BM25Index,
+    reranker=None,
+    filters: Optional[MetadataFilters] = None,
+    **kwargs,
+) -> HybridRetriever:
+    """
+    Builds a HybridRetriever over a VectorStoreIndex and its BM25 index,
+    optionally scoped to the nodes matching `filters`.
+    """
+    candidate_k = kwargs.get("candidate_k", 12)
+    return HybridRetriever(
+        vector_retriever=index.as_retriever(
+            similarity_top_k=candidate_k, filters=filters
+        ),
+        bm25=bm25,
+        docstore=index.docstore,
+        reranker=reranker,
+        vector_store=index.vector_store,
+        filters=filters,
+        **kwargs,
+    )
@@ -0,0 +1,114 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+
+class ThumbnailCache:
+    """
+    Downscaled page images for multimodal prompts.
+
+    Ingestion writes one JPEG variant per page image (longest side capped at
+    `max_side`) next to the original, under `thumbs_{max_side}/`. Queries
+    read those variants through an in-memory LRU of encoded bytes, bounded
+    by `max_bytes`, so hot pages are neither re-read from disk nor resized
+    per request.
+    """
+
+    def __init__(
+        self,
+        max_side: int = 1024,
+        quality: int = 80,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.max_side = max_side
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def variant_path(self, image_path: str) -> str:
+        directory, name = os.path.split(image_path)
+        stem, _ = os.path.splitext(name)
+        return os.path.join(directory, f"thumbs_{self.max_side}", f"{stem}.jpg")
+
+    def ensure_variant(self, image_path: str) -> str:
+        """Writes the downscaled variant if it's missing and returns its path."""
+        variant = self.variant_path(image_path)
+        if os.path.exists(variant):
+            return variant
+
+        os.makedirs(os.path.dirname(variant), exist_ok=True)
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+            image.thumbnail((self.max_side, self.max_side))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+
+        # Written under a temporary name so readers never see a partial file
+        tmp_path = f"{variant}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, variant)
+        return variant
+
+    def get(self, image_path: str) -> Optional[bytes]:
+        """
+        Returns the encoded downscaled variant of an image, or None if the
+        original is gone and no variant exists.
+        """
+        with self._lock:
+            data = self._entries.get(image_path)
+            if data is not None:
+                self._entries.move_to_end(image_path)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        try:
+            variant = self.ensure_variant(image_path)
+            with open(variant, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Skipping unreadable page image {image_path}: {e}")
+            return None
+
+        if len(data) > self.max_bytes:
+            return data
+
+        with self._lock:
+            previous = self._entries.pop(image_path, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[image_path] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "max_side": self.max_side,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+
+class IndexShardManager:
+    """
+    Keeps per-tenant index shards in memory within a byte budget.
+
+    A shard is loaded with `load_fn(shard_id)` on first use and its size
+    estimated with `size_fn(shard)`. Shards are kept in least recently used
+    order; when the resident total exceeds `memory_budget_bytes` the coldest
+    shards are dropped (the most recently used one always stays, even if it
+    alone exceeds the budget). Dropping only releases the manager's
+    reference, so queries still running on an evicted shard finish on it.
+    Concurrent first uses of a shard share a single load.
+    """
+
+    def __init__(
+        self,
+        load_fn: Callable[[str], Any],
+        size_fn: Callable[[Any], int],
+        memory_budget_bytes: int,
+    ):
+        self.load_fn = load_fn
+        self.size_fn = size_fn
+        self.memory_budget_bytes = memory_budget_bytes
+        self._shards: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # Per shard, kept after eviction: loads, load times, hits, residency
+        self._history: Dict[str, dict] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _record(self, shard_id: str) -> dict:
+        return self._history.setdefault(
+            shard_id,
+            {
+                "loads": 0,
+                "hits": 0,
+                "evictions": 0,
+                "last_load_seconds": None,
+                "total_load_seconds": 0.0,
+                "loaded_at": None,
+                "last_used_at": None,
+            },
+        )
+
+    def get(self, shard_id: str):
+        """Returns the shard, loading it (and evicting cold shards) if needed."""
+        with self._lock:
+            shard = self._shards.get(shard_id)
+            if shard is not None:
+                self._shards.move_to_end(shard_id)
+                record = self._record(shard_id)
+                record["hits"] += 1
+                record["last_used_at"] = time.time()
+                return shard
+            load_lock = self._load_locks.setdefault(shard_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                # Loaded by a concurrent caller while we waited
+                shard = self._shards.get(shard_id)
+                if shard is not None:
+                    self._shards.move_to_end(shard_id)
+                    self._record(shard_id)["hits"] += 1
+                    return shard
+
+            try:
+                shard = self._load(shard_id)
+            finally:
+                with self._lock:
+                    # Callers already waiting hold the lock object and find
+                    # the shard loaded; it's only needed while loading
+                    if self._load_locks.get(shard_id) is load_lock:
+                        del self._load_locks[shard_id]
+        return shard
+
+    def _load(self, shard_id: str):
+        print(f"Loading index shard {shard_id}...")
+        start = time.perf_counter()
+        shard = self.load_fn(shard_id)
+        load_seconds = time.perf_counter() - start
+        size = self.size_fn(shard)
+        print(
+            f"Loaded index shard {shard_id} in {load_seconds:.2f}s "
+            f"({size / 1024 / 1024:.1f} MB)"
+        )
+
+        with self._lock:
+            self._shards[shard_id] = shard
+            self._sizes[shard_id] = size
+            record = self._record(shard_id)
+            record["loads"] += 1
+            record["last_load_seconds"] = round(load_seconds, 3)
+            record["total_load_seconds"] = round(
+                record["total_load_seconds"] + load_seconds, 3
+            )
+            record["loaded_at"] = record["last_used_at"] = time.time()
+            self._evict()
+        return shard
+
+    def peek(self, shard_id: str):
+        """Returns the shard if it is resident, without loading or touching it."""
+        with self._lock:
+            return self._shards.get(shard_id)
+
+    def resize(self, shard_id: str):
+        """Re-estimates a resident shard's size (e.g. after an ingest)."""
+        with self._lock:
+            shard = self._shards.get(shard_id)
+        if shard is None:
+            return
+        size = self.size_fn(shard)
+        with self._lock:
+            if shard_id in self._shards:
+                self._sizes[shard_id] = size
+                self._evict()
+
+    def evict(self, shard_id: str) -> bool:
+        with self._lock:
+            return self._drop(shard_id)
+
+    def _drop(self, shard_id: str) -> bool:
+        if self._shards.pop(shard_id, None) is None:
+            return False
+        size = self._sizes.pop(shard_id, 0)
+        self._record(shard_id)["evictions"] += 1
+        self.evictions += 1
+        print(f"Unloaded index shard {shard_id} ({size / 1024 / 1024:.1f} MB)")
+        return True
+
+    def _evict(self):
+        while (
+            len(self._shards) > 1
+            and sum(self._sizes.values()) > self.memory_budget_bytes
+        ):
+            self._drop(next(iter(self._shards)))
+
+    @staticmethod
+    def _timestamp(seconds: Optional[float]) -> Optional[str]:
+        if seconds is None:
+            return None
+        return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+    def stats(self) -> dict:
+        with self._lock:
+            shards = {}
+            for shard_id, record in self._history.items():
+                shards[shard_id] = {
+                    **record,
+                    "resident": shard_id in self._shards,
+                    "size_bytes": self._sizes.get(shard_id),
+                    "loaded_at": self._timestamp(record["loaded_at"]),
+                    "last_used_at": self._timestamp(record["last_used_at"]),
+                }
+            return {
+                "resident": list(self._shards),
+                "resident_bytes": sum(self._sizes.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+                "shards": shards,
+            }
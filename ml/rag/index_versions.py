@@ -0,0 +1,91 @@
+import os
+import re
+import shutil
+from typing import List, Optional
+
+CURRENT_FNAME = "CURRENT"
+VERSIONS_DIRNAME = "versions"
+VERSION_PATTERN = re.compile(r"^v(\d+)$")
+
+
+class IndexVersions:
+    """
+    Immutable index versions under `{storage_dir}/versions/v{N}`.
+
+    A new version is built in its own directory, starting from a copy of
+    the version it updates, while the current one keeps serving. Publishing
+    atomically replaces the CURRENT file naming the live version, so a crash
+    at any point leaves either the old or the new version live. Older
+    version directories stay on disk for rollback until pruned.
+    """
+
+    def __init__(self, storage_dir: str):
+        self.storage_dir = storage_dir
+        self.versions_dir = os.path.join(storage_dir, VERSIONS_DIRNAME)
+        self.current_path = os.path.join(storage_dir, CURRENT_FNAME)
+
+    def path(self, version: int) -> str:
+        return os.path.join(self.versions_dir, f"v{version}")
+
+    def current(self) -> Optional[int]:
+        """Returns the published version, or None before the first publish."""
+        if not os.path.exists(self.current_path):
+            return None
+        with open(self.current_path, "r") as f:
+            match = VERSION_PATTERN.match(f.read().strip())
+        return int(match.group(1)) if match else None
+
+    def list(self) -> List[int]:
+        """Returns the versions present on disk, oldest first."""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        versions = []
+        for name in os.listdir(self.versions_dir):
+            match = VERSION_PATTERN.match(name)
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def create(self, version: int, base_dir: Optional[str] = None) -> str:
+        """
+        Creates the directory of a new version, as a copy of base_dir when
+        given. Leftovers of an earlier build that never got published are
+        replaced.
+        """
+        directory = self.path(version)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        if base_dir is None:
+            os.makedirs(directory)
+        else:
+            # base_dir may be the legacy unversioned storage_dir
+            shutil.copytree(
+                base_dir,
+                directory,
+                ignore=shutil.ignore_patterns(
+                    VERSIONS_DIRNAME, CURRENT_FNAME, "*.tmp", "*.compact"
+                ),
+            )
+        return directory
+
+    def publish(self, version: int):
+        """Makes `version` the live one."""
+        tmp_path = f"{self.current_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"v{version}")
+        os.replace(tmp_path, self.current_path)
+
+    def discard(self, version: int):
+        shutil.rmtree(self.path(version), ignore_errors=True)
+
+    def prune(self, keep: int):
+        """
+        Deletes all but the newest `keep` versions, never the live one.
+        Queries still reading a deleted version are unaffected: open and
+        memory-mapped files stay readable until closed.
+        """
+        current = self.current()
+        old = [v for v in self.list() if v != current]
+        for version in old[: max(0, len(old) - max(0, keep - 1))]:
+            print(f"Pruning index version {version}")
+            self.discard(version)
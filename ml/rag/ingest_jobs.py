@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, Optional, Tuple
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class IngestJob:
+    """
+    State of one ingestion run: overall status plus, per file, the latest
+    status, the details reported with it and when each status was reached
+    (seconds since the job started).
+    """
+
+    def __init__(self, key: Hashable):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.summary = None
+        self.files = {}
+        self._start = None
+        self._lock = threading.Lock()
+
+    def report(self, file_path: str, status: str, details: dict):
+        """Progress callback handed to `RAGPipeline.ingest_data`."""
+        with self._lock:
+            elapsed = time.perf_counter() - self._start if self._start else 0.0
+            entry = self.files.setdefault(
+                file_path, {"status": None, "details": {}, "timings": {}}
+            )
+            entry["status"] = status
+            entry["details"].update(details)
+            entry["timings"][status] = round(elapsed, 3)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counts = {}
+            for entry in self.files.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration_seconds": (
+                    round(time.perf_counter() - self._start, 3)
+                    if self._start and self.status == "running"
+                    else (self.summary or {}).get("duration_seconds")
+                ),
+                "file_counts": counts,
+                "files": {
+                    path: {
+                        "status": entry["status"],
+                        "details": dict(entry["details"]),
+                        "timings": dict(entry["timings"]),
+                    }
+                    for path, entry in self.files.items()
+                },
+                "summary": self.summary,
+                "error": self.error,
+            }
+
+
+class IngestJobQueue:
+    """
+    Runs ingestion jobs one at a time on a single background thread.
+
+    Ingestion mutates the index and its files in place, so jobs never run
+    concurrently. A request identical (same key) to a job that is still
+    queued gets that job back instead of a new one; a request identical to
+    the running job queues one follow-up, since files may have changed
+    after the running job hashed them.
+    """
+
+    def __init__(
+        self,
+        run_fn: Callable[[Hashable, Callable[[str, str, dict], None]], dict],
+        max_jobs: int = 100,
+    ):
+        self.run_fn = run_fn
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._queued = {}  # key -> queued job
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, key: Hashable) -> Tuple[IngestJob, bool]:
+        """Returns (job, created); created is False for a deduplicated request."""
+        with self._lock:
+            job = self._queued.get(key)
+            if job is not None:
+                return job, False
+
+            job = IngestJob(key)
+            self._queued[key] = job
+            self._jobs[job.id] = job
+            self._evict_finished()
+            self._queue.put(job)
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="ingest-worker", daemon=True
+                )
+                self._worker.start()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_finished(self):
+        # Keep the history bounded; only finished jobs are dropped
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        for job_id in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if self._queued.get(job.key) is job:
+                    del self._queued[job.key]
+                job.status = "running"
+                job.started_at = _now()
+                job._start = time.perf_counter()
+
+            print(f"[ingest] job {job.id} started")
+            try:
+                summary = dict(self.run_fn(job.key, job.report) or {})
+                status, error = "completed", None
+            except Exception as e:
+                print(f"[ingest] job {job.id} failed: {e}")
+                summary, status, error = {}, "failed", str(e)
+
+            summary["duration_seconds"] = round(time.perf_counter() - job._start, 3)
+            with self._lock:
+                job.summary = summary
+                job.error = error
+                job.finished_at = _now()
+                job.status = status
+            print(f"[ingest] job {job.id} {status} in {summary['duration_seconds']}s")
+            self._queue.task_done()
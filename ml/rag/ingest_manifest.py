@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    Records, for every ingested file, the hash of the content that was
+    indexed, the ids of the nodes it produced and the page images it
+    produced.
+
+    Stored as JSON:
+    {file_path: {"sha256", "node_ids", "images": {page: [paths]}, "ingested_at"}}.
+    """
+
+    def __init__(self, path: str, files: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> "IngestManifest":
+        with open(path, "r") as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    def from_nodes(cls, path: str, nodes: Iterable) -> "IngestManifest":
+        """
+        Builds a manifest for an index ingested before manifests existed,
+        grouping node ids by their "file_name" metadata. Files that still
+        exist are hashed as they are on disk now; missing files get no hash
+        so the next diff reports them as removed.
+        """
+        files = {}
+        for node in nodes:
+            file_path = node.metadata.get("file_name")
+            if file_path is None:
+                continue
+            entry = files.setdefault(
+                file_path,
+                {
+                    "sha256": (
+                        file_sha256(file_path) if os.path.exists(file_path) else None
+                    ),
+                    "node_ids": [],
+                    "ingested_at": None,
+                },
+            )
+            entry["node_ids"].append(node.node_id)
+        return cls(path, files)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.files, f)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, file_hashes: Dict[str, str]):
+        """
+        Compares the manifest to the files currently on disk.
+
+        Args:
+            file_hashes (dict): file_path -> sha256 of the files on disk.
+
+        Returns:
+            tuple: (added, changed, removed, unchanged) lists of file paths.
+        """
+        added, changed, unchanged = [], [], []
+        for file_path, sha256 in file_hashes.items():
+            entry = self.files.get(file_path)
+            if entry is None:
+                added.append(file_path)
+            elif entry["sha256"] != sha256:
+                changed.append(file_path)
+            else:
+                unchanged.append(file_path)
+        removed = [f for f in self.files if f not in file_hashes]
+        return added, changed, removed, unchanged
+
+    def node_ids(self, file_path: str) -> List[str]:
+        entry = self.files.get(file_path)
+        return list(entry["node_ids"]) if entry else []
+
+    def record(
+        self,
+        file_path: str,
+        sha256: str,
+        node_ids: List[str],
+        images: Optional[Dict[int, List[str]]] = None,
+    ):
+        self.files[file_path] = {
+            "sha256": sha256,
+            "node_ids": list(node_ids),
+            "images": {str(page): paths for page, paths in (images or {}).items()},
+            "ingested_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def remove(self, file_path: str) -> List[str]:
+        """Drops a file from the manifest and returns its node ids."""
+        entry = self.files.pop(file_path, None)
+        return entry["node_ids"] if entry else []
@@ -0,0 +1,131 @@
+import inspect
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List
+
+from llama_index.core import Settings
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import (
+    get_query_instruct_for_model_name,
+    get_text_instruct_for_model_name,
+)
+from llama_index.llms.google_genai import GoogleGenAI
+
+# Default models shared by every caller in the process
+EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+LLM_MODEL_NAME = "models/gemini-2.0-flash"
+# Local cross-encoder reranking hybrid retrieval candidates
+RERANK_MODEL_NAME = os.environ.get(
+    "RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+
+# Texts per embedding forward pass; large batches matter for bulk ingestion
+EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", 128))
+
+_MODELS: Dict[Hashable, Any] = {}
+_LOCK = threading.Lock()
+
+
+def get_or_load(key: Hashable, loader: Callable[[], Any]):
+    """
+    Returns the model registered under `key`, loading it on first use.
+
+    Loading happens under a process-wide lock so concurrent first callers
+    share a single instance instead of each building their own copy.
+
+    Args:
+        key (Hashable): Registry key identifying the model and its settings.
+        loader (Callable): Zero-argument function that builds the model.
+
+    Returns:
+        The shared model instance.
+    """
+    model = _MODELS.get(key)
+    if model is None:
+        with _LOCK:
+            model = _MODELS.get(key)
+            if model is None:
+                print(f"Loading model {key}...")
+                model = loader()
+                _MODELS[key] = model
+    return model
+
+
+def get_embed_model(model_name: str = EMBED_MODEL_NAME) -> HuggingFaceEmbedding:
+    """Returns the shared HuggingFace embedding model."""
+    return get_or_load(
+        ("embedding", model_name),
+        lambda: HuggingFaceEmbedding(
+            model_name=model_name, embed_batch_size=EMBED_BATCH_SIZE
+        ),
+    )
+
+
+def embed_queries(embed_model, queries: List[str]) -> List[List[float]]:
+    """
+    Embeds several queries with one batched forward pass.
+
+    llama_index only batches texts, so when a HuggingFace model adds no
+    instruction to texts (as with the BGE default) the queries are embedded
+    as texts prefixed with the query instruction, which gives the vectors of
+    `get_query_embedding`. Other models embed one query at a time.
+    """
+    if isinstance(embed_model, HuggingFaceEmbedding):
+        name = embed_model.model_name
+        text_instruction = (
+            embed_model.text_instruction or get_text_instruct_for_model_name(name)
+        )
+        if not text_instruction:
+            query_instruction = (
+                embed_model.query_instruction or get_query_instruct_for_model_name(name)
+            )
+            return embed_model.get_text_embedding_batch(
+                [f"{query_instruction}{query}" for query in queries]
+            )
+    return [embed_model.get_query_embedding(query) for query in queries]
+
+
+def get_llm(model_name: str = LLM_MODEL_NAME) -> GoogleGenAI:
+    """Returns the shared Gemini client (used for both text and multimodal calls)."""
+    return get_or_load(("llm", model_name), lambda: GoogleGenAI(model_name=model_name))
+
+
+def get_reranker(model_name: str = RERANK_MODEL_NAME):
+    """
+    Returns the shared cross-encoder reranker, with an explicit sigmoid
+    activation so its scores are relevance probabilities in [0, 1]. The
+    default for single-label models is raw logits in current
+    sentence-transformers releases and was a sigmoid in older ones.
+    """
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    def load():
+        params = inspect.signature(CrossEncoder.__init__).parameters
+        # Called default_activation_function before sentence-transformers 4
+        name = (
+            "activation_fn"
+            if "activation_fn" in params
+            else "default_activation_function"
+        )
+        return CrossEncoder(model_name, **{name: torch.nn.Sigmoid()})
+
+    return get_or_load(("reranker", model_name), load)
+
+
+def loaded_models():
+    """Returns the keys of every model currently held by the registry."""
+    return list(_MODELS.keys())
+
+
+def warm_up():
+    """
+    Loads the default models and installs them as llama_index defaults.
+
+    Call this once at process start so the first request doesn't pay for
+    loading the embedding weights and tokenizer.
+    """
+    Settings.embed_model = get_embed_model()
+    Settings.llm = get_llm()
+    get_reranker()
+    print(f"Model registry warmed up: {loaded_models()}")
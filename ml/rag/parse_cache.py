@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from typing import Optional
+
+from llama_index.core import Document
+
+
+class ParseCache:
+    """
+    On-disk cache of LlamaParse results keyed by PDF content hash and
+    parser settings.
+
+    Each entry is a directory holding the text-pass documents, the markdown
+    page JSON and the downloaded image manifest, so rebuilding an index only
+    re-runs local work and works offline from a warm cache.
+    """
+
+    def __init__(self, directory: str, settings: dict):
+        self.directory = directory
+        self.settings = settings
+        self.settings_key = hashlib.sha256(
+            json.dumps(settings, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_dir(self, file_hash: str) -> str:
+        return os.path.join(self.directory, f"{file_hash}-{self.settings_key}")
+
+    def get(self, file_hash: str) -> Optional[tuple]:
+        """
+        Returns (docs_text, md_json_list, image_dicts) for the hash, or None
+        if it isn't cached or its downloaded images have gone missing.
+        """
+        entry_dir = self._entry_dir(file_hash)
+        if not os.path.isdir(entry_dir):
+            return None
+        try:
+            with open(os.path.join(entry_dir, "docs_text.json"), "r") as f:
+                docs_text = [Document.from_dict(d) for d in json.load(f)]
+            with open(os.path.join(entry_dir, "pages.json"), "r") as f:
+                md_json_list = json.load(f)
+            with open(os.path.join(entry_dir, "images.json"), "r") as f:
+                image_dicts = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable parse cache entry {entry_dir}: {e}")
+            return None
+
+        for image in image_dicts:
+            if image.get("path") and not os.path.exists(image["path"]):
+                return None
+        return docs_text, md_json_list, image_dicts
+
+    def set(self, file_hash: str, docs_text, md_json_list, image_dicts):
+        entry_dir = self._entry_dir(file_hash)
+        # Write to a temporary directory first so readers never see a
+        # partially written entry
+        tmp_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_dir)
+        try:
+            with open(os.path.join(tmp_dir, "docs_text.json"), "w") as f:
+                json.dump([doc.to_dict() for doc in docs_text], f)
+            with open(os.path.join(tmp_dir, "pages.json"), "w") as f:
+                json.dump(md_json_list, f, default=str)
+            with open(os.path.join(tmp_dir, "images.json"), "w") as f:
+                json.dump(image_dicts, f, default=str)
+
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(tmp_dir, entry_dir)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
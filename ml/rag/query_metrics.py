@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+# Upper bounds (ms) of the latency histogram buckets
+DEFAULT_BUCKETS_MS = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000
+)
+
+
+@contextmanager
+def stage_timer(timings: dict, name: str):
+    """
+    Adds the wall time of the block, in ms, to timings[name]. Repeated
+    stages (e.g. output scans of several chunks) accumulate.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        timings[name] = round(timings.get(name, 0.0) + ms, 3)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label value."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        # label -> (bucket counts, sum, count)
+        self._series: Dict[str, Tuple[list, float, int]] = {}
+
+    def observe(self, label: str, value: float):
+        counts, total, count = self._series.get(
+            label, ([0] * len(self.buckets), 0.0, 0)
+        )
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self._series[label] = (counts, total + value, count + 1)
+
+    def snapshot(self) -> dict:
+        return {
+            label: {
+                "buckets": dict(zip(self.buckets, counts)),
+                "sum": round(total, 3),
+                "count": count,
+            }
+            for label, (counts, total, count) in self._series.items()
+        }
+
+
+class QueryMetrics:
+    """
+    Process-wide query metrics: a latency histogram per query stage, a
+    latency histogram of whole queries split by cache outcome, and cache
+    lookup counters. `render()` exports them in the Prometheus text format.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.stages = Histogram(buckets)
+        self.queries = Histogram(buckets)
+        self.cache_lookups: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe_stages(self, timings: dict):
+        """Records the per-stage timings of one query (metadata["timings"])."""
+        with self._lock:
+            for name, ms in (timings or {}).items():
+                self.stages.observe(name.removesuffix("_ms"), ms)
+
+    def observe_query(self, ms: float, cache: str):
+        """Records the latency of a whole query; cache is "hit" or "miss"."""
+        with self._lock:
+            self.queries.observe(cache, ms)
+
+    def count_cache(self, layer: str, hit: bool):
+        """
+        Counts a cache lookup; layer is "pipeline" (RAGPipeline.query answers),
+        "semantic" or "query" (module-level query answers).
+        """
+        key = (layer, "hit" if hit else "miss")
+        with self._lock:
+            self.cache_lookups[key] = self.cache_lookups.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "stage_ms": self.stages.snapshot(),
+                "query_ms": self.queries.snapshot(),
+                "cache_lookups": {
+                    f"{layer}_{result}": count
+                    for (layer, result), count in self.cache_lookups.items()
+                },
+            }
+
+    @staticmethod
+    def _render_histogram(name, help_text, label_name, histogram) -> list:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for label, series in sorted(histogram.snapshot().items()):
+            for bound, count in series["buckets"].items():
+                lines.append(
+                    f'{name}_bucket{{{label_name}="{label}",le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'{name}_bucket{{{label_name}="{label}",le="+Inf"}} {series["count"]}'
+            )
+            lines.append(f'{name}_sum{{{label_name}="{label}"}} {series["sum"]}')
+            lines.append(f'{name}_count{{{label_name}="{label}"}} {series["count"]}')
+        return lines
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = self._render_histogram(
+                "rag_query_stage_ms",
+                "Duration of each query stage in milliseconds.",
+                "stage",
+                self.stages,
+            )
+            lines += self._render_histogram(
+                "rag_query_ms",
+                "Duration of whole queries in milliseconds, by cache outcome.",
+                "cache",
+                self.queries,
+            )
+            lines += [
+                "# HELP rag_cache_lookups_total Answer cache lookups by layer.",
+                "# TYPE rag_cache_lookups_total counter",
+            ]
+            for (layer, result), count in sorted(self.cache_lookups.items()):
+                lines.append(
+                    f'rag_cache_lookups_total{{cache="{layer}",result="{result}"}} '
+                    f"{count}"
+                )
+        return "\n".join(lines) + "\n"
@@ -1,15 +1,37 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
+import json
 import sqlite3
 from constants import DB_PATH
-from rag.rag_service import query, ingest  # Import the functions directly
+from rag.rag_service import (  # Import the functions directly
+    BATCH_LLM_CONCURRENCY,
+    BATCH_MAX_QUESTIONS,
+    abatch_query,
+    aquery,
+    stream_query,
+    submit_ingest,
+    ingest_job_status,
+    rollback_index,
+    cache_stats,
+    query_metrics,
+    aresolve_scope,
+    resolve_scope,
+    shard_directory,
+    shard_stats,
+)
 
 router = APIRouter(prefix="/rag", tags=["rag"])
 
 
 class QueryRequest(BaseModel):
     question: str
+    # Optional scope: a knowledge source and/or file names, paths or URLs
+    source_id: Optional[int] = None
+    files: Optional[List[str]] = None
+    # Tenant whose index shard answers; None uses the default index
+    tenant: Optional[str] = None
 
     class Config:
         schema_extra = {
@@ -17,38 +39,128 @@ class QueryRequest(BaseModel):
         }
 
 
+def check_tenant(tenant: Optional[str], must_exist: bool = True):
+    """
+    400 for an invalid tenant id; with must_exist, 404 for a tenant that has
+    no shard yet (only ingestion creates one).
+    """
+    if tenant is None:
+        return
+    try:
+        shard_directory(tenant, must_exist=must_exist)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def request_scope(request: QueryRequest) -> Optional[List[str]]:
+    """
+    Validates the request's tenant and resolves its scope to file names,
+    see `resolve_scope`.
+    """
+    check_tenant(request.tenant)
+    try:
+        return resolve_scope(request.source_id, request.files)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def arequest_scope(request: QueryRequest) -> Optional[List[str]]:
+    """Async variant of `request_scope`, for async endpoints."""
+    check_tenant(request.tenant)
+    try:
+        return await aresolve_scope(request.source_id, request.files)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 class QueryResponse(BaseModel):
     response: str
     confidence: float
     metadata: Dict[Any, Any]
 
 
-@router.post("/ingest")
-async def ingest_data_endpoint():
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    max_concurrency: int = Field(BATCH_LLM_CONCURRENCY, ge=1, le=BATCH_LLM_CONCURRENCY)
+    tenant: Optional[str] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "questions": [
+                    "What are the areas of improvement in my resume?",
+                    "Which skills should I highlight?",
+                ]
+            }
+        }
+
+
+class BatchQueryItem(BaseModel):
+    question: str
+    response: Optional[str]
+    confidence: float
+    source_files: List[str]
+    error: Optional[str]
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem]
+
+
+@router.post("/ingest", status_code=202)
+async def ingest_data_endpoint(tenant: Optional[str] = None):
     """
-    Ingest data from the specified directory into the RAG pipeline.
+    Queue an ingestion of the data directory into the RAG pipeline.
+
+    Ingestion runs on a single background worker, so the request returns
+    immediately and queries keep being served meanwhile. A request made
+    while an identical one is still queued gets that job back.
 
     Args:
-        current_user: Currently authenticated user (from JWT token)
+        tenant: Ingest the files/ directory of this tenant's shard into the
+            shard instead of the default data directory
 
     Returns:
-        A success message upon successful ingestion.
+        The job id and status; poll GET /rag/ingest/{job_id} for progress.
     """
+    check_tenant(tenant, must_exist=False)
     try:
-        # Path to your PDF files
-
-        # Call the ingest_data function from the service
-        ingest()
-
-        return {"message": "Data ingestion completed successfully."}
+        job, created = submit_ingest(tenant=tenant)
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "deduplicated": not created,
+        }
 
     except Exception as e:
-        print(f"Error during data ingestion: {str(e)}")
+        print(f"Error queueing data ingestion: {str(e)}")
         raise HTTPException(
-            status_code=500, detail=f"Error during data ingestion: {str(e)}"
+            status_code=500, detail=f"Error queueing data ingestion: {str(e)}"
         )
 
 
+@router.get("/ingest/{job_id}")
+async def ingest_status_endpoint(job_id: str):
+    """
+    Report the progress of an ingestion job.
+
+    Returns:
+        Job status ("queued", "running", "completed" or "failed"), per-file
+        status with the details and timings reported for it, the run summary
+        and the error of a failed job.
+    """
+    job = ingest_job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job {job_id}")
+    return job
+
+
 @router.post("/query", response_model=QueryResponse)
 async def process_query(
     request: QueryRequest,
@@ -57,7 +169,8 @@ async def process_query(
     Process a RAG query and return the response with confidence score.
 
     Args:
-        request: QueryRequest containing the question
+        request: QueryRequest containing the question and, optionally, a
+            knowledge source id and/or files to restrict retrieval to
         current_user: Currently authenticated user (from JWT token)
 
     Returns:
@@ -66,9 +179,12 @@ async def process_query(
         - confidence: Confidence score of the response
         - metadata: Additional metadata about the response
     """
+    files = await arequest_scope(request)
     try:
         # Call the query function from the service
-        response, confidence, source_files = query(request.question)
+        response, confidence, source_files = await aquery(
+            request.question, files, request.tenant
+        )
         print(
             f"Response: {response}, Confidence: {confidence}, Source Files: {source_files}"
         )
@@ -91,3 +207,128 @@ async def process_query(
     except Exception as e:
         print(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def process_query_batch(request: BatchQueryRequest):
+    """
+    Answer many questions in one request.
+
+    The questions are embedded in one batch and retrieved with a single
+    matrix operation; identical prompts share one Gemini call and at most
+    max_concurrency Gemini calls run at once (1 to BATCH_LLM_CONCURRENCY).
+
+    Args:
+        request: BatchQueryRequest with the questions
+
+    Returns:
+        BatchQueryResponse with one result per question, in request order.
+        A failed question has "error" set instead of failing the batch.
+    """
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch",
+        )
+    check_tenant(request.tenant)
+    try:
+        results = await abatch_query(
+            request.questions,
+            max_concurrency=request.max_concurrency,
+            tenant=request.tenant,
+        )
+        return BatchQueryResponse(results=results)
+
+    except Exception as e:
+        print(f"Error processing batch query: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error processing batch query: {str(e)}"
+        )
+
+
+@router.post("/query/stream")
+def process_query_stream(request: QueryRequest):
+    """
+    Process a RAG query and stream the answer as server-sent events.
+
+    Args:
+        request: QueryRequest containing the question and optional scope
+
+    Returns:
+        A text/event-stream response with, in order:
+        - sources: source files of the retrieved pages
+        - token: answer text chunks as Gemini produces them
+        - final: guardrail verdict, confidence and the final answer. If
+          "retracted" is true the client must replace the streamed tokens
+          with "response".
+        - error: sent instead of the remaining events if the query fails
+    """
+    files = request_scope(request)
+
+    def event_stream():
+        for event, data in stream_query(request.question, files, request.tenant):
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+class RollbackRequest(BaseModel):
+    version: Optional[int] = None
+    tenant: Optional[str] = None
+
+
+@router.post("/index/rollback")
+def rollback_index_endpoint(request: RollbackRequest):
+    """
+    Make an earlier index version live again.
+
+    Args:
+        request: RollbackRequest with the version to restore (defaults to
+            the version before the live one) and optionally the tenant
+
+    Returns:
+        The live index version and the versions still kept on disk.
+    """
+    check_tenant(request.tenant)
+    try:
+        return rollback_index(request.version, request.tenant)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/cache/stats")
+def cache_stats_endpoint():
+    """
+    Report answer cache usage per namespace and semantic cache counters.
+
+    Returns:
+        Entry counts, sizes, hits and misses for each cache layer, plus the
+        index and prompt versions that current cache keys are built from.
+    """
+    return cache_stats()
+
+
+@router.get("/shards")
+async def shards_endpoint():
+    """
+    Report the tenant index shards: which are resident, their estimated
+    memory against the budget, load counts and times, hits and evictions.
+    """
+    return shard_stats()
+
+
+@router.get("/metrics")
+async def metrics_endpoint(format: str = "prometheus"):
+    """
+    Export query latency histograms per stage (input scan, retrieval, context
+    assembly, image loading, synthesis, output scan), whole-query latency by
+    cache outcome and cache hit/miss counters.
+
+    Returns:
+        Prometheus text exposition format, or JSON with `?format=json`.
+    """
+    if format == "json":
+        return query_metrics("json")
+    return PlainTextResponse(query_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,30 +1,72 @@
+import asyncio
+import base64
+import hashlib
+import json
 import os
 import re
+import threading
+import time
 from pathlib import Path
-from typing import List, Callable, Optional
+from typing import Dict, List, Callable, Optional
+from urllib.parse import unquote, urlparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import nest_asyncio
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 from pydantic import Field
-import diskcache
 from dotenv import load_dotenv
 
 from llama_index.core import (
     Settings,
-    StorageContext,
     VectorStoreIndex,
     load_index_from_storage,
 )
 from llama_index.core.query_engine import CustomQueryEngine
 from llama_index.core.retrievers import BaseRetriever
-from llama_index.core.schema import ImageNode, NodeWithScore, MetadataMode, TextNode
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.schema import ImageNode, NodeWithScore, TextNode
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.core.prompts import PromptTemplate
 from llama_parse import LlamaParse
-from llm_guard.input_scanners import Toxicity, TokenLimit
-from llm_guard.input_scanners.toxicity import MatchType
 from litellm import completion
 from llama_index.core.base.response.schema import Response
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+from rag.model_registry import (
+    embed_queries,
+    get_embed_model,
+    get_llm,
+    get_reranker,
+)
+from ingest.ingest_service import IngestService
+from rag.answer_cache import AnswerCache
+from rag.context_builder import LLM_EXCLUDED_METADATA_KEYS, ContextBuilder
+from rag.binary_store import (
+    binary_storage_context,
+    has_binary_store,
+    has_json_store,
+    migrate_json_store,
+)
+from rag.embedding_stage import EmbeddingStage
+from rag.hybrid_retriever import BM25Index, build_hybrid_retriever
+from rag.image_cache import ThumbnailCache
+from rag.ingest_jobs import IngestJobQueue
+from rag.ingest_manifest import IngestManifest, file_sha256
+from rag.index_shards import IndexShardManager
+from rag.index_versions import IndexVersions
+from rag.parse_cache import ParseCache
+from rag.query_metrics import QueryMetrics, stage_timer
+from rag.semantic_cache import SemanticCache
+from rag.scanner_pool import (
+    TOKEN_ENCODING,
+    TOKEN_LIMIT,
+    TOXICITY_THRESHOLD,
+    get_scanner_pool,
+)
 
 nest_asyncio.apply()
 
@@ -37,18 +79,109 @@ GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 os.environ["GEMINI_API_KEY"] = GOOGLE_API_KEY
 
-# Embedding Model
-embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+# Guardrails: scanner-only mode skips the reference LLM completion that the
+# scanners used to generate (and InputScanner discarded) on every call
+GUARDRAIL_SCANNER_ONLY = os.environ.get(
+    "RAG_GUARDRAIL_SCANNER_ONLY", "true"
+).lower() in ("1", "true", "yes")
+SCANNER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RAG_SCANNER_WORKERS", 4)),
+    thread_name_prefix="guardrail",
+)
+
+# Executor for blocking work (embedding, llm_guard inference, disk cache I/O)
+# on the async query path, so it never runs on the event loop
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RAG_BLOCKING_WORKERS", 8)),
+    thread_name_prefix="rag-blocking",
+)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking call on BLOCKING_EXECUTOR and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, partial(fn, *args, **kwargs))
+
+
+# Hybrid retrieval: vector and BM25 candidates fused, then reranked; only
+# chunks with reranker relevance >= cutoff reach the prompt (1..max_k).
+# Relevance is a sigmoid probability, see get_reranker
+RETRIEVAL_CANDIDATES = int(os.environ.get("RAG_RETRIEVAL_CANDIDATES", 12))
+RERANK_CUTOFF = float(os.environ.get("RAG_RERANK_CUTOFF", 0.3))
+RETRIEVAL_MAX_K = int(os.environ.get("RAG_RETRIEVAL_MAX_K", 6))
+
+# Context assembly: prompt context token budget and the embedding similarity
+# at which a retrieved chunk counts as a near-duplicate of a kept one
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_DEDUPE_THRESHOLD = float(os.environ.get("RAG_CONTEXT_DEDUPE_THRESHOLD", 0.95))
+
+# Index versions kept on disk (and loaded in memory) for rollback
+INDEX_KEEP_VERSIONS = int(os.environ.get("RAG_INDEX_KEEP_VERSIONS", 3))
+
+# Batch queries: most questions per request and Gemini calls in flight (the
+# cap of a request's max_concurrency)
+BATCH_MAX_QUESTIONS = int(os.environ.get("RAG_BATCH_MAX_QUESTIONS", 256))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("RAG_BATCH_LLM_CONCURRENCY", 4))
+
+# Vector storage: "float32", or "int8" for a 4x smaller memory-mapped array
+VECTOR_DTYPE = os.environ.get("RAG_VECTOR_DTYPE", "float32")
 
-# LLM for Query Generation and Scanner Responses
-llm = GoogleGenAI(model_name="models/gemini-2.0-flash")
-Settings.llm = llm
+# Ingestion: number of PDFs parsed concurrently
+INGEST_WORKERS = int(os.environ.get("RAG_INGEST_WORKERS", 4))
+
+
+def print_ingest_progress(file_path: str, status: str, details: dict):
+    """Default ingest progress reporter."""
+    suffix = f" {details}" if details else ""
+    print(f"[ingest] {os.path.basename(file_path)}: {status}{suffix}")
+
+
+# Parse cache: LlamaParse results keyed by PDF content hash and these settings
+PARSER_SETTINGS = {
+    "text": {"result_type": "text"},
+    "markdown": {"result_type": "markdown", "gpt4o_mode": True},
+}
+PARSE_CACHE = ParseCache(
+    os.environ.get("RAG_PARSE_CACHE_DIR", "_data/parse_cache"), PARSER_SETTINGS
+)
+
+# Multimodal synthesis: at most IMAGE_BUDGET distinct page images, best
+# retrieval score first, sent as downscaled variants held in memory
+IMAGE_BUDGET = int(os.environ.get("RAG_IMAGE_BUDGET", 3))
+THUMBNAIL_CACHE = ThumbnailCache(
+    max_side=int(os.environ.get("RAG_IMAGE_MAX_SIDE", 1024)),
+    quality=int(os.environ.get("RAG_IMAGE_QUALITY", 80)),
+    max_bytes=int(os.environ.get("RAG_IMAGE_CACHE_MB", 64)) * 1024 * 1024,
+)
 
 # Cache Setup
 CACHE_DIR = "_data/cache"
 if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR)
-query_cache = diskcache.Cache(CACHE_DIR)
+CACHE_TTL = float(os.environ.get("RAG_CACHE_TTL", 3600))
+# "pipeline" holds serialized RAGPipeline.query responses, "answers" holds the
+# (response, confidence, source_files) results of the module-level query()
+answer_cache = AnswerCache(
+    CACHE_DIR,
+    namespaces=("pipeline", "answers"),
+    size_limit_mb=int(os.environ.get("RAG_CACHE_SIZE_LIMIT_MB", 256)),
+    ttl=CACHE_TTL,
+)
+
+
+# Semantic cache: serves answers to rephrasings of already answered questions
+def new_semantic_cache() -> SemanticCache:
+    return SemanticCache(
+        threshold=float(os.environ.get("RAG_SEMANTIC_CACHE_THRESHOLD", 0.92)),
+        max_entries=int(os.environ.get("RAG_SEMANTIC_CACHE_SIZE", 1024)),
+        ttl=float(os.environ.get("RAG_SEMANTIC_CACHE_TTL", CACHE_TTL)),
+    )
+
+
+# Of the default index; tenant shards have their own
+semantic_cache = new_semantic_cache()
+# Stage latency histograms and cache counters, exported on /rag/metrics
+QUERY_METRICS = QueryMetrics()
 
 QA_PROMPT_TMPL = """\
 ---------------------
@@ -62,17 +195,106 @@ YOU HAVE TO CITE THE EXACT DATA AND INCLUDE EXACT TEXT FROM THE CONTEXT.
 DO NOT MAKE UP ANYTHING.
 """
 QA_PROMPT = PromptTemplate(QA_PROMPT_TMPL)
+REFUSAL_MESSAGE = "I'm sorry, but I can't help with that."
+# Part of every answer cache key, so editing the prompt invalidates answers
+PROMPT_VERSION = hashlib.sha256(QA_PROMPT_TMPL.encode()).hexdigest()[:12]
+
+# Node metadata kept when a response is serialized into the answer cache
+SOURCE_METADATA_KEYS = ("page_num", "file_name", "image_path")
+
+
+def response_to_cache(response: Response) -> dict:
+    """Serializes a Response into a plain dict without full source nodes."""
+    return {
+        "response": str(response.response),
+        "metadata": response.metadata,
+        "source_nodes": [
+            {
+                "id": n.node.node_id,
+                "score": n.score,
+                "metadata": {
+                    k: n.node.metadata[k]
+                    for k in SOURCE_METADATA_KEYS
+                    if k in n.node.metadata
+                },
+            }
+            for n in response.source_nodes
+        ],
+    }
+
+
+def add_timing(response: Response, name: str, ms: float):
+    """Records a duration under the response's metadata["timings"]."""
+    if response.metadata is None:
+        response.metadata = {}
+    response.metadata.setdefault("timings", {})[name] = round(ms, 3)
+
+
+def response_from_cache(cached: dict) -> Response:
+    """Rebuilds a Response from `response_to_cache` output."""
+    return Response(
+        response=cached["response"],
+        source_nodes=[
+            NodeWithScore(
+                node=TextNode(id_=n["id"], text="", metadata=n["metadata"]),
+                score=n["score"],
+            )
+            for n in cached["source_nodes"]
+        ],
+        metadata=cached["metadata"],
+    )
+
+
+def scope_file_names(files: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    Returns the sorted base names of the files a query is scoped to, given
+    as paths, names or URLs, or None for an unscoped query.
+    """
+    if files is None:
+        return None
+    names = {os.path.basename(unquote(urlparse(f).path).rstrip("/")) for f in files}
+    return sorted(name for name in names if name)
+
+
+def scope_filters(file_names: Optional[List[str]]) -> Optional[MetadataFilters]:
+    """Vector store filters restricting retrieval to the given files."""
+    if file_names is None:
+        return None
+    return MetadataFilters(
+        filters=[
+            MetadataFilter(
+                key="file_name", value=list(file_names), operator=FilterOperator.IN
+            )
+        ]
+    )
+
+
+def scope_key(file_names: Optional[List[str]]) -> str:
+    """Answer cache scope of a query; "" for unscoped queries."""
+    if file_names is None:
+        return ""
+    return hashlib.sha256("\n".join(file_names).encode()).hexdigest()[:16]
 
 
 # Function to Parse Documents
-def parse_document(file_path: str, llamaAPI_KEY: str):
+def parse_document(
+    file_path: str,
+    llamaAPI_KEY: str,
+    image_dir: str = None,
+    file_hash: str = None,
+):
     """
     Parses a document (currently PDF) using LlamaParse, extracting
-    both text and images.
+    both text and images. The text pass and the markdown/image pass
+    run concurrently. Results are cached in PARSE_CACHE by content hash,
+    so a document is only sent to LlamaParse once per parser settings.
 
     Args:
         file_path (str): Path to the document.
         llamaAPI_KEY (str): API key for LlamaCloud/LlamaParse.
+        image_dir (str): Where page images are downloaded. Defaults to
+            IMAGE_DIRECTORY.
+        file_hash (str): SHA-256 of the document, computed if not given.
 
     Returns:
         tuple: A tuple containing:
@@ -80,42 +302,64 @@ def parse_document(file_path: str, llamaAPI_KEY: str):
             - md_json_list (list): List of markdown-formatted JSON objects.
             - image_dicts (dict): Dictionary containing image information.
     """
-    parser_text = LlamaParse(result_type="text", api_key=llamaAPI_KEY)
-    parser_gpt4o = LlamaParse(
-        result_type="markdown", gpt4o_mode=True, api_key=llamaAPI_KEY
-    )
-
-    print(f"Parsing text...")
-    docs_text = parser_text.load_data(file_path)
-    print(f"Parsing PDF file...")
-    md_json_objs = parser_gpt4o.get_json_result(file_path)
-    md_json_list = md_json_objs[0]["pages"]
-    image_dicts = parser_gpt4o.get_images(
-        md_json_objs, download_path=IMAGE_DIRECTORY  # Use global IMAGE_DIRECTORY here
-    )
+    file_hash = file_hash or file_sha256(file_path)
+    cached = PARSE_CACHE.get(file_hash)
+    if cached is not None:
+        print(f"Loaded parse result from cache: {file_path}")
+        return cached
+
+    parser_text = LlamaParse(api_key=llamaAPI_KEY, **PARSER_SETTINGS["text"])
+    parser_gpt4o = LlamaParse(api_key=llamaAPI_KEY, **PARSER_SETTINGS["markdown"])
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="llamaparse") as pool:
+        print(f"Parsing text...")
+        text_future = pool.submit(parser_text.load_data, file_path)
+        print(f"Parsing PDF file...")
+        md_json_objs = parser_gpt4o.get_json_result(file_path)
+        md_json_list = md_json_objs[0]["pages"]
+        # Image download overlaps with the text pass still running
+        image_dicts = parser_gpt4o.get_images(
+            md_json_objs, download_path=image_dir or IMAGE_DIRECTORY
+        )
+        docs_text = text_future.result()
 
+    PARSE_CACHE.set(file_hash, docs_text, md_json_list, image_dicts)
     return docs_text, md_json_list, image_dicts
 
 
 # Helper Functions for Text Node Processing
-def get_page_number(file_name):
-    match = re.search(r"-page-(\d+)\.jpg$", str(file_name))
-    if match:
-        return int(match.group(1))
-    return 0
-
-
-def _get_sorted_image_files(image_dir):
-    raw_files = [f for f in list(Path(image_dir).iterdir()) if f.is_file()]
-    sorted_files = sorted(raw_files, key=get_page_number)
-    return sorted_files
+def page_image_manifest(image_dicts) -> Dict[int, List[str]]:
+    """
+    Maps page number to the image paths a document produced, from the image
+    dicts returned by `parse_document`.
+    """
+    page_images = {}
+    for image in image_dicts or []:
+        if image.get("path") and image.get("page_number") is not None:
+            page_images.setdefault(int(image["page_number"]), []).append(
+                str(image["path"])
+            )
+    return page_images
 
 
 # Function to Create Text Nodes
-def get_text_nodes(docs, image_dir=None, json_dicts=None, max_metadata_len=512):
+def get_text_nodes(docs, page_images=None, json_dicts=None, max_metadata_len=512):
+    """
+    Creates one text node per page chunk of a document.
+
+    Args:
+        docs (list): Text-pass documents of a single file.
+        page_images (dict): page number -> image paths of that same file,
+            see `page_image_manifest`.
+        json_dicts (list): Markdown page JSON of the file.
+        max_metadata_len (int): Limit on metadata text length.
+    """
     nodes = []
 
-    image_files = _get_sorted_image_files(image_dir) if image_dir is not None else None
+    # Pages without their own image fall back to the document's first image
+    fallback_image = None
+    if page_images:
+        fallback_image = page_images[min(page_images)][0]
 
     md_texts = [d["md"] for d in json_dicts] if json_dicts is not None else None
 
@@ -124,9 +368,8 @@ def get_text_nodes(docs, image_dir=None, json_dicts=None, max_metadata_len=512):
     for idx, doc_chunk in enumerate(doc_chunks):
         chunk_metadata = {"page_num": idx + 1}
 
-        if image_files is not None:
-            image_file = image_files[idx] if idx < len(image_files) else image_files[0]
-            chunk_metadata["image_path"] = str(image_file)
+        if fallback_image is not None:
+            chunk_metadata["image_path"] = page_images.get(idx + 1, [fallback_image])[0]
 
         if md_texts is not None:
             parsed_text_md = md_texts[idx] if idx < len(md_texts) else md_texts[0]
@@ -146,6 +389,7 @@ def get_text_nodes(docs, image_dir=None, json_dicts=None, max_metadata_len=512):
         node = TextNode(
             text="",
             metadata=chunk_metadata,
+            excluded_llm_metadata_keys=list(LLM_EXCLUDED_METADATA_KEYS),
         )
         nodes.append(node)
 
@@ -174,11 +418,8 @@ def result_response(
     }
 
 
-def guardrail_toxicLanguage(prompt):
-    # Interact with the LLM to generate a response
-    print(f"Prompt: {prompt}")
-
-    # Generate the response using the LLM (Gemini-1.5-flash)
+def guardrail_completion(prompt):
+    """Generates the reference LLM response attached to guardrail results."""
     response = completion(
         model="gemini/gemini-1.5-flash",
         messages=[
@@ -186,11 +427,20 @@ def guardrail_toxicLanguage(prompt):
             {"role": "user", "content": prompt},
         ],
     )
-    response_text = response.choices[0].message.content
+    return response.choices[0].message.content
+
+
+def guardrail_toxicLanguage(prompt, scanner_only=GUARDRAIL_SCANNER_ONLY):
+    # Interact with the LLM to generate a response
+    print(f"Prompt: {prompt}")
+
+    # Generate the response using the LLM (Gemini-1.5-flash) unless running
+    # in scanner-only mode, where only the local scan result is needed
+    response_text = None if scanner_only else guardrail_completion(prompt)
 
-    # Define the threshold and scan for toxicity
-    threshold = 0.5
-    toxic_scanner = Toxicity(threshold=threshold, match_type=MatchType.FULL)
+    # Scan for toxicity with the shared, micro-batched scanner
+    threshold = TOXICITY_THRESHOLD
+    toxic_scanner = get_scanner_pool().toxicity
     sanitized_output, is_valid, risk_score = toxic_scanner.scan(prompt)
 
     return result_response(
@@ -204,18 +454,11 @@ def guardrail_toxicLanguage(prompt):
     )
 
 
-def guardrail_tokenlimit(prompt):
-    threshold = 400
-    response = completion(
-        model="gemini/gemini-1.5-flash",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    response_text = response.choices[0].message.content
+def guardrail_tokenlimit(prompt, scanner_only=GUARDRAIL_SCANNER_ONLY):
+    threshold = TOKEN_LIMIT
+    response_text = None if scanner_only else guardrail_completion(prompt)
 
-    scanner = TokenLimit(limit=threshold, encoding_name="cl100k_base")
+    scanner = get_scanner_pool().token_limit
     sanitized_output, is_valid, risk_score = scanner.scan(prompt)
 
     # Use the global rail to format the result
@@ -233,35 +476,50 @@ def guardrail_tokenlimit(prompt):
 
 
 # Input and Output Scanner functions
-def InputScanner(query, listOfScanners):
-    detected = False
+def _run_scanners(calls):
+    """
+    Runs independent scanner calls concurrently and stops at the first block.
+
+    Args:
+        calls (list): Zero-argument callables, one per scanner.
+
+    Returns:
+        tuple: (detected, triggered_scanners)
+    """
+    if len(calls) <= 1:
+        results = [call() for call in calls]
+        triggered_scanners = [r for r in results if r["activated"]]
+        return bool(triggered_scanners), triggered_scanners
+
+    futures = [SCANNER_EXECUTOR.submit(call) for call in calls]
     triggered_scanners = []
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result["activated"]:
+                # Short-circuit: one block is enough to reject the text
+                triggered_scanners.append(result)
+                break
+    finally:
+        for future in futures:
+            future.cancel()
 
-    for scanner in listOfScanners:
-        result = scanner(query)
+    return bool(triggered_scanners), triggered_scanners
 
-        if result["activated"]:
-            detected = True
-            triggered_scanners.append(result)
 
-    return detected, triggered_scanners
+def InputScanner(query, listOfScanners):
+    return _run_scanners([partial(scanner, query) for scanner in listOfScanners])
 
 
 def OutputScanner(response, query, context, listOfScanners):
-    detected = False
-    triggered_scanners = []
-
+    calls = []
     for scanner in listOfScanners:
         if scanner.__name__ == "evaluate_rag_response":
-            result = scanner(response, query, context)
+            calls.append(partial(scanner, response, query, context))
         else:
-            result = scanner(response)
+            calls.append(partial(scanner, response))
 
-        if result["activated"]:
-            detected = True
-            triggered_scanners.append(result)
-
-    return detected, triggered_scanners
+    return _run_scanners(calls)
 
 
 # Custom Query Engine
@@ -271,67 +529,114 @@ class MultimodalQueryEngine(CustomQueryEngine):
     multi_modal_llm: GoogleGenAI
     input_scanners: List[Callable[[str], dict]] = Field(default_factory=list)
     output_scanners: List[Callable[[str], dict]] = Field(default_factory=list)
+    image_budget: int = IMAGE_BUDGET
+    context_builder: ContextBuilder = Field(
+        default_factory=lambda: ContextBuilder(
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD,
+            encoding_name=TOKEN_ENCODING,
+        )
+    )
 
     def __init__(self, qa_prompt: Optional[PromptTemplate] = None, **kwargs) -> None:
         super().__init__(qa_prompt=qa_prompt or QA_PROMPT, **kwargs)
 
-    def custom_query(self, query_str: str):
-        query_metadata = {
+    def _new_metadata(self):
+        return {
             "input_scanners": [],
             "output_scanners": [],
             "retrieved_nodes": [],
             "response_status": "success",
+            # Per-stage durations in ms, see stage_timer
+            "timings": {},
         }
 
-        input_detected, input_triggered = InputScanner(query_str, self.input_scanners)
-        if input_triggered:
-            query_metadata["input_scanners"] = input_triggered
-            if input_detected:
-                return Response(
-                    response="I'm sorry, but I can't help with that.",
-                    source_nodes=[],
-                    metadata={
-                        "guardrail": "Input Scanner",
-                        "triggered_scanners": input_triggered,
-                        "response_status": "blocked",
-                    },
-                )
+    def _blocked_response(self, input_triggered, query_metadata):
+        return Response(
+            response=REFUSAL_MESSAGE,
+            source_nodes=[],
+            metadata={
+                "guardrail": "Input Scanner",
+                "triggered_scanners": input_triggered,
+                "response_status": "blocked",
+                "timings": query_metadata["timings"],
+            },
+        )
 
-        # retrieve text nodes
-        nodes = self.retriever.retrieve(query_str)
-        # create ImageNode items from text nodes
-        image_nodes = [
-            NodeWithScore(node=ImageNode(image_path=n.metadata["image_path"]))
-            for n in nodes
-        ]
+    def _select_images(self, nodes: List[NodeWithScore]) -> List[ImageNode]:
+        """
+        Returns ImageNodes for at most `image_budget` distinct page images,
+        highest retrieval score first.
+        """
+        image_paths = []
+        for n in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+            if len(image_paths) >= self.image_budget:
+                break
+            image_path = n.metadata.get("image_path")
+            if image_path and image_path not in image_paths:
+                image_paths.append(image_path)
+
+        image_documents = []
+        for image_path in image_paths:
+            data = THUMBNAIL_CACHE.get(image_path)
+            if data is not None:
+                image_documents.append(
+                    ImageNode(
+                        image=base64.b64encode(data).decode("utf-8"),
+                        image_mimetype="image/jpeg",
+                        metadata={"image_path": image_path},
+                    )
+                )
+        return image_documents
 
+    def _assemble_context(
+        self, nodes: List[NodeWithScore], timings: Optional[dict] = None
+    ):
+        """
+        Returns (context_str, nodes, context_stats, image_documents), where
+        nodes are the retrieved nodes that made it into the token-budgeted
+        context. Stage durations are added to `timings` when given.
+        """
+        timings = {} if timings is None else timings
+        with stage_timer(timings, "context_ms"):
+            context_str, nodes, context_stats = self.context_builder.build(nodes)
+        with stage_timer(timings, "image_load_ms"):
+            image_documents = self._select_images(nodes)
+        return context_str, nodes, context_stats, image_documents
+
+    def _build_prompt(
+        self, query_str: str, nodes: List[NodeWithScore], query_metadata: dict
+    ):
+        """
+        Returns (context_str, fmt_prompt, image_documents, nodes), where nodes
+        are the retrieved nodes that made it into the token-budgeted context.
+        """
         # create context string from text nodes, dump into the prompt
-        context_str = "\n\n".join(
-            [r.get_content(metadata_mode=MetadataMode.LLM) for r in nodes]
-        )
-        fmt_prompt = self.qa_prompt.format(context_str=context_str, query_str=query_str)
-
-        # synthesize an answer from formatted text and images
-        llm_response = self.multi_modal_llm.complete(
-            prompt=fmt_prompt,
-            image_documents=[image_node.node for image_node in image_nodes],
+        context_str, nodes, context_stats, image_documents = self._assemble_context(
+            nodes, query_metadata["timings"]
         )
+        query_metadata["context"] = context_stats
 
-        # Step 5: Run Output Scanners
-        output_detected, output_triggered = OutputScanner(
-            str(llm_response),
-            str(query_str),
-            str(context_str),
-            self.output_scanners,
-        )
+        fmt_prompt = self.qa_prompt.format(context_str=context_str, query_str=query_str)
+        return context_str, fmt_prompt, image_documents, nodes
+
+    def _finalize(self, llm_text, query_str, context_str, nodes, query_metadata):
+        """Runs the output scanners and builds the final Response."""
+        with stage_timer(query_metadata["timings"], "output_scan_ms"):
+            output_detected, output_triggered = OutputScanner(
+                llm_text,
+                str(query_str),
+                str(context_str),
+                self.output_scanners,
+            )
         if output_triggered:
             query_metadata["output_scanners"] = (
                 output_triggered  # Store output scanner info
             )
 
-        final_response = str(llm_response)
+        final_response = llm_text
         if output_detected:
-            final_response = "I'm sorry, but I can't help with that."
+            final_response = REFUSAL_MESSAGE
             query_metadata["response_status"] = "sanitized"
         # Return the response with detailed metadata
         return Response(
@@ -340,34 +645,483 @@ class MultimodalQueryEngine(CustomQueryEngine):
             metadata=query_metadata,
         )
 
+    def custom_query(self, query_str: str):
+        query_metadata = self._new_metadata()
+        timings = query_metadata["timings"]
+
+        with stage_timer(timings, "input_scan_ms"):
+            input_detected, input_triggered = InputScanner(
+                query_str, self.input_scanners
+            )
+        if input_triggered:
+            query_metadata["input_scanners"] = input_triggered
+            if input_detected:
+                return self._blocked_response(input_triggered, query_metadata)
+
+        # retrieve text nodes
+        with stage_timer(timings, "retrieval_ms"):
+            nodes = self.retriever.retrieve(query_str)
+        context_str, fmt_prompt, image_documents, nodes = self._build_prompt(
+            query_str, nodes, query_metadata
+        )
+
+        # synthesize an answer from formatted text and images
+        with stage_timer(timings, "synthesis_ms"):
+            llm_response = self.multi_modal_llm.complete(
+                prompt=fmt_prompt,
+                image_documents=image_documents,
+            )
 
-# Helper function to calculate confidence score
-def get_confidence_score(response, index):
-    """Calculates confidence score based on cited pages."""
+        # Step 5: Run Output Scanners
+        return self._finalize(
+            str(llm_response), query_str, context_str, nodes, query_metadata
+        )
 
-    cited_pages = []
-    for match in re.finditer(r"\(Page (\d+)\)", response.response):
-        cited_pages.append(int(match.group(1)))
+    async def acustom_query(self, query_str: str):
+        """
+        Async variant of `custom_query`: scanners, retrieval and output scans
+        run on the blocking executor and Gemini is called with `acomplete`.
+        """
+        query_metadata = self._new_metadata()
+        timings = query_metadata["timings"]
 
-    relevant_nodes = [
-        node
-        for node in index.docstore.get_nodes()
-        if node.metadata.get("page_num") in cited_pages
-    ]
+        with stage_timer(timings, "input_scan_ms"):
+            input_detected, input_triggered = await run_blocking(
+                InputScanner, query_str, self.input_scanners
+            )
+        if input_triggered:
+            query_metadata["input_scanners"] = input_triggered
+            if input_detected:
+                return self._blocked_response(input_triggered, query_metadata)
+
+        # retrieval embeds the query locally, keep it off the event loop
+        with stage_timer(timings, "retrieval_ms"):
+            nodes = await run_blocking(self.retriever.retrieve, query_str)
+        # page images may be read and downscaled from disk on a cache miss
+        context_str, fmt_prompt, image_documents, nodes = await run_blocking(
+            self._build_prompt, query_str, nodes, query_metadata
+        )
 
-    if not relevant_nodes:
-        return 0.0  # No cited pages found
+        with stage_timer(timings, "synthesis_ms"):
+            llm_response = await self.multi_modal_llm.acomplete(
+                prompt=fmt_prompt,
+                image_documents=image_documents,
+            )
+
+        return await run_blocking(
+            self._finalize,
+            str(llm_response),
+            query_str,
+            context_str,
+            nodes,
+            query_metadata,
+        )
+
+    def stream_query(self, query_str: str):
+        """
+        Streaming variant of `custom_query`.
+
+        Yields ("sources", nodes) once the context is assembled, then ("token", delta)
+        for each chunk Gemini produces, then ("final", Response) after the
+        output scanners ran on the full answer. A final response whose status
+        is "sanitized" retracts the tokens streamed before it.
+        """
+        query_metadata = self._new_metadata()
+        timings = query_metadata["timings"]
+
+        with stage_timer(timings, "input_scan_ms"):
+            input_detected, input_triggered = InputScanner(
+                query_str, self.input_scanners
+            )
+        if input_triggered:
+            query_metadata["input_scanners"] = input_triggered
+            if input_detected:
+                yield "final", self._blocked_response(input_triggered, query_metadata)
+                return
+
+        with stage_timer(timings, "retrieval_ms"):
+            nodes = self.retriever.retrieve(query_str)
+        context_str, fmt_prompt, image_documents, nodes = self._build_prompt(
+            query_str, nodes, query_metadata
+        )
+        yield "sources", nodes
+
+        # Only time spent waiting on Gemini counts, not the consumer's
+        chunks = []
+        stream = iter(
+            self.multi_modal_llm.stream_complete(
+                prompt=fmt_prompt,
+                image_documents=image_documents,
+            )
+        )
+        while True:
+            with stage_timer(timings, "synthesis_ms"):
+                chunk = next(stream, None)
+            if chunk is None:
+                break
+            if "first_token_ms" not in timings:
+                timings["first_token_ms"] = timings["synthesis_ms"]
+            if chunk.delta:
+                chunks.append(chunk.delta)
+                yield "token", chunk.delta
+
+        yield "final", self._finalize(
+            "".join(chunks), query_str, context_str, nodes, query_metadata
+        )
+
+    async def abatch_query(
+        self,
+        query_strs: List[str],
+        query_embeddings: List[List[float]],
+        max_concurrency: int = BATCH_LLM_CONCURRENCY,
+    ) -> list:
+        """
+        Answers several queries together.
+
+        Input scans run concurrently, so the toxicity batcher groups them.
+        Retrieval goes through `retriever.retrieve_batch` with the given query
+        embeddings. Queries that retrieved the same nodes share one context
+        assembly, identical prompts share one Gemini call, and at most
+        `max_concurrency` Gemini calls are in flight.
+
+        Each response carries the stage timings of a single query. Shared
+        stages (the batched retrieval, a shared context assembly or Gemini
+        call) are recorded in full for every query that waited on them.
+
+        Returns:
+            list: One Response or Exception per query, in input order.
+        """
+        results: list = [None] * len(query_strs)
+        metadata = [self._new_metadata() for _ in query_strs]
+
+        async def scan(i):
+            with stage_timer(metadata[i]["timings"], "input_scan_ms"):
+                return await run_blocking(
+                    InputScanner, query_strs[i], self.input_scanners
+                )
+
+        scans = await asyncio.gather(
+            *(scan(i) for i in range(len(query_strs))), return_exceptions=True
+        )
+        active = []
+        for i, scan in enumerate(scans):
+            if isinstance(scan, Exception):
+                results[i] = scan
+                continue
+            input_detected, input_triggered = scan
+            if input_triggered:
+                metadata[i]["input_scanners"] = input_triggered
+                if input_detected:
+                    results[i] = self._blocked_response(input_triggered, metadata[i])
+                    continue
+            active.append(i)
+        if not active:
+            return results
+
+        retrieval_timings = {}
+        try:
+            with stage_timer(retrieval_timings, "retrieval_ms"):
+                if hasattr(self.retriever, "retrieve_batch"):
+                    retrieved = await run_blocking(
+                        self.retriever.retrieve_batch,
+                        [query_strs[i] for i in active],
+                        [query_embeddings[i] for i in active],
+                    )
+                else:
+                    retrieved = [
+                        await run_blocking(self.retriever.retrieve, query_strs[i])
+                        for i in active
+                    ]
+        except Exception as e:
+            for i in active:
+                results[i] = e
+            return results
+
+        # Queries that retrieved the same nodes share their context
+        contexts = {}
+        context_timings = {}
+        call_keys = {}
+        for i, nodes in zip(active, retrieved):
+            context_key = tuple(n.node.node_id for n in nodes)
+            if context_key not in contexts:
+                context_timings[context_key] = {}
+                contexts[context_key] = await run_blocking(
+                    self._assemble_context, nodes, context_timings[context_key]
+                )
+            context_str, _, context_stats, _ = contexts[context_key]
+            metadata[i]["context"] = dict(context_stats)
+            metadata[i]["timings"].update(retrieval_timings)
+            metadata[i]["timings"].update(context_timings[context_key])
+            fmt_prompt = self.qa_prompt.format(
+                context_str=context_str, query_str=query_strs[i]
+            )
+            call_keys[i] = (context_key, fmt_prompt)
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        call_timings = {}
+
+        async def complete(context_key, fmt_prompt):
+            async with semaphore:
+                timings = call_timings.setdefault((context_key, fmt_prompt), {})
+                with stage_timer(timings, "synthesis_ms"):
+                    llm_response = await self.multi_modal_llm.acomplete(
+                        prompt=fmt_prompt,
+                        image_documents=contexts[context_key][3],
+                    )
+                return str(llm_response)
+
+        # Identical prompts share one Gemini call
+        unique_calls = list(dict.fromkeys(call_keys.values()))
+        completions = dict(
+            zip(
+                unique_calls,
+                await asyncio.gather(
+                    *(complete(*call) for call in unique_calls),
+                    return_exceptions=True,
+                ),
+            )
+        )
+
+        async def finalize(i):
+            llm_text = completions[call_keys[i]]
+            if isinstance(llm_text, Exception):
+                raise llm_text
+            metadata[i]["timings"].update(call_timings[call_keys[i]])
+            context_str, nodes, _, _ = contexts[call_keys[i][0]]
+            return await run_blocking(
+                self._finalize,
+                llm_text,
+                query_strs[i],
+                context_str,
+                nodes,
+                metadata[i],
+            )
 
-    response_embedding = embed_model.get_text_embedding(response.response)
-    node_embeddings = [
-        embed_model.get_text_embedding(node.get_content()) for node in relevant_nodes
+        finalized = await asyncio.gather(
+            *(finalize(i) for i in active), return_exceptions=True
+        )
+        for i, result in zip(active, finalized):
+            results[i] = result
+        return results
+
+
+# Helper functions to calculate confidence score
+def build_page_lookup(nodes) -> Dict[str, Dict[int, List[str]]]:
+    """Maps file_name, then page_num, to the ids of the nodes holding that page."""
+    page_node_ids = {}
+    for node in nodes:
+        page_num = node.metadata.get("page_num")
+        if page_num is not None:
+            file_pages = page_node_ids.setdefault(node.metadata.get("file_name"), {})
+            file_pages.setdefault(int(page_num), []).append(node.node_id)
+    return page_node_ids
+
+
+def merge_page_lookup(page_node_ids: dict, other: dict):
+    """Adds the entries of another `build_page_lookup` result to page_node_ids."""
+    for file_name, pages in other.items():
+        file_pages = page_node_ids.setdefault(file_name, {})
+        for page, node_ids in pages.items():
+            file_pages.setdefault(page, []).extend(node_ids)
+
+
+def get_confidence_score(response, index, page_node_ids=None):
+    """
+    Calculates confidence score based on cited pages.
+
+    The score is the mean cosine similarity between the response and the
+    cited pages, using the page embeddings already stored in the vector
+    index so only the response itself is embedded. Citations name pages
+    only, so they are looked up in the files the response was generated
+    from (its source nodes), not in every file of the corpus.
+
+    Args:
+        response (Response): The response to score.
+        index (VectorStoreIndex): The index the response was generated from.
+        page_node_ids (dict): file_name -> page_num -> node ids lookup built
+            at ingest. Built from the docstore when not given.
+
+    Returns:
+        float: Confidence score, 0.0 when no cited page is found.
+    """
+    cited_pages = {
+        int(match.group(1))
+        for match in re.finditer(r"\(Page (\d+)\)", str(response.response))
+    }
+    if not cited_pages:
+        return 0.0
+
+    source_files = {
+        n.node.metadata.get("file_name") for n in response.source_nodes or []
+    }
+    if not source_files:
+        return 0.0
+
+    if page_node_ids is None:
+        page_node_ids = build_page_lookup(index.docstore.docs.values())
+
+    node_ids = [
+        node_id
+        for file_name in source_files
+        for page in cited_pages
+        for node_id in page_node_ids.get(file_name, {}).get(page, [])
     ]
+    if not node_ids:
+        return 0.0  # No cited pages found
+
+    vector_store = index.vector_store
+    if hasattr(vector_store, "get_embeddings"):
+        node_embeddings = vector_store.get_embeddings(node_ids)
+    else:
+        node_embeddings = np.asarray(
+            [vector_store.get(node_id) for node_id in node_ids], dtype=np.float32
+        )
+    response_embedding = np.asarray(
+        get_embed_model().get_text_embedding(str(response.response)), dtype=np.float32
+    )
+
+    node_embeddings /= np.linalg.norm(node_embeddings, axis=1, keepdims=True) + 1e-12
+    response_embedding /= np.linalg.norm(response_embedding) + 1e-12
+    similarity_scores = node_embeddings @ response_embedding
+
+    return float(similarity_scores.mean())
+
+
+class IndexSnapshot:
+    """
+    One version of the index: the vector index and its docstore, the BM25
+    keyword index and the page lookup, all backed by `directory`.
+
+    Queries take the live snapshot once and use it until they finish, so
+    publishing a new snapshot never changes what an in-flight query sees.
+    Only the ingest that builds a snapshot modifies it, before publishing.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        directory: str,
+        index=None,
+        page_node_ids: Optional[Dict[str, Dict[int, List[str]]]] = None,
+        bm25: Optional[BM25Index] = None,
+        vector_dtype: str = VECTOR_DTYPE,
+    ):
+        self.version = version
+        self.directory = directory
+        self.index = index
+        self.page_node_ids = page_node_ids or {}
+        self.bm25 = bm25 or BM25Index()  # keyword side of hybrid retrieval
+        self.vector_dtype = vector_dtype
+        # Query engine built on first use and reused for this version
+        self.engine = None
+        self.engine_lock = threading.Lock()
+
+    @property
+    def page_lookup_path(self) -> str:
+        # Keyed by file, then page; page_lookup.json of older versions is
+        # keyed by page only and is ignored
+        return os.path.join(self.directory, "file_page_lookup.json")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "ingest_manifest.json")
+
+    @property
+    def bm25_path(self) -> str:
+        return os.path.join(self.directory, "bm25.json")
+
+    @classmethod
+    def load(
+        cls, version: int, directory: str, embed_model, vector_dtype: str
+    ) -> "IndexSnapshot":
+        """Loads the index persisted in directory; its index is None if none is."""
+        snapshot = cls(version, directory, vector_dtype=vector_dtype)
+        if has_binary_store(directory):
+            print(f"Loading index version {version} from {directory}")
+            snapshot.index = load_index_from_storage(
+                binary_storage_context(directory, dtype=vector_dtype),
+                index_id="vector_index",
+                embed_model=embed_model,
+            )
+        elif has_json_store(directory):
+            # Index persisted with the default JSON stores: convert it once
+            snapshot.index = migrate_json_store(
+                directory, "vector_index", embed_model, dtype=vector_dtype
+            )
+        else:
+            return snapshot
+
+        if os.path.exists(snapshot.page_lookup_path):
+            with open(snapshot.page_lookup_path, "r") as f:
+                snapshot.page_node_ids = {
+                    file_name: {int(page): node_ids for page, node_ids in pages.items()}
+                    for file_name, pages in json.load(f).items()
+                }
+        else:
+            # Indexes persisted before the lookup existed: build it once
+            snapshot.page_node_ids = build_page_lookup(
+                snapshot.index.docstore.docs.values()
+            )
+            snapshot.save_page_lookup()
+
+        if os.path.exists(snapshot.bm25_path):
+            snapshot.bm25 = BM25Index.load(snapshot.bm25_path)
+        else:
+            # Indexes persisted before the keyword index was: build it once
+            snapshot.bm25 = BM25Index.from_nodes(snapshot.index.docstore.docs.values())
+            snapshot.bm25.save(snapshot.bm25_path)
+        return snapshot
+
+    def insert_nodes(self, text_nodes, embed_model):
+        if self.index is None:
+            print("Creating a fresh index...")
+            self.index = VectorStoreIndex(
+                text_nodes,
+                storage_context=binary_storage_context(
+                    self.directory, dtype=self.vector_dtype
+                ),
+                embed_model=embed_model,
+            )
+            self.index.set_index_id("vector_index")
+        else:
+            # Add nodes to existing index - use insert_nodes instead of insert
+            self.index.insert_nodes(text_nodes)
+
+        self.bm25.add(text_nodes)
+        merge_page_lookup(self.page_node_ids, build_page_lookup(text_nodes))
+
+    def delete_nodes(self, node_ids: List[str]):
+        if not node_ids or self.index is None:
+            return
+        self.index.delete_nodes(node_ids, delete_from_docstore=True)
+        self.bm25.remove(node_ids)
+
+        stale = set(node_ids)
+        for file_name, pages in list(self.page_node_ids.items()):
+            for page in list(pages):
+                kept = [n for n in pages[page] if n not in stale]
+                if kept:
+                    pages[page] = kept
+                else:
+                    del pages[page]
+            if not pages:
+                del self.page_node_ids[file_name]
 
-    similarity_scores = cosine_similarity([response_embedding], node_embeddings)[0]
+    def persist(self):
+        self.index.storage_context.persist(self.directory)
+        self.save_page_lookup()
+        self.bm25.save(self.bm25_path)
 
-    confidence_score = similarity_scores.mean()
+    def save_page_lookup(self):
+        with open(self.page_lookup_path, "w") as f:
+            json.dump(self.page_node_ids, f)
 
-    return confidence_score
+    def node_embeddings(self, node_ids: List[str]):
+        """Stored embeddings of nodes, used to drop near-duplicate context."""
+        vector_store = self.index.vector_store
+        if not hasattr(vector_store, "get_embeddings"):
+            raise ValueError("vector store doesn't expose stored embeddings")
+        return vector_store.get_embeddings(node_ids)
 
 
 class RAGPipeline:
@@ -380,6 +1134,8 @@ class RAGPipeline:
         input_scanners: List[Callable[[str], dict]] = None,
         output_scanners: List[Callable[[str], dict]] = None,
         max_metadata_len: int = 512,  # Add this line
+        vector_dtype: str = VECTOR_DTYPE,
+        shard: str = "",
     ):
         """
         Initializes the RAG pipeline.
@@ -392,6 +1148,9 @@ class RAGPipeline:
             input_scanners (list): List of input scanner functions.
             output_scanners (list): List of output scanner functions.
             max_metadata_len (int): Limit on metadata length.
+            vector_dtype (str): "float32" or "int8" storage for new vector stores.
+            shard (str): Tenant shard id, "" for the default index. Keeps the
+                shard's cached answers apart from other indexes'.
         """
         self.storage_dir = storage_dir
         self.image_dir = image_dir
@@ -405,185 +1164,816 @@ class RAGPipeline:
             guardrail_toxicLanguage
         ]  # Default output scanners
         self.max_metadata_len = max_metadata_len
+        self.vector_dtype = vector_dtype
+        self.shard = shard
+        # Semantic cache entries aren't keyed by index, so each shard has its
+        # own, released with the shard
+        self.semantic_cache = semantic_cache if not shard else new_semantic_cache()
         # Create the directories
         if not os.path.exists(self.storage_dir):
             os.makedirs(self.storage_dir)
         if not os.path.exists(self.image_dir):
             os.makedirs(self.image_dir)
 
-        self.index = None  # Will be loaded or created in ingest_data
+        # Live index snapshot, loaded or created in ingest_data. Ingestion
+        # builds the next version on the side and swaps it in atomically
+        self.versions = IndexVersions(self.storage_dir)
+        self.index_version_path = os.path.join(self.storage_dir, "index_version.txt")
+        self._snapshot: Optional[IndexSnapshot] = None
+        # Recently live snapshots, for rollback and in-flight queries
+        self._recent: "OrderedDict[int, IndexSnapshot]" = OrderedDict()
+        self._ingest_lock = threading.Lock()
 
         # Set environment variables (important for LlamaParse)
         os.environ["GOOGLE_API_KEY"] = self.google_api_key
         os.environ["GEMINI_API_KEY"] = self.google_api_key
 
-        # LLM Initialization (Moved here to ensure proper initialization)
-        self.llm = GoogleGenAI(model_name="models/gemini-2.0-flash")
+        # Shared models from the process-wide registry; the same Gemini client
+        # serves both text and multi-modal completions
+        self.llm = get_llm()
         Settings.llm = self.llm
+        self.gemini_multimodal = self.llm
 
-        # Set up multi-modal LLM
-        self.gemini_multimodal = GoogleGenAI(model_name="models/gemini-2.0-flash")
-
-        # Embedding Model
-        self.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+        self.embed_model = get_embed_model()
+        Settings.embed_model = self.embed_model
+        self.reranker = get_reranker()
 
-    def ingest_data(self, data_dir: str):
+    def ingest_data(
+        self,
+        data_dir: str,
+        max_workers: int = INGEST_WORKERS,
+        progress_callback: Optional[Callable[[str, str, dict], None]] = None,
+    ):
         """
         Ingests all PDF files from the given directory into the RAG pipeline.
-        """
-        pdf_files = [f for f in Path(data_dir).glob("*.pdf")]
 
-        if not pdf_files:
-            print(f"No PDF files found in {data_dir}")
-            return
+        Only files that were added, changed or removed since the last ingest
+        (by content hash, see IngestManifest) touch the index: stale nodes
+        are deleted before the new ones are inserted. Changes are applied to
+        a new index version built on the side (see IndexVersions), which is
+        published atomically once persisted; queries keep using the live
+        version meanwhile and in-flight ones finish on it. Files are parsed
+        concurrently, their nodes are embedded in batches that span files
+        (see EmbeddingStage), and index updates and persistence stay
+        serialized on the calling thread.
 
-        # Load existing index or create a new one
-        try:
-            if os.path.exists(self.storage_dir):
-                print(f"Loading existing index from {self.storage_dir}")
-                storage_context = StorageContext.from_defaults(
-                    persist_dir=self.storage_dir
-                )
-                self.index = load_index_from_storage(
-                    storage_context,
-                    index_id="vector_index",
-                    embed_model=self.embed_model,
-                )
-            else:
-                print("Creating a new index...")
-                self.index = None  # Start with an empty index
-                # Ensure the directory exists
-                os.makedirs(self.storage_dir, exist_ok=True)
+        Args:
+            data_dir (str): Directory containing the PDF files.
+            max_workers (int): Number of files parsed at the same time.
+            progress_callback (callable): Called as (file_path, status, details)
+                whenever a file changes status: "skipped", "removed", "queued",
+                "parsing", "embedding", "indexing", "done" or "failed".
+                Defaults to printing.
 
-        except Exception as e:
-            print(f"Error loading or creating index: {e}")
-            self.index = None
-
-        # Track already ingested files using a simple file-based approach
-        ingested_files_path = os.path.join(self.storage_dir, "ingested_files.txt")
-        ingested_files = set()
-
-        # Load list of already ingested files if it exists
-        if os.path.exists(ingested_files_path):
-            with open(ingested_files_path, "r") as f:
-                ingested_files = set(line.strip() for line in f.readlines())
-
-        # Ingest new documents
-        newly_ingested = False
-        for pdf_file in pdf_files:
-            file_path_str = str(pdf_file)
-            if file_path_str in ingested_files:
-                print(f"Skipping already ingested file: {pdf_file}")
-                continue
+        Returns:
+            dict: Summary with the per-kind file counts, whether the index
+                changed and was saved, and embedding throughput.
 
-            print(f"Processing file: {pdf_file}")
-            try:
-                # Parse document
-                docs_text, md_json_list, _ = parse_document(
-                    file_path_str, self.llama_api_key
-                )
+        Raises:
+            Exception: The error that failed persisting or publishing the new
+                version; the live version is left as it was.
+        """
+        # One build at a time; queries don't take this lock
+        with self._ingest_lock:
+            return self._ingest_data(data_dir, max_workers, progress_callback)
 
-                # Create the image directory if it doesn't exist
-                data_images_path = Path(self.image_dir)
-                data_images_path.mkdir(parents=True, exist_ok=True)
+    def _ingest_data(self, data_dir, max_workers, progress_callback):
+        report = progress_callback or print_ingest_progress
 
-                # Get text nodes
-                text_nodes = get_text_nodes(
-                    docs_text,
-                    image_dir=self.image_dir,
-                    json_dicts=md_json_list,
-                    max_metadata_len=self.max_metadata_len,
-                )
+        # Load the live index version if it isn't loaded yet
+        if self._snapshot is None:
+            try:
+                self.load_index()
+            except Exception as e:
+                print(f"Error loading or creating index: {e}")
 
-                # Add file name metadata to each node
-                for node in text_nodes:
-                    node.metadata["file_name"] = file_path_str
+        base = self._snapshot
+        manifest = self._load_manifest(base)
+        file_hashes = {
+            str(pdf_file): file_sha256(str(pdf_file))
+            for pdf_file in Path(data_dir).glob("*.pdf")
+        }
 
-                if self.index is None:
-                    print("Creating a fresh index...")
-                    self.index = VectorStoreIndex(
-                        text_nodes, embed_model=self.embed_model
-                    )
-                    self.index.set_index_id("vector_index")
-                else:
-                    print("Updating existing index...")
-                    # Add nodes to existing index - use insert_nodes instead of insert
-                    self.index.insert_nodes(text_nodes)
+        if not file_hashes and not manifest.files:
+            print(f"No PDF files found in {data_dir}")
+            return {"files": 0, "index_changed": False, "saved": False}
 
-                # Mark this file as ingested
-                ingested_files.add(file_path_str)
-                newly_ingested = True
+        added, changed, removed, unchanged = manifest.diff(file_hashes)
+        print(
+            f"Ingest diff: {len(added)} added, {len(changed)} changed, "
+            f"{len(removed)} removed, {len(unchanged)} unchanged"
+        )
 
+        # Create the image directory if it doesn't exist
+        Path(self.image_dir).mkdir(parents=True, exist_ok=True)
+
+        index_changed = False
+        for file_path_str in unchanged:
+            print(f"Skipping already ingested file: {file_path_str}")
+            report(file_path_str, "skipped", {})
+
+        # Work on the next version; the live one is left untouched
+        build = None
+        if added or changed or removed:
+            build = self._begin_version(base)
+            manifest.path = build.manifest_path
+
+        # Files that no longer exist: drop their nodes
+        for file_path_str in removed:
+            build.delete_nodes(manifest.remove(file_path_str))
+            index_changed = True
+            report(file_path_str, "removed", {})
+
+        new_files = added + changed
+        for file_path_str in new_files:
+            report(file_path_str, "queued", {})
+
+        embedder = EmbeddingStage(self.embed_model)
+        # (file_path_str, text_nodes, page_images, parse_seconds) awaiting insert
+        pending = []
+
+        def index_file(file_path_str, text_nodes, page_images, parse_seconds):
+            nonlocal index_changed
+            try:
+                report(file_path_str, "indexing", {"nodes": len(text_nodes)})
+                start = time.perf_counter()
+                # Stale nodes of a changed file go before the new ones
+                build.delete_nodes(manifest.node_ids(file_path_str))
+                build.insert_nodes(text_nodes, self.embed_model)
+
+                manifest.record(
+                    file_path_str,
+                    file_hashes[file_path_str],
+                    [node.node_id for node in text_nodes],
+                    images=page_images,
+                )
+                index_changed = True
+                report(
+                    file_path_str,
+                    "done",
+                    {
+                        "nodes": len(text_nodes),
+                        "parse_seconds": parse_seconds,
+                        "index_seconds": time.perf_counter() - start,
+                    },
+                )
             except Exception as e:
-                print(f"Error processing file {pdf_file}: {e}")
-                continue
+                print(f"Error indexing file {file_path_str}: {e}")
+                report(file_path_str, "failed", {"error": str(e)})
 
-        # Save the updated index to disk if any new files were ingested
-        if newly_ingested:
+        def index_embedded(nodes=(), flush=False):
+            # Embedding batches span files; a file is inserted once all of
+            # its nodes have been embedded
             try:
-                self.index.storage_context.persist(self.storage_dir)
-                print(f"Index saved to {self.storage_dir}")
+                embedder.add(nodes)
+                if flush:
+                    embedder.flush()
+            except Exception as e:
+                print(f"Error embedding nodes: {e}")
+                for file_path_str, *_ in pending:
+                    report(file_path_str, "failed", {"error": str(e)})
+                pending.clear()
+                embedder.clear()
+                return
+
+            for item in list(pending):
+                if all(node.embedding is not None for node in item[1]):
+                    pending.remove(item)
+                    index_file(*item)
+
+        # Ingest new and changed documents: parse in parallel, embed in
+        # batches and update the index one file at a time on this thread
+        with ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="ingest"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._parse_file,
+                    file_path_str,
+                    file_hashes[file_path_str],
+                    report,
+                ): file_path_str
+                for file_path_str in new_files
+            }
+            for future in as_completed(futures):
+                file_path_str = futures[future]
+                try:
+                    text_nodes, page_images, parse_seconds = future.result()
+                except Exception as e:
+                    print(f"Error processing file {file_path_str}: {e}")
+                    report(file_path_str, "failed", {"error": str(e)})
+                    continue
+
+                report(file_path_str, "embedding", {"nodes": len(text_nodes)})
+                pending.append(
+                    (file_path_str, text_nodes, page_images, parse_seconds)
+                )
+                index_embedded(text_nodes)
 
-                # Update the list of ingested files
-                with open(ingested_files_path, "w") as f:
-                    for file_path in ingested_files:
-                        f.write(f"{file_path}\n")
+        index_embedded(flush=True)
+        if embedder.batches:
+            print(f"[embed] {embedder.summary()}")
+
+        # Save the updated index to disk if anything changed
+        saved = False
+        if index_changed and build.index is not None:
+            try:
+                build.persist()
+                manifest.save()
+                print(f"Index saved to {build.directory}")
+                self._publish(build)
+                saved = True
 
             except Exception as e:
                 print(f"Error saving index to disk: {e}")
+                # Unless it already went live, the live version stays as it
+                # was; the error fails the ingest job
+                if self.versions.current() != build.version:
+                    self.versions.discard(build.version)
+                raise
+        if build is not None and not saved:
+            # Nothing to publish: the live version stays as it was
+            self.versions.discard(build.version)
+
+        summary = {
+            "files": len(file_hashes),
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+            "unchanged": len(unchanged),
+            "index_changed": index_changed,
+            "saved": saved,
+            "index_version": self.index_version,
+            "embedding": embedder.summary(),
+        }
+        return summary
+
+    def _parse_file(self, file_path_str: str, file_hash: str, report):
+        """Parses one PDF into text nodes. Runs on an ingest worker thread."""
+        report(file_path_str, "parsing", {})
+        start = time.perf_counter()
+
+        # Parse document
+        docs_text, md_json_list, image_dicts = parse_document(
+            file_path_str,
+            self.llama_api_key,
+            image_dir=self.image_dir,
+            file_hash=file_hash,
+        )
+        # Only this document's images, instead of listing the image directory
+        page_images = page_image_manifest(image_dicts)
+        # Pre-generate the downscaled variants sent at query time
+        for paths in page_images.values():
+            for image_path in paths:
+                try:
+                    THUMBNAIL_CACHE.ensure_variant(image_path)
+                except OSError as e:
+                    print(f"Could not downscale {image_path}: {e}")
+
+        # Get text nodes
+        text_nodes = get_text_nodes(
+            docs_text,
+            page_images=page_images,
+            json_dicts=md_json_list,
+            max_metadata_len=self.max_metadata_len,
+        )
+
+        # Add file name metadata to each node
+        for node in text_nodes:
+            node.metadata["file_name"] = file_path_str
+
+        return text_nodes, page_images, time.perf_counter() - start
+
+    @property
+    def index(self):
+        """Vector index of the live snapshot, or None before the first ingest."""
+        snapshot = self._snapshot
+        return snapshot.index if snapshot else None
+
+    @property
+    def page_node_ids(self) -> Dict[str, Dict[int, List[str]]]:
+        snapshot = self._snapshot
+        return snapshot.page_node_ids if snapshot else {}
+
+    @property
+    def index_version(self) -> int:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot.version
+        current = self.versions.current()
+        return current if current is not None else self._read_index_version()
+
+    def cache_scope(self, file_names: Optional[List[str]] = None) -> str:
+        """
+        Answer cache scope of a query against this index: index versions
+        of different shards overlap, so the shard id is part of it.
+        """
+        scope = scope_key(file_names)
+        return f"{self.shard}/{scope}" if self.shard else scope
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory held by the index versions kept in memory (the
+        live one and the recent ones kept for rollback): vectors and BM25.
+        """
+        snapshots = {id(s): s for s in (self._snapshot, *self._recent.values())}
+        size = 0
+        for snapshot in snapshots.values():
+            if snapshot is None or snapshot.index is None:
+                continue
+            vector_store = snapshot.index.vector_store
+            size += snapshot.bm25.memory_bytes()
+            if hasattr(vector_store, "memory_bytes"):
+                size += vector_store.memory_bytes()
+        return size
+
+    def _live_snapshot(self) -> IndexSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.index is None:
+            raise ValueError("Index not initialized.  Call ingest_data() first.")
+        return snapshot
+
+    def _load_manifest(self, base: Optional[IndexSnapshot]) -> IngestManifest:
+        if base is None:
+            # Nothing persisted yet; the path is set to the new version's
+            return IngestManifest(None)
+        if os.path.exists(base.manifest_path):
+            return IngestManifest.load(base.manifest_path)
+        # Index ingested before manifests existed
+        print("Building ingest manifest from the existing index...")
+        return IngestManifest.from_nodes(
+            base.manifest_path, base.index.docstore.docs.values()
+        )
+
+    def load_index(self):
+        """
+        Loads the published index version (or an index persisted directly in
+        storage_dir before versions existed) and makes it live.
+
+        Returns:
+            VectorStoreIndex: The loaded index, or None if nothing is persisted.
+        """
+        current = self.versions.current()
+        if current is not None:
+            snapshot = IndexSnapshot.load(
+                current,
+                self.versions.path(current),
+                self.embed_model,
+                self.vector_dtype,
+            )
+        else:
+            snapshot = IndexSnapshot.load(
+                self._read_index_version(),
+                self.storage_dir,
+                self.embed_model,
+                self.vector_dtype,
+            )
+
+        if snapshot.index is None:
+            print("Creating a new index...")
+            return None
+        self._activate(snapshot)
+        return snapshot.index
+
+    def _read_index_version(self) -> int:
+        # Version counter of indexes persisted before version directories
+        if os.path.exists(self.index_version_path):
+            with open(self.index_version_path, "r") as f:
+                return int(f.read().strip() or 0)
+        return 0
+
+    def _begin_version(self, base: Optional[IndexSnapshot]) -> IndexSnapshot:
+        """
+        Creates the next index version on the side as a copy of base. The live
+        snapshot keeps serving queries until the new one is published.
+        """
+        version = max(self.versions.list() + [self.index_version]) + 1
+        directory = self.versions.create(
+            version, base.directory if base is not None else None
+        )
+        print(f"Building index version {version} in {directory}")
+        if base is None:
+            return IndexSnapshot(version, directory, vector_dtype=self.vector_dtype)
+        return IndexSnapshot.load(
+            version, directory, self.embed_model, self.vector_dtype
+        )
+
+    def _activate(self, snapshot: IndexSnapshot):
+        # A single reference assignment: queries see either version, never a mix
+        self._snapshot = snapshot
+        self._recent[snapshot.version] = snapshot
+        self._recent.move_to_end(snapshot.version)
+        while len(self._recent) > INDEX_KEEP_VERSIONS:
+            self._recent.popitem(last=False)
+        # Cached answers are keyed by the index version; only the semantic
+        # cache holds answers of the previous version
+        self.semantic_cache.clear()
+        print(f"Index version is now {snapshot.version}")
+
+    def _publish(self, snapshot: IndexSnapshot):
+        """Makes a fully persisted snapshot the live index version."""
+        self.versions.publish(snapshot.version)
+        self._activate(snapshot)
+        self.versions.prune(INDEX_KEEP_VERSIONS)
+        # Pruning goes by version number, _recent by activation order
+        kept = set(self.versions.list())
+        for version in [v for v in self._recent if v not in kept]:
+            del self._recent[version]
+
+    def rollback(self, version: Optional[int] = None) -> int:
+        """
+        Makes an earlier index version live again.
+
+        Args:
+            version (int): Version to restore. Defaults to the newest version
+                older than the live one.
+
+        Returns:
+            int: The version that is now live.
+        """
+        with self._ingest_lock:
+            if version is None:
+                older = [v for v in self.versions.list() if v < self.index_version]
+                if not older:
+                    raise ValueError("No earlier index version to roll back to")
+                version = older[-1]
+
+            # A version still in memory may have been pruned from disk;
+            # CURRENT must never name a deleted directory
+            if version not in self.versions.list():
+                self._recent.pop(version, None)
+                raise ValueError(f"Index version {version} not found")
+            snapshot = self._recent.get(version)
+            if snapshot is None:
+                snapshot = IndexSnapshot.load(
+                    version,
+                    self.versions.path(version),
+                    self.embed_model,
+                    self.vector_dtype,
+                )
+            if snapshot.index is None:
+                raise ValueError(f"Index version {version} is empty")
+
+            self.versions.publish(version)
+            self._activate(snapshot)
+            return version
+
+    def _cached_response(self, query_str: str, index_version: int, scope: str = ""):
+        """
+        Looks the query up in the answer cache, then (for unscoped queries)
+        the semantic cache. Semantic hits are only served to questions that
+        pass the input scanners.
+
+        Returns:
+            tuple: (cached Response or None, query embedding or None)
+        """
+        cached_response = answer_cache.get(
+            "pipeline", query_str, index_version, PROMPT_VERSION, scope
+        )
+        QUERY_METRICS.count_cache("pipeline", bool(cached_response))
+        if cached_response:
+            print("Loading response from cache...")
+            return response_from_cache(cached_response), None
+        if scope:
+            # Semantic cache entries don't record the scope they answered
+            return None, None
+
+        query_embedding = self.semantic_cache.embed(query_str)
+        cached_response = self.semantic_cache.lookup(query_embedding)
+        if cached_response is not None:
+            # Unlike an exact hit, this phrasing never went through the input
+            # guardrails; a blocked one is left to the engine to refuse
+            input_detected, _ = InputScanner(query_str, self.input_scanners)
+            if input_detected:
+                print("Semantic cache hit rejected by the input scanners")
+                cached_response = None
+        QUERY_METRICS.count_cache("semantic", cached_response is not None)
+        if cached_response is not None:
+            print("Loading response from semantic cache...")
+        return cached_response, query_embedding
+
+    @staticmethod
+    def _observe(start: float, response: Optional[Response] = None):
+        """
+        Records a query's latency since `start`: a cache hit when no engine
+        response is given, otherwise a miss along with its stage timings.
+        """
+        ms = (time.perf_counter() - start) * 1000
+        if response is None:
+            QUERY_METRICS.observe_query(ms, "hit")
+            return
+        QUERY_METRICS.observe_query(ms, "miss")
+        QUERY_METRICS.observe_stages(response.metadata.get("timings"))
 
-    def query(self, query_str: str):
+    def _store_response(
+        self,
+        query_str: str,
+        query_embedding,
+        response: Response,
+        index_version: int,
+        scope: str = "",
+    ):
+        answer_cache.set(
+            "pipeline",
+            query_str,
+            index_version,
+            PROMPT_VERSION,
+            response_to_cache(response),
+            scope,
+        )
+        # Only successful answers of the live version may be served to other
+        # phrasings; a query that outlived a swap must not repopulate it
+        if (
+            not scope
+            and response.metadata.get("response_status") == "success"
+            and index_version == self.index_version
+        ):
+            self.semantic_cache.add(query_str, query_embedding, response)
+
+    def _query_engine(self, snapshot: IndexSnapshot):
+        """
+        Returns (engine, build_ms): the query engine of a snapshot, built once
+        per index version and reused by every query against it. build_ms is
+        0 when the engine was reused.
+        """
+        with snapshot.engine_lock:
+            if snapshot.engine is not None:
+                return snapshot.engine, 0.0
+
+            start = time.perf_counter()
+            snapshot.engine = MultimodalQueryEngine(
+                retriever=self._retriever(snapshot),
+                multi_modal_llm=self.gemini_multimodal,
+                input_scanners=self.input_scanners,
+                output_scanners=self.output_scanners,
+                context_builder=ContextBuilder(
+                    token_budget=CONTEXT_TOKEN_BUDGET,
+                    dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD,
+                    encoding_name=TOKEN_ENCODING,
+                    embeddings_fn=snapshot.node_embeddings,
+                ),
+            )
+            build_ms = (time.perf_counter() - start) * 1000
+            print(f"Built query engine for index version {snapshot.version}")
+            return snapshot.engine, build_ms
+
+    def _retriever(self, snapshot: IndexSnapshot, file_names=None):
+        """Returns a hybrid retriever over a snapshot, scoped to file_names."""
+        return build_hybrid_retriever(
+            snapshot.index,
+            snapshot.bm25,
+            reranker=self.reranker,
+            filters=scope_filters(file_names),
+            candidate_k=RETRIEVAL_CANDIDATES,
+            cutoff=RERANK_CUTOFF,
+            max_k=RETRIEVAL_MAX_K,
+        )
+
+    def _scoped_engine(self, snapshot: IndexSnapshot, file_names=None):
+        """
+        Returns (engine, build_ms) like `_query_engine`. A scoped query gets
+        a shallow copy of the shared engine with a retriever restricted to
+        its files; the models and context builder stay shared.
+        """
+        engine, build_ms = self._query_engine(snapshot)
+        if file_names is None:
+            return engine, build_ms
+        start = time.perf_counter()
+        scoped = engine.model_copy(
+            update={"retriever": self._retriever(snapshot, file_names)}
+        )
+        return scoped, build_ms + (time.perf_counter() - start) * 1000
+
+    def query(self, query_str: str, files: Optional[List[str]] = None):
         """
         Queries the RAG pipeline with the given query string.
 
         Args:
             query_str (str): The query string.
+            files (list): Only retrieve from these files (paths, names or
+                URLs); None searches the whole index.
 
         Returns:
             Response: The response object from the query engine.
         """
-        if self.index is None:
-            raise ValueError("Index not initialized.  Call ingest_data() first.")
+        start = time.perf_counter()
+        snapshot = self._live_snapshot()
+        file_names = scope_file_names(files)
+        scope = self.cache_scope(file_names)
 
-        cached_response = query_cache.get(query_str)
-        if cached_response:
-            print("Loading response from cache...")
+        cached_response, query_embedding = self._cached_response(
+            query_str, snapshot.version, scope
+        )
+        if cached_response is not None:
+            self._observe(start)
             return cached_response
 
-        query_engine = MultimodalQueryEngine(
-            retriever=self.index.as_retriever(similarity_top_k=9),
-            multi_modal_llm=self.gemini_multimodal,
-            input_scanners=self.input_scanners,
-            output_scanners=self.output_scanners,
+        engine, build_ms = self._scoped_engine(snapshot, file_names)
+        response = engine.query(query_str)
+        add_timing(response, "engine_build_ms", build_ms)
+        response.metadata["index_version"] = snapshot.version
+        response.metadata["scope"] = file_names
+        self._store_response(
+            query_str, query_embedding, response, snapshot.version, scope
         )
 
-        response = query_engine.query(query_str)
+        self._observe(start, response)
+        return response
+
+    async def aquery(self, query_str: str, files: Optional[List[str]] = None):
+        """
+        Async variant of `query` that never blocks the event loop.
+
+        Args:
+            query_str (str): The query string.
+            files (list): Only retrieve from these files, see `query`.
+
+        Returns:
+            Response: The response object from the query engine.
+        """
+        start = time.perf_counter()
+        snapshot = self._live_snapshot()
+        file_names = scope_file_names(files)
+        scope = self.cache_scope(file_names)
 
-        query_cache.set(query_str, response, expire=3600)  # Cache for 1 hour
+        cached_response, query_embedding = await run_blocking(
+            self._cached_response, query_str, snapshot.version, scope
+        )
+        if cached_response is not None:
+            self._observe(start)
+            return cached_response
 
+        # Resolving a scope reads the metadata index, keep it off the loop
+        engine, build_ms = await run_blocking(self._scoped_engine, snapshot, file_names)
+        response = await engine.aquery(query_str)
+        add_timing(response, "engine_build_ms", build_ms)
+        response.metadata["index_version"] = snapshot.version
+        response.metadata["scope"] = file_names
+        await run_blocking(
+            self._store_response,
+            query_str,
+            query_embedding,
+            response,
+            snapshot.version,
+            scope,
+        )
+
+        self._observe(start, response)
         return response
 
+    def stream_query(self, query_str: str, files: Optional[List[str]] = None):
+        """
+        Streams a query as (event, payload) pairs, see
+        `MultimodalQueryEngine.stream_query`. Cached answers are replayed as
+        a single token. `files` scopes retrieval as in `query`.
+        """
+        start = time.perf_counter()
+        snapshot = self._live_snapshot()
+        file_names = scope_file_names(files)
+        scope = self.cache_scope(file_names)
+
+        cached_response, query_embedding = self._cached_response(
+            query_str, snapshot.version, scope
+        )
+        if cached_response is not None:
+            self._observe(start)
+            yield "sources", cached_response.source_nodes
+            yield "token", str(cached_response.response)
+            yield "final", cached_response
+            return
+
+        engine, build_ms = self._scoped_engine(snapshot, file_names)
+        for event, payload in engine.stream_query(query_str):
+            if event == "final":
+                add_timing(payload, "engine_build_ms", build_ms)
+                payload.metadata["index_version"] = snapshot.version
+                payload.metadata["scope"] = file_names
+                self._store_response(
+                    query_str, query_embedding, payload, snapshot.version, scope
+                )
+                self._observe(start, payload)
+            yield event, payload
+
+    async def abatch_query(
+        self, query_strs: List[str], max_concurrency: int = BATCH_LLM_CONCURRENCY
+    ) -> list:
+        """
+        Answers many queries against one index version, see
+        `MultimodalQueryEngine.abatch_query`. Questions are embedded in a
+        single batch and repeated questions are answered once.
+
+        Returns:
+            list: One Response or Exception per query, in input order.
+        """
+        start = time.perf_counter()
+        snapshot = self._live_snapshot()
+        results: list = [None] * len(query_strs)
+
+        # Exact answer cache only: the semantic cache would embed each
+        # question separately
+        cached = await asyncio.gather(
+            *(
+                run_blocking(
+                    answer_cache.get,
+                    "pipeline",
+                    q,
+                    snapshot.version,
+                    PROMPT_VERSION,
+                    self.cache_scope(),
+                )
+                for q in query_strs
+            )
+        )
+        positions: Dict[str, List[int]] = {}
+        for i, (query_str, cached_response) in enumerate(zip(query_strs, cached)):
+            QUERY_METRICS.count_cache("pipeline", bool(cached_response))
+            if cached_response:
+                results[i] = response_from_cache(cached_response)
+                self._observe(start)
+            else:
+                positions.setdefault(query_str, []).append(i)
+        if not positions:
+            return results
+
+        unique = list(positions)
+        build_ms = 0.0
+        embed_timings = {}
+        try:
+            # Single queries embed inside the retriever, so this counts as
+            # retrieval time
+            with stage_timer(embed_timings, "retrieval_ms"):
+                embeddings = await run_blocking(embed_queries, self.embed_model, unique)
+            engine, build_ms = await run_blocking(self._query_engine, snapshot)
+            responses = await engine.abatch_query(
+                unique, embeddings, max_concurrency=max_concurrency
+            )
+        except Exception as e:
+            responses = [e] * len(unique)
+
+        for query_str, response in zip(unique, responses):
+            if isinstance(response, Response):
+                add_timing(response, "engine_build_ms", build_ms)
+                timings = response.metadata["timings"]
+                if "retrieval_ms" in timings:
+                    timings["retrieval_ms"] = round(
+                        timings["retrieval_ms"] + embed_timings["retrieval_ms"], 3
+                    )
+                response.metadata["index_version"] = snapshot.version
+                await run_blocking(
+                    answer_cache.set,
+                    "pipeline",
+                    query_str,
+                    snapshot.version,
+                    PROMPT_VERSION,
+                    response_to_cache(response),
+                    self.cache_scope(),
+                )
+            for i in positions[query_str]:
+                results[i] = response
+                if isinstance(response, Response):
+                    self._observe(start, response)
+        return results
+
     def get_confidence_score(self, response: Response):
         """
-        Calculates the confidence score for a given response.
+        Calculates the confidence score for a given response, against the
+        index version that produced it when that version is still loaded.
         """
-        if self.index is None:
-            raise ValueError("Index not initialized. Call ingest_data() first.")
-        return get_confidence_score(response, self.index)
+        snapshot = self._live_snapshot()
+        version = (response.metadata or {}).get("index_version")
+        snapshot = self._recent.get(version, snapshot)
+        return get_confidence_score(response, snapshot.index, snapshot.page_node_ids)
 
 
 # Global variables
 RAG_PIPELINE = None  # Global RAG pipeline instance
+# Serializes initialization: concurrent first callers must not each load (or
+# migrate) the same index directory
+RAG_PIPELINE_LOCK = threading.Lock()
 DATA_DIRECTORY = "_data/files"  # Global data directory
 VECTOR_DIRECTORY = "_data/vector"  # Global vector directory
 IMAGE_DIRECTORY = "_data/data_images"  # New global image directory
+# Per-tenant index shards, each with its own files/ and vector/ directories.
+# Page images stay in IMAGE_DIRECTORY, which is what /data_images serves
+SHARDS_DIRECTORY = os.environ.get("RAG_SHARDS_DIR", "_data/shards")
+SHARD_MEMORY_BUDGET_MB = int(os.environ.get("RAG_SHARD_MEMORY_MB", 1024))
+SHARD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
 
 
 def initialize_rag_pipeline():
-    """Initializes the RAG pipeline, loading from storage if it exists."""
+    """
+    Initializes the RAG pipeline, loading from storage if it exists. Safe to
+    call concurrently: one caller builds and loads the pipeline, the others
+    wait for it, and the global is only set once the index is loaded.
+    """
     global RAG_PIPELINE
 
-    if RAG_PIPELINE is None:
+    if RAG_PIPELINE is not None:
+        return
+    with RAG_PIPELINE_LOCK:
+        if RAG_PIPELINE is not None:
+            return
+
         # Ensure vector directory exists
         if not os.path.exists(VECTOR_DIRECTORY):
             os.makedirs(VECTOR_DIRECTORY)
@@ -592,20 +1982,78 @@ def initialize_rag_pipeline():
         if not os.path.exists(IMAGE_DIRECTORY):
             os.makedirs(IMAGE_DIRECTORY)
 
-        RAG_PIPELINE = RAGPipeline(
+        pipeline = RAGPipeline(
             storage_dir=VECTOR_DIRECTORY, image_dir=IMAGE_DIRECTORY
         )  # Instantiate with the image directory
 
         # Check if the index already exists
-        if os.path.exists(RAG_PIPELINE.storage_dir):
+        if os.path.exists(pipeline.storage_dir):
             print("Loading existing index...")
+            try:
+                pipeline.load_index()
+            except Exception as e:
+                print(f"Error loading index: {e}")
         else:
             print("No existing index found. Ingesting data for the first time...")
-            ingest()  # Call ingest here to create the initial index
+            try:
+                pipeline.ingest_data(DATA_DIRECTORY)
+            except Exception as e:
+                print(f"Error during ingestion: {e}")
+        RAG_PIPELINE = pipeline
         print("RAG pipeline initialized.")
 
 
-def ingest():
+def shard_directory(tenant: str, must_exist: bool = False) -> str:
+    """
+    Returns a tenant's shard directory. Raises ValueError for invalid ids and,
+    with must_exist, KeyError for tenants that never ingested anything (the
+    directory is only created by `submit_ingest`).
+    """
+    if not SHARD_ID_PATTERN.match(tenant or ""):
+        raise ValueError(f"Invalid tenant id: {tenant!r}")
+    directory = os.path.join(SHARDS_DIRECTORY, tenant)
+    if must_exist and not os.path.isdir(directory):
+        raise KeyError(f"Unknown tenant: {tenant}")
+    return directory
+
+
+def _load_shard(tenant: str) -> RAGPipeline:
+    directory = shard_directory(tenant, must_exist=True)
+    pipeline = RAGPipeline(
+        storage_dir=os.path.join(directory, "vector"),
+        image_dir=IMAGE_DIRECTORY,
+        shard=tenant,
+    )
+    if pipeline.load_index() is None:
+        print(f"No index yet for tenant {tenant}")
+    return pipeline
+
+
+# Tenant shards are loaded on first query and the least recently used ones
+# are unloaded past the memory budget; models are shared between all of them
+SHARDS = IndexShardManager(
+    _load_shard,
+    lambda pipeline: pipeline.memory_bytes(),
+    SHARD_MEMORY_BUDGET_MB * 1024 * 1024,
+)
+
+
+def get_pipeline(tenant: Optional[str] = None) -> RAGPipeline:
+    """
+    Returns the pipeline serving a tenant: its shard, loaded on demand, or
+    the default pipeline when no tenant is given. Raises ValueError for an
+    invalid tenant id and KeyError for a tenant without a shard.
+    """
+    if not tenant:
+        if RAG_PIPELINE is None:
+            initialize_rag_pipeline()
+        return RAG_PIPELINE
+    # Checked before loading so unknown ids don't create shard directories
+    shard_directory(tenant, must_exist=True)
+    return SHARDS.get(tenant)
+
+
+def ingest(progress_callback=None):
     """Ingests data into the RAG pipeline."""
     global RAG_PIPELINE
 
@@ -614,18 +2062,229 @@ def ingest():
 
     try:
         print("Ingesting Data...")
-        RAG_PIPELINE.ingest_data(DATA_DIRECTORY)
+        summary = RAG_PIPELINE.ingest_data(
+            DATA_DIRECTORY, progress_callback=progress_callback
+        )
         print("Ingestion complete.")
+        return summary
     except Exception as e:
         print(f"Error during ingestion: {e}")
 
 
-def query(question: str):
+def _run_ingest_job(key, progress_callback):
+    """Runs one queued ingestion job; errors propagate to the job status."""
+    tenant, data_dir = key
+    pipeline = get_pipeline(tenant)
+
+    def report(file_path, status, details):
+        print_ingest_progress(file_path, status, details)
+        progress_callback(file_path, status, details)
+
+    summary = pipeline.ingest_data(data_dir, progress_callback=report)
+    if tenant:
+        if SHARDS.peek(tenant) is pipeline:
+            SHARDS.resize(tenant)
+        else:
+            # Evicted and reloaded during the ingest: the resident copy may
+            # predate the version just published
+            SHARDS.evict(tenant)
+    return summary
+
+
+# Background ingestion: one worker, identical queued requests share a job
+INGEST_JOBS = IngestJobQueue(_run_ingest_job)
+
+
+def submit_ingest(data_dir: str = DATA_DIRECTORY, tenant: Optional[str] = None):
+    """
+    Queues an ingestion of data_dir on the background worker. For a tenant,
+    the files/ directory of its shard is ingested into the shard instead.
+
+    Returns:
+        tuple: (job status dict, created) where created is False when the
+            request was merged into an identical job that is still queued.
+    """
+    if tenant:
+        data_dir = os.path.join(shard_directory(tenant), "files")
+        os.makedirs(data_dir, exist_ok=True)
+    job, created = INGEST_JOBS.submit((tenant or None, data_dir))
+    return job.to_dict(), created
+
+
+def rollback_index(version: Optional[int] = None, tenant: Optional[str] = None):
+    """
+    Makes an earlier index version live, by default the one before the
+    current. Returns the live version and the versions kept on disk.
+    """
+    pipeline = get_pipeline(tenant)
+    live_version = pipeline.rollback(version)
+    if tenant:
+        # A version loaded from disk for the rollback adds to the shard's size
+        SHARDS.resize(tenant)
+    return {"index_version": live_version, "versions": pipeline.versions.list()}
+
+
+def ingest_job_status(job_id: str):
+    """Returns the status dict of an ingestion job, or None if unknown."""
+    job = INGEST_JOBS.get(job_id)
+    return job.to_dict() if job else None
+
+
+def source_files_from_nodes(source_nodes):
+    """
+    Builds the "Page N from file: url" source list for a response's nodes.
+
+    Args:
+        source_nodes (list): Source nodes of a response.
+
+    Returns:
+        list: Source entries with page image paths converted to URLs.
+    """
+    # Extract source files information
+    source_files = []
+    for node in source_nodes or []:
+        if hasattr(node, "metadata") and node.metadata:
+            # Extract image path if available
+            image_path = node.metadata.get("image_path", "")
+            page_num = node.metadata.get("page_num", "unknown")
+            file_name = node.metadata.get("file_name", "unknown")
+
+            # Create a source entry with available information
+            source_entry = f"Page {page_num}"
+            if file_name != "unknown":
+                source_entry += f" from {os.path.basename(file_name)}"
+
+            if image_path:
+                # Only add if this image path hasn't been added yet
+                source_info = f"{source_entry}: {image_path}"
+                if source_info not in source_files:
+                    source_files.append(source_info)
+
+    # Parse source files and convert paths to URLs
+    source_files_urls = []
+    for source in source_files:
+        # Extract the file path part (after the colon)
+        parts = source.split(": ")
+        if len(parts) > 1:
+            source_info = parts[0]
+            file_path = parts[1].strip()
+
+            # Convert the file path to a URL
+            url = f"http://localhost:8000/data_images/{Path(file_path).name}"
+            source_files_urls.append(f"{source_info}: {url}")
+        else:
+            # If there's no colon, just add the source as is
+            source_files_urls.append(source)
+
+    return source_files_urls
+
+
+def _answer_from_response(question: str, response: Response, pipeline: RAGPipeline):
+    """
+    Turns a pipeline Response into the (response_text, confidence,
+    source_files_urls) answer returned by `query()`, and caches it.
+    """
+    # Create the response text
+    response_text = str(response)
+    source_files_urls = source_files_from_nodes(response.source_nodes)
+
+    print(f"Response: {response_text}")
+    print(f"Source files: {source_files_urls}")
+
+    # Get confidence score
+    confidence = pipeline.get_confidence_score(response)
+
+    # Cache the response, confidence, and source files under the version
+    # that answered, which may no longer be live after a swap
+    metadata = response.metadata or {}
+    answer_cache.set(
+        "answers",
+        question,
+        metadata.get("index_version", pipeline.index_version),
+        PROMPT_VERSION,
+        {
+            "response": response_text,
+            "confidence": confidence,
+            "source_files": source_files_urls,
+        },
+        pipeline.cache_scope(metadata.get("scope")),
+    )
+
+    return response_text, confidence, source_files_urls
+
+
+# Knowledge sources are read through one connection, opened on first use;
+# the lock serializes its cursor between executor threads
+KNOWLEDGE_SOURCES: Optional[IngestService] = None
+KNOWLEDGE_SOURCES_LOCK = threading.Lock()
+
+
+def get_knowledge_source(source_id: int) -> Optional[dict]:
+    """Returns a knowledge source row as a dict, or None if it doesn't exist."""
+    global KNOWLEDGE_SOURCES
+
+    with KNOWLEDGE_SOURCES_LOCK:
+        if KNOWLEDGE_SOURCES is None:
+            KNOWLEDGE_SOURCES = IngestService()
+        return KNOWLEDGE_SOURCES.get_knowledge_source(source_id)
+
+
+def resolve_scope(
+    source_id: Optional[int] = None, files: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """
+    Resolves a query scope to file names. With both a knowledge source and
+    files, only the given files that belong to the source are searched.
+
+    Args:
+        source_id (int): Id of a row in the knowledge_sources table.
+        files (list): File paths, names or URLs.
+
+    Returns:
+        list: File names to retrieve from, or None for the whole index.
+
+    Raises:
+        KeyError: If the knowledge source doesn't exist.
+        ValueError: If the scope contains no files.
+    """
+    file_names = scope_file_names(files)
+    if source_id is not None:
+        source = get_knowledge_source(source_id)
+        if source is None:
+            raise KeyError(f"Unknown knowledge source {source_id}")
+        source_names = scope_file_names(source["file_urls"])
+        file_names = (
+            source_names
+            if file_names is None
+            else [name for name in file_names if name in source_names]
+        )
+    if file_names is not None and not file_names:
+        raise ValueError("The query scope contains no files")
+    return file_names
+
+
+async def aresolve_scope(
+    source_id: Optional[int] = None, files: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """
+    Async variant of `resolve_scope`: a knowledge source is read from the
+    database on the blocking executor.
+    """
+    if source_id is None:
+        return resolve_scope(None, files)
+    return await run_blocking(resolve_scope, source_id, files)
+
+
+def query(
+    question: str, files: Optional[List[str]] = None, tenant: Optional[str] = None
+):
     """
     Queries the RAG pipeline and returns the response with source traceability information.
 
     Args:
         question (str): The query string.
+        files (list): Only retrieve from these files, see `resolve_scope`.
+        tenant (str): Query this tenant's index shard instead of the default.
 
     Returns:
         tuple: (response_text, confidence_score, source_files_urls)
@@ -633,16 +2292,21 @@ def query(question: str):
             - confidence_score (float): Confidence score of the response
             - source_files_urls (list): List of source files with URLs
     """
-    global RAG_PIPELINE
-
-    if RAG_PIPELINE is None:
-        initialize_rag_pipeline()
+    pipeline = get_pipeline(tenant)
 
     try:
         print(f"Querying with question: {question}")
 
         # Check for cached response
-        cached_response = query_cache.get(question)
+        file_names = scope_file_names(files)
+        cached_response = answer_cache.get(
+            "answers",
+            question,
+            pipeline.index_version,
+            PROMPT_VERSION,
+            pipeline.cache_scope(file_names),
+        )
+        QUERY_METRICS.count_cache("query", bool(cached_response))
         if cached_response:
             print("Loading response from cache...")
             return (
@@ -651,67 +2315,218 @@ def query(question: str):
                 cached_response["source_files"],
             )
 
-        response = RAG_PIPELINE.query(question)
-
-        # Extract source files information
-        source_files = []
-        if hasattr(response, "source_nodes") and response.source_nodes:
-            for node in response.source_nodes:
-                if hasattr(node, "metadata") and node.metadata:
-                    # Extract image path if available
-                    image_path = node.metadata.get("image_path", "")
-                    page_num = node.metadata.get("page_num", "unknown")
-                    file_name = node.metadata.get("file_name", "unknown")
-
-                    # Create a source entry with available information
-                    source_entry = f"Page {page_num}"
-                    if file_name != "unknown":
-                        source_entry += f" from {os.path.basename(file_name)}"
-
-                    if image_path:
-                        # Only add if this image path hasn't been added yet
-                        source_info = f"{source_entry}: {image_path}"
-                        if source_info not in source_files:
-                            source_files.append(source_info)
-
-        # Create the response text
-        response_text = str(response)
-
-        # Parse source files and convert paths to URLs
-        source_files_urls = []
-        for source in source_files:
-            # Extract the file path part (after the colon)
-            parts = source.split(": ")
-            if len(parts) > 1:
-                source_info = parts[0]
-                file_path = parts[1].strip()
-
-                # Convert the file path to a URL
-                url = f"http://localhost:8000/data_images/{Path(file_path).name}"
-                source_files_urls.append(f"{source_info}: {url}")
-            else:
-                # If there's no colon, just add the source as is
-                source_files_urls.append(source)
-
-        print(f"Response: {response_text}")
+        response = pipeline.query(question, file_names)
+        response_text, confidence, source_files_urls = _answer_from_response(
+            question, response, pipeline
+        )
         print(f"Metadata: {response.metadata}")
-        print(f"Source files: {source_files_urls}")
 
-        # Get confidence score
-        confidence = 1
+        return response_text, confidence, source_files_urls
+    except Exception as e:
+        print(f"Error during query: {e}")
+        return f"Error processing query: {str(e)}", 0, []
+
+
+async def aquery(
+    question: str, files: Optional[List[str]] = None, tenant: Optional[str] = None
+):
+    """
+    Async variant of `query()` for use from async endpoints.
 
-        # Cache the response, confidence, and source files
-        query_cache.set(
+    Args:
+        question (str): The query string.
+        files (list): Only retrieve from these files, see `resolve_scope`.
+        tenant (str): Query this tenant's index shard instead of the default.
+
+    Returns:
+        tuple: (response_text, confidence_score, source_files_urls)
+    """
+    # Loading a shard reads its index from disk
+    pipeline = await run_blocking(get_pipeline, tenant)
+
+    try:
+        print(f"Querying with question: {question}")
+
+        file_names = scope_file_names(files)
+        cached_response = await run_blocking(
+            answer_cache.get,
+            "answers",
             question,
-            {
-                "response": response_text,
-                "confidence": confidence,
-                "source_files": source_files_urls,
-            },
-            expire=3600,
-        )  # Cache for 1 hour
+            pipeline.index_version,
+            PROMPT_VERSION,
+            pipeline.cache_scope(file_names),
+        )
+        QUERY_METRICS.count_cache("query", bool(cached_response))
+        if cached_response:
+            print("Loading response from cache...")
+            return (
+                cached_response["response"],
+                cached_response["confidence"],
+                cached_response["source_files"],
+            )
+
+        response = await pipeline.aquery(question, file_names)
+        response_text, confidence, source_files_urls = await run_blocking(
+            _answer_from_response, question, response, pipeline
+        )
+        print(f"Metadata: {response.metadata}")
 
         return response_text, confidence, source_files_urls
     except Exception as e:
         print(f"Error during query: {e}")
         return f"Error processing query: {str(e)}", 0, []
+
+
+async def abatch_query(
+    questions: List[str],
+    max_concurrency: int = BATCH_LLM_CONCURRENCY,
+    tenant: Optional[str] = None,
+) -> List[dict]:
+    """
+    Batch variant of `aquery()`.
+
+    Args:
+        questions (list): The query strings.
+        max_concurrency (int): Most Gemini calls in flight at once, capped
+            at BATCH_LLM_CONCURRENCY.
+        tenant (str): Query this tenant's index shard instead of the default.
+
+    Returns:
+        list: One dict per question, in order, with "question", "response",
+            "confidence", "source_files" and "error" (None on success).
+    """
+    max_concurrency = min(max(1, max_concurrency), BATCH_LLM_CONCURRENCY)
+    pipeline = await run_blocking(get_pipeline, tenant)
+
+    results: List[Optional[dict]] = [None] * len(questions)
+    cached = await asyncio.gather(
+        *(
+            run_blocking(
+                answer_cache.get,
+                "answers",
+                question,
+                pipeline.index_version,
+                PROMPT_VERSION,
+                pipeline.cache_scope(),
+            )
+            for question in questions
+        )
+    )
+    pending = []
+    for i, (question, cached_response) in enumerate(zip(questions, cached)):
+        if cached_response:
+            results[i] = {"question": question, "error": None, **cached_response}
+        else:
+            pending.append(i)
+
+    if pending:
+        print(f"Batch querying {len(pending)} of {len(questions)} questions")
+        try:
+            responses = await pipeline.abatch_query(
+                [questions[i] for i in pending], max_concurrency=max_concurrency
+            )
+        except Exception as e:
+            responses = [e] * len(pending)
+
+        async def answer(i, response):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                response_text, confidence, source_files_urls = await run_blocking(
+                    _answer_from_response, questions[i], response, pipeline
+                )
+                results[i] = {
+                    "question": questions[i],
+                    "response": response_text,
+                    "confidence": confidence,
+                    "source_files": source_files_urls,
+                    "error": None,
+                }
+            except Exception as e:
+                print(f"Error during batch query {i}: {e}")
+                results[i] = {
+                    "question": questions[i],
+                    "response": None,
+                    "confidence": 0,
+                    "source_files": [],
+                    "error": str(e),
+                }
+
+        # Confidence scoring embeds each response; score the answers concurrently
+        await asyncio.gather(
+            *(answer(i, response) for i, response in zip(pending, responses))
+        )
+    return results
+
+
+def stream_query(
+    question: str, files: Optional[List[str]] = None, tenant: Optional[str] = None
+):
+    """
+    Streams a query as server-sent event payloads.
+
+    Args:
+        question (str): The query string.
+        files (list): Only retrieve from these files, see `resolve_scope`.
+        tenant (str): Query this tenant's index shard instead of the default.
+
+    Yields:
+        tuple: (event, data) pairs:
+            - ("sources", {"source_files": [...]}) once retrieval is done
+            - ("token", {"text": str}) for each chunk of the answer
+            - ("final", {...}) with the guardrail verdict and confidence. When
+              "retracted" is true the streamed tokens must be replaced by
+              "response".
+            - ("error", {"detail": str}) if the query failed
+    """
+    try:
+        pipeline = get_pipeline(tenant)
+        print(f"Streaming query with question: {question}")
+        for event, payload in pipeline.stream_query(question, files):
+            if event == "sources":
+                yield "sources", {"source_files": source_files_from_nodes(payload)}
+            elif event == "token":
+                yield "token", {"text": payload}
+            else:
+                status = payload.metadata.get("response_status", "success")
+                response_text, confidence, source_files_urls = _answer_from_response(
+                    question, payload, pipeline
+                )
+                yield "final", {
+                    "response": response_text,
+                    "response_status": status,
+                    "retracted": status == "sanitized",
+                    "confidence": confidence,
+                    "source_files": source_files_urls,
+                    "metadata": payload.metadata,
+                }
+    except Exception as e:
+        print(f"Error during streaming query: {e}")
+        yield "error", {"detail": f"Error processing query: {str(e)}"}
+
+
+def cache_stats():
+    """Returns answer cache, semantic cache and page image cache statistics."""
+    return {
+        "index_version": RAG_PIPELINE.index_version if RAG_PIPELINE else None,
+        "prompt_version": PROMPT_VERSION,
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "image_cache": THUMBNAIL_CACHE.stats(),
+        "shards": SHARDS.stats(),
+    }
+
+
+def shard_stats():
+    """Returns residency, sizes, load times and hits of the tenant shards."""
+    return SHARDS.stats()
+
+
+def query_metrics(fmt: str = "prometheus"):
+    """
+    Returns the query stage histograms and cache counters, as Prometheus
+    text or, with fmt="json", as a dict.
+    """
+    if fmt == "json":
+        return QUERY_METRICS.stats()
+    return QUERY_METRICS.render()
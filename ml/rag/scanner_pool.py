@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from llm_guard.input_scanners import Toxicity, TokenLimit
+from llm_guard.input_scanners.toxicity import MatchType
+from llm_guard.util import calculate_risk_score
+
+from rag.model_registry import get_or_load
+
+TOXICITY_THRESHOLD = 0.5
+TOKEN_LIMIT = 400
+TOKEN_ENCODING = "cl100k_base"
+
+# Micro-batching: concurrent toxicity scans arriving within the wait window
+# are scored together in one forward pass
+TOXICITY_BATCH_SIZE = int(os.environ.get("RAG_TOXICITY_BATCH_SIZE", 16))
+TOXICITY_BATCH_WAIT_MS = float(os.environ.get("RAG_TOXICITY_BATCH_WAIT_MS", 10))
+
+# Labels reported by the toxicity classifier that count towards the score
+TOXIC_LABELS = {
+    "toxicity",
+    "severe_toxicity",
+    "obscene",
+    "threat",
+    "insult",
+    "identity_attack",
+    "sexual_explicit",
+}
+
+ScanResult = Tuple[str, bool, float]
+
+
+class ToxicityBatcher:
+    """
+    Serves `scan()` calls from many threads with a single shared Toxicity
+    scanner, grouping calls that arrive close together into one batch.
+    """
+
+    def __init__(
+        self,
+        scanner: Toxicity,
+        threshold: float = TOXICITY_THRESHOLD,
+        max_batch_size: int = TOXICITY_BATCH_SIZE,
+        max_wait_ms: float = TOXICITY_BATCH_WAIT_MS,
+    ):
+        self.scanner = scanner
+        self.threshold = threshold
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="toxicity-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def scan(self, prompt: str) -> ScanResult:
+        """Same contract as `Toxicity.scan`: (sanitized, is_valid, risk_score)."""
+        if prompt.strip() == "":
+            return prompt, True, -1.0
+
+        future = Future()
+        self._queue.put((prompt, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score_batch(batch)
+
+    def _score_batch(self, batch):
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            results = self._scan_all(prompts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _scan_all(self, prompts: List[str]) -> List[ScanResult]:
+        pipeline = getattr(self.scanner, "_pipeline", None)
+        if pipeline is None or len(prompts) == 1:
+            return [self.scanner.scan(prompt) for prompt in prompts]
+
+        outputs = pipeline(prompts, batch_size=len(prompts))
+        return [
+            self._to_scan_result(prompt, labels)
+            for prompt, labels in zip(prompts, outputs)
+        ]
+
+    def _to_scan_result(self, prompt: str, labels) -> ScanResult:
+        # Mirrors Toxicity.scan for MatchType.FULL on a single input
+        if isinstance(labels, dict):
+            labels = [labels]
+        highest_score = 0.0
+        for result in labels:
+            if result["label"] not in TOXIC_LABELS:
+                continue
+            if result["score"] > self.threshold:
+                return (
+                    prompt,
+                    False,
+                    calculate_risk_score(result["score"], self.threshold),
+                )
+            highest_score = max(highest_score, result["score"])
+        return prompt, True, calculate_risk_score(highest_score, self.threshold)
+
+
+class ScannerPool:
+    """llm_guard scanners built once per process and shared by all requests."""
+
+    def __init__(self):
+        self.toxicity = ToxicityBatcher(
+            Toxicity(threshold=TOXICITY_THRESHOLD, match_type=MatchType.FULL)
+        )
+        self.token_limit = TokenLimit(limit=TOKEN_LIMIT, encoding_name=TOKEN_ENCODING)
+
+
+def get_scanner_pool() -> ScannerPool:
+    """Returns the shared scanner pool, building it on first use."""
+    return get_or_load(("scanner_pool",), ScannerPool)
+
+
+def warm_up():
+    """Builds the scanner pool so the first request doesn't load the models."""
+    get_scanner_pool()
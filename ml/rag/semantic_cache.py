@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from rag.model_registry import get_embed_model
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def _default_embed(text: str) -> List[float]:
+    return get_embed_model().get_text_embedding(text)
+
+
+class SemanticCache:
+    """
+    In-memory cache of answers keyed by question embedding.
+
+    A lookup returns the answer of the most similar cached question when
+    their cosine similarity reaches `threshold`. Entries expire after `ttl`
+    seconds and the least recently used entry is evicted past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        embed_fn: Callable[[str], List[float]] = _default_embed,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+
+        self._entries = OrderedDict()  # key -> (embedding, value, expires_at)
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def embed(self, question: str) -> np.ndarray:
+        """Returns the unit-length embedding of the normalized question."""
+        vector = np.asarray(
+            self.embed_fn(normalize_question(question)), dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: np.ndarray) -> Optional[Any]:
+        """Returns the cached value closest to `embedding`, or None on a miss."""
+        with self._lock:
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[k][0] for k in self._keys])
+
+            scores = self._matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def add(self, question: str, embedding: np.ndarray, value: Any):
+        """Caches `value` for the question, evicting the LRU entry if full."""
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = (embedding, value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "threshold": self.threshold,
+            }
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [
+            key
+            for key, (_, _, expires_at) in self._entries.items()
+            if expires_at <= now
+        ]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self.expirations += len(expired)
+            self._matrix = None
@@ -0,0 +1,275 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import (
+    NodeRelationship,
+    QueryBundle,
+    RelatedNodeInfo,
+    TextNode,
+)
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from rag.binary_store import (
+    HEADER_FNAME,
+    MmapVectorStore,
+    binary_storage_context,
+    has_binary_store,
+    migrate_json_store,
+)
+
+DIM = 8
+
+
+def make_nodes(count, doc_id="doc", seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    nodes = []
+    for i in range(start, start + count):
+        nodes.append(
+            TextNode(
+                id_=f"{doc_id}-{i}",
+                text=f"chunk {i}",
+                embedding=rng.normal(size=DIM).tolist(),
+                metadata={"file_name": f"{doc_id}.pdf", "page_num": i},
+                relationships={
+                    NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)
+                },
+            )
+        )
+    return nodes
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def top_ids(store, embedding, k=3):
+    result = store.query(
+        VectorStoreQuery(query_embedding=list(embedding), similarity_top_k=k)
+    )
+    return result.ids
+
+
+def read_header(directory):
+    with open(os.path.join(directory, HEADER_FNAME)) as f:
+        return json.load(f)
+
+
+def test_add_persist_reload(tmp_path):
+    nodes = make_nodes(5)
+    store = MmapVectorStore(str(tmp_path))
+    store.add(nodes)
+    # Pending vectors are queryable before persist
+    assert top_ids(store, nodes[2].embedding, k=1) == [nodes[2].node_id]
+    store.persist()
+
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert len(reloaded) == 5
+    assert read_header(tmp_path)["count"] == 5
+    for node in nodes:
+        assert top_ids(reloaded, node.embedding, k=1) == [node.node_id]
+    np.testing.assert_allclose(
+        reloaded.get_embeddings([n.node_id for n in nodes]),
+        np.stack([unit(n.embedding) for n in nodes]),
+        rtol=1e-6,
+    )
+
+
+def test_delete_leaves_tombstones(tmp_path):
+    store = MmapVectorStore(str(tmp_path))
+    kept = make_nodes(8, doc_id="kept")
+    deleted = make_nodes(2, doc_id="gone", seed=1)
+    store.add(kept + deleted)
+    store.persist()
+
+    store.delete("gone")
+    store.persist()
+    # 2 of 10 rows deleted stays under the compaction ratio
+    assert read_header(tmp_path)["count"] == 10
+
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert len(reloaded) == 8
+    ids = top_ids(reloaded, deleted[0].embedding, k=10)
+    assert not {n.node_id for n in deleted} & set(ids)
+    assert len(ids) == 8
+
+
+def test_compact_drops_deleted_rows(tmp_path):
+    store = MmapVectorStore(str(tmp_path))
+    kept = make_nodes(6, doc_id="kept")
+    deleted = make_nodes(4, doc_id="gone", seed=1)
+    store.add(kept + deleted)
+    store.persist()
+
+    store.delete("gone")
+    store.persist()  # 4 of 10 deleted: compacts
+    header = read_header(tmp_path)
+    assert header["count"] == 6
+    assert header["generation"] == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [HEADER_FNAME, "vectors.1.bin", "vectors.sqlite"]
+    )
+
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert len(reloaded) == 6
+    for node in kept:
+        assert top_ids(reloaded, node.embedding, k=1) == [node.node_id]
+    # Appends after a compaction go to the new generation
+    extra = make_nodes(1, doc_id="extra", seed=2)
+    reloaded.add(extra)
+    reloaded.persist()
+    again = MmapVectorStore(str(tmp_path))
+    assert len(again) == 7
+    assert top_ids(again, extra[0].embedding, k=1) == [extra[0].node_id]
+
+
+def test_interrupted_compact_keeps_the_live_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr("rag.binary_store.COMPACT_DELETED_RATIO", 1.0)
+    store = MmapVectorStore(str(tmp_path))
+    kept = make_nodes(6, doc_id="kept")
+    deleted = make_nodes(4, doc_id="gone", seed=1)
+    store.add(kept + deleted)
+    store.persist()
+    store.delete("gone")
+    store.persist()
+
+    def crash(self):
+        raise OSError("crashed before the header was written")
+
+    monkeypatch.setattr(MmapVectorStore, "_write_header", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+
+    # Renumbered rows were written, but every row still maps to its own
+    # vector, both in this process and after a restart
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert read_header(tmp_path)["generation"] == 0
+    assert "vectors.1.bin" not in os.listdir(tmp_path)
+    for current in (store, reloaded):
+        assert len(current) == 6
+        for node in kept:
+            assert top_ids(current, node.embedding, k=1) == [node.node_id]
+
+    reloaded.compact()
+    assert read_header(tmp_path) == {
+        "dim": DIM,
+        "dtype": "float32",
+        "count": 6,
+        "generation": 1,
+    }
+
+
+def test_int8_round_trip(tmp_path):
+    nodes = make_nodes(20)
+    store = MmapVectorStore(str(tmp_path), dtype="int8")
+    store.add(nodes)
+    store.persist()
+
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert reloaded.dtype == "int8"
+    expected = np.stack([unit(n.embedding) for n in nodes])
+    actual = reloaded.get_embeddings([n.node_id for n in nodes])
+    # Per-row scales bound the error by half a quantization step
+    assert np.abs(actual - expected).max() <= np.abs(expected).max() / 254 + 1e-6
+    for node in nodes:
+        assert top_ids(reloaded, node.embedding, k=1) == [node.node_id]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_query_batch_matches_query(tmp_path, dtype):
+    store = MmapVectorStore(str(tmp_path), dtype=dtype)
+    store.add(make_nodes(30))
+    store.persist()
+    store.add(make_nodes(5, doc_id="pending", seed=1))  # not persisted
+    store.delete_nodes(["doc-3"])
+
+    queries = np.random.default_rng(7).normal(size=(4, DIM)).tolist()
+    batch = store.query_batch(queries, similarity_top_k=5)
+    for embedding, batched in zip(queries, batch):
+        single = store.query(
+            VectorStoreQuery(query_embedding=embedding, similarity_top_k=5)
+        )
+        assert batched.ids == single.ids
+        np.testing.assert_allclose(
+            batched.similarities, single.similarities, rtol=1e-5
+        )
+        assert "doc-3" not in batched.ids
+
+
+def test_migrate_json_store(tmp_path):
+    embed_model = MockEmbedding(embed_dim=DIM)
+    nodes = make_nodes(6)
+    legacy = VectorStoreIndex(
+        nodes,
+        storage_context=StorageContext.from_defaults(),
+        embed_model=embed_model,
+    )
+    legacy.storage_context.persist(str(tmp_path))
+    assert not has_binary_store(str(tmp_path))
+
+    index = migrate_json_store(str(tmp_path), legacy.index_id, embed_model)
+    assert has_binary_store(str(tmp_path))
+    assert index.index_id == legacy.index_id
+    assert set(index.docstore.docs) == {n.node_id for n in nodes}
+
+    store = MmapVectorStore(str(tmp_path))
+    np.testing.assert_allclose(
+        store.get_embeddings([n.node_id for n in nodes]),
+        np.stack([unit(n.embedding) for n in nodes]),
+        rtol=1e-6,
+    )
+
+
+def test_index_retriever_scans_in_chunks(tmp_path, monkeypatch):
+    nodes = make_nodes(6, doc_id="a") + make_nodes(6, doc_id="b", seed=1)
+    index = VectorStoreIndex(
+        nodes,
+        storage_context=binary_storage_context(str(tmp_path), dtype="int8"),
+        embed_model=MockEmbedding(embed_dim=DIM),
+    )
+    index.storage_context.persist(str(tmp_path))
+    store = index.vector_store
+
+    # The retriever sends every node id of the index with each query; that
+    # must not turn into a gather (and dequantized copy) of every row
+    gathered = []
+    row_vectors = MmapVectorStore._row_vectors
+
+    def spy(self, rows):
+        gathered.append(len(rows))
+        return row_vectors(self, rows)
+
+    monkeypatch.setattr(MmapVectorStore, "_row_vectors", spy)
+    retriever = index.as_retriever(similarity_top_k=3)
+    for node in nodes:
+        results = retriever.retrieve(
+            QueryBundle(query_str=node.text, embedding=node.embedding)
+        )
+        assert results[0].node.node_id == node.node_id
+    assert gathered == []
+
+    # A filtered retriever still only reads the matching rows
+    filters = MetadataFilters(
+        filters=[
+            MetadataFilter(key="file_name", value="b.pdf", operator=FilterOperator.EQ)
+        ]
+    )
+    scoped = index.as_retriever(similarity_top_k=3, filters=filters)
+    results = scoped.retrieve(
+        QueryBundle(query_str="x", embedding=nodes[0].embedding)
+    )
+    assert {r.node.metadata["file_name"] for r in results} == {"b.pdf"}
+    assert gathered == [len(store.node_ids(filters))] == [6]
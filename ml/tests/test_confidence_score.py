@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rag_service = pytest.importorskip("rag.rag_service")
+
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import NodeWithScore, TextNode
+
+
+def page_node(node_id, file_name, page_num):
+    return TextNode(
+        id_=node_id, text="", metadata={"file_name": file_name, "page_num": page_num}
+    )
+
+
+def test_citations_only_match_pages_of_the_source_files(monkeypatch):
+    nodes = [
+        page_node("a1", "a.pdf", 1),
+        page_node("a2", "a.pdf", 2),
+        page_node("b1", "b.pdf", 1),
+    ]
+    lookup = rag_service.build_page_lookup(nodes)
+    assert lookup == {"a.pdf": {1: ["a1"], 2: ["a2"]}, "b.pdf": {1: ["b1"]}}
+
+    # a1 matches the answer exactly, b1 is orthogonal to it
+    embeddings = {"a1": [1.0, 0.0], "a2": [0.0, 1.0], "b1": [0.0, 1.0]}
+    requested = []
+
+    def get_embeddings(node_ids):
+        requested.append(list(node_ids))
+        return np.asarray([embeddings[n] for n in node_ids], dtype=np.float32)
+
+    index = SimpleNamespace(
+        vector_store=SimpleNamespace(get_embeddings=get_embeddings)
+    )
+    monkeypatch.setattr(
+        rag_service,
+        "get_embed_model",
+        lambda: SimpleNamespace(get_text_embedding=lambda text: [1.0, 0.0]),
+    )
+
+    response = Response(
+        response="See the summary (Page 1).",
+        source_nodes=[NodeWithScore(node=nodes[0], score=1.0)],
+    )
+    score = rag_service.get_confidence_score(response, index, lookup)
+    assert requested == [["a1"]]
+    assert score == pytest.approx(1.0)
+
+    response.source_nodes = []
+    assert rag_service.get_confidence_score(response, index, lookup) == 0.0
@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tiktoken")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from rag.context_builder import ContextBuilder
+
+
+def scored(node_id, text, score=1.0, **metadata):
+    return NodeWithScore(
+        node=TextNode(id_=node_id, text=text, metadata=metadata), score=score
+    )
+
+
+@pytest.fixture
+def builder():
+    try:
+        return ContextBuilder(token_budget=20)
+    except Exception as e:  # tiktoken downloads its encodings on first use
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+
+
+def test_stops_at_the_token_budget(builder):
+    nodes = [scored(f"n{i}", " ".join(["word"] * 8) + f" {i}") for i in range(4)]
+    context, kept, stats = builder.build(nodes)
+
+    assert [n.node.node_id for n in kept] == ["n0", "n1"]
+    assert stats["context_nodes"] == 2
+    assert stats["over_budget_dropped"] == 2
+    assert stats["context_tokens"] <= builder.token_budget
+    assert stats["context_tokens"] == builder.count_tokens(context)
+
+
+def test_truncates_an_oversized_best_node(builder):
+    context, kept, stats = builder.build([scored("big", "word " * 100)])
+    assert len(kept) == 1
+    assert builder.count_tokens(context) <= builder.token_budget
+    assert stats["context_tokens"] == builder.token_budget
+
+
+def test_drops_duplicates(builder):
+    embeddings = {
+        "a": [1.0, 0.0],
+        "b": [0.0, 1.0],
+        "a-copy": [1.0, 0.0],
+        "near-a": [0.99, 0.05],
+    }
+    builder = ContextBuilder(
+        token_budget=200,
+        embeddings_fn=lambda ids: np.asarray([embeddings[i] for i in ids]),
+    )
+    nodes = [
+        scored("a", "alpha"),
+        scored("b", "beta"),
+        scored("a-copy", "alpha"),
+        scored("near-a", "alpha, reworded"),
+    ]
+    context, kept, stats = builder.build(nodes)
+    assert [n.node.node_id for n in kept] == ["a", "b"]
+    assert stats["duplicates_dropped"] == 2
+
+
+def test_excluded_metadata_stays_out_of_the_prompt(builder):
+    node = scored(
+        "a",
+        "alpha",
+        page_num=3,
+        image_path="/images/a-3.jpg",
+        parsed_text_markdown="# alpha",
+    )
+    context, _, _ = builder.build([node])
+    assert "page_num: 3" in context
+    assert "image_path" not in context
+    assert "parsed_text_markdown" not in context
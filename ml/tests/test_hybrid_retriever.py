@@ -0,0 +1,121 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from rag.hybrid_retriever import BM25Index, HybridRetriever
+
+TEXTS = {
+    "python": "Python developer with Django and Flask experience",
+    "java": "Java developer, Spring Boot and Kafka",
+    "data": "Data analyst: SQL, Python, dashboards and reporting",
+    "design": "Product designer, Figma prototypes and user research",
+}
+
+
+def make_nodes(texts=TEXTS):
+    return [
+        TextNode(id_=node_id, text="", metadata={"parsed_text": text})
+        for node_id, text in texts.items()
+    ]
+
+
+def test_bm25_ranks_keyword_matches():
+    bm25 = BM25Index.from_nodes(make_nodes())
+    ids = [node_id for node_id, _ in bm25.search("python developer", top_k=3)]
+    assert ids[0] == "python"
+    assert set(ids) == {"python", "data", "java"}
+    assert bm25.search("python", top_k=5, allowed_ids={"data"})[0][0] == "data"
+
+    bm25.remove(["python"])
+    assert "python" not in dict(bm25.search("python developer", top_k=5))
+
+
+def test_bm25_save_load_round_trip(tmp_path):
+    bm25 = BM25Index.from_nodes(make_nodes(), k1=1.2, b=0.5)
+    bm25.remove(["design"])
+    path = str(tmp_path / "bm25.json")
+    bm25.save(path)
+
+    loaded = BM25Index.load(path)
+    assert (loaded.k1, loaded.b, len(loaded)) == (1.2, 0.5, 3)
+    for query in ("python developer", "spring kafka", "sql reporting"):
+        assert loaded.search(query, top_k=3) == bm25.search(query, top_k=3)
+    # A loaded index is updated like a built one
+    loaded.add(make_nodes({"go": "Go developer, gRPC and Kubernetes"}))
+    assert loaded.search("kubernetes", top_k=1)[0][0] == "go"
+
+
+class FixedRetriever(BaseRetriever):
+    """Vector side stub returning the same ranked nodes for every query."""
+
+    def __init__(self, nodes):
+        super().__init__()
+        self.nodes = nodes
+
+    def _retrieve(self, query_bundle):
+        return [NodeWithScore(node=n, score=1.0) for n in self.nodes]
+
+
+class Docstore:
+    def __init__(self, nodes):
+        self.nodes = {n.node_id: n for n in nodes}
+
+    def get_nodes(self, node_ids, raise_error=True):
+        return [self.nodes.get(node_id) for node_id in node_ids]
+
+
+class Reranker:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict(self, pairs):
+        return [self.scores[text] for _, text in pairs]
+
+
+def make_retriever(vector_ids, reranker=None, **kwargs):
+    nodes = {n.node_id: n for n in make_nodes()}
+    return HybridRetriever(
+        vector_retriever=FixedRetriever([nodes[i] for i in vector_ids]),
+        bm25=BM25Index.from_nodes(nodes.values()),
+        docstore=Docstore(nodes.values()),
+        reranker=reranker,
+        **kwargs,
+    )
+
+
+def test_rrf_favors_nodes_ranked_by_both_retrievers():
+    retriever = make_retriever(["design", "data"], candidate_k=3, max_k=4)
+    ids = [n.node.node_id for n in retriever.retrieve("python developer")]
+
+    # data: vector rank 2 + keyword rank 3 beats design's vector rank 1
+    assert ids[0] == "data"
+    # python and java are keyword-only hits, loaded from the docstore
+    assert set(ids) == {"data", "design", "python", "java"}
+    assert ids.index("python") < ids.index("java")
+
+
+def test_rrf_scores():
+    retriever = make_retriever([], rrf_k=60)
+    fused = retriever._rrf(["a", "b"], ["b", "c"])
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["c"] == pytest.approx(1 / 62)
+
+
+def test_reranker_cutoff_and_bounds():
+    scores = {TEXTS["python"]: 0.9, TEXTS["data"]: 0.5, TEXTS["java"]: 0.1}
+    retriever = make_retriever(
+        ["java"], reranker=Reranker(scores), cutoff=0.3, max_k=6, min_k=1
+    )
+    results = retriever.retrieve("python developer")
+    assert [n.node.node_id for n in results] == ["python", "data"]
+    assert [n.score for n in results] == [0.9, 0.5]
+
+    # Nothing clears the cutoff: the best min_k candidates are still kept
+    retriever.cutoff = 0.95
+    assert [n.node.node_id for n in retriever.retrieve("python developer")] == [
+        "python"
+    ]
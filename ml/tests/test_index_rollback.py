@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+rag_service = pytest.importorskip("rag.rag_service")
+
+from rag.index_versions import IndexVersions
+
+
+def make_pipeline(directory):
+    """A RAGPipeline with only the version bookkeeping, no models."""
+    pipeline = object.__new__(rag_service.RAGPipeline)
+    pipeline.storage_dir = directory
+    pipeline.versions = IndexVersions(directory)
+    pipeline.index_version_path = f"{directory}/index_version.txt"
+    pipeline._snapshot = None
+    pipeline._recent = OrderedDict()
+    pipeline._ingest_lock = threading.Lock()
+    pipeline.semantic_cache = SimpleNamespace(clear=lambda: None)
+    return pipeline
+
+
+def ingest(pipeline, version):
+    pipeline.versions.create(version)
+    pipeline._publish(SimpleNamespace(version=version, index=object()))
+
+
+def test_rollback_to_a_pruned_version_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_service, "INDEX_KEEP_VERSIONS", 3)
+    pipeline = make_pipeline(str(tmp_path))
+    for version in (1, 2, 3):
+        ingest(pipeline, version)
+
+    assert pipeline.rollback(1) == 1
+    # v1 is the most recently activated, but the lowest number: pruned
+    ingest(pipeline, 4)
+    assert pipeline.versions.list() == [2, 3, 4]
+    assert 1 not in pipeline._recent
+
+    with pytest.raises(ValueError):
+        pipeline.rollback(1)
+    assert pipeline.versions.current() == 4
+    assert pipeline.index_version == 4
+
+    assert pipeline.rollback() == 3
+    assert pipeline.versions.current() == 3
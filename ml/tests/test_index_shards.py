@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from rag.index_shards import IndexShardManager
+
+
+class Loader:
+    """load_fn recording its calls; shard sizes come from `sizes`."""
+
+    def __init__(self, sizes=None, delay=0.0):
+        self.sizes = sizes or {}
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, shard_id):
+        self.calls.append(shard_id)
+        time.sleep(self.delay)
+        return {"id": shard_id, "size": self.sizes.get(shard_id, 10)}
+
+
+def make_manager(loader, budget=100):
+    return IndexShardManager(loader, lambda shard: shard["size"], budget)
+
+
+def test_loads_once_and_reuses():
+    loader = Loader()
+    manager = make_manager(loader)
+    first = manager.get("a")
+    assert manager.get("a") is first
+    assert loader.calls == ["a"]
+    stats = manager.stats()
+    assert stats["shards"]["a"]["loads"] == 1
+    assert stats["shards"]["a"]["hits"] == 1
+
+
+def test_evicts_least_recently_used_past_budget():
+    loader = Loader({"a": 40, "b": 40, "c": 40})
+    manager = make_manager(loader, budget=100)
+    manager.get("a")
+    manager.get("b")
+    manager.get("a")  # b is now the coldest
+    manager.get("c")
+
+    stats = manager.stats()
+    assert stats["resident"] == ["a", "c"]
+    assert stats["resident_bytes"] == 80
+    assert stats["evictions"] == 1
+    assert stats["shards"]["b"]["resident"] is False
+
+    # An evicted shard is loaded again on its next use
+    manager.get("b")
+    assert loader.calls == ["a", "b", "c", "b"]
+
+
+def test_keeps_the_newest_shard_even_over_budget():
+    manager = make_manager(Loader({"a": 10, "big": 500}), budget=100)
+    manager.get("a")
+    manager.get("big")
+    assert manager.stats()["resident"] == ["big"]
+
+
+def test_resize_can_evict():
+    loader = Loader({"a": 40, "b": 40})
+    manager = make_manager(loader, budget=100)
+    manager.get("a")
+    shard = manager.get("b")
+    shard["size"] = 90  # e.g. grown by an ingest
+    manager.resize("b")
+    assert manager.stats()["resident"] == ["b"]
+    assert manager.stats()["resident_bytes"] == 90
+
+
+def test_concurrent_first_use_shares_one_load():
+    loader = Loader(delay=0.05)
+    manager = make_manager(loader)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.get("a")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == ["a"]
+    assert all(result is results[0] for result in results)
+    assert manager._load_locks == {}
+
+
+def test_failed_load_is_retried():
+    attempts = []
+
+    def load(shard_id):
+        attempts.append(shard_id)
+        if len(attempts) == 1:
+            raise OSError("disk unavailable")
+        return {"size": 1}
+
+    manager = IndexShardManager(load, lambda shard: shard["size"], 100)
+    with pytest.raises(OSError):
+        manager.get("a")
+    assert manager.peek("a") is None
+    assert manager._load_locks == {}
+    assert manager.get("a") == {"size": 1}
+    assert attempts == ["a", "a"]
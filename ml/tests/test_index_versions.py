@@ -0,0 +1,89 @@
+import os
+
+from rag.index_versions import IndexVersions
+
+
+def build(versions, version, base=None, content=None):
+    directory = versions.create(
+        version, versions.path(base) if base is not None else None
+    )
+    if content is not None:
+        with open(os.path.join(directory, "data.txt"), "w") as f:
+            f.write(content)
+    return directory
+
+
+def read(directory):
+    with open(os.path.join(directory, "data.txt")) as f:
+        return f.read()
+
+
+def test_publish_and_copy_from_base(tmp_path):
+    versions = IndexVersions(str(tmp_path))
+    assert versions.current() is None
+    assert versions.list() == []
+
+    build(versions, 1, content="one")
+    versions.publish(1)
+    assert versions.current() == 1
+
+    # A new version starts as a copy of its base; the base is untouched
+    directory = build(versions, 2, base=1)
+    assert read(directory) == "one"
+    with open(os.path.join(directory, "data.txt"), "w") as f:
+        f.write("two")
+    assert read(versions.path(1)) == "one"
+    # Not live until published
+    assert versions.current() == 1
+    versions.publish(2)
+    assert versions.current() == 2
+    assert versions.list() == [1, 2]
+
+
+def test_create_replaces_an_unpublished_build(tmp_path):
+    versions = IndexVersions(str(tmp_path))
+    build(versions, 1, content="stale")
+    directory = build(versions, 1)
+    assert os.listdir(directory) == []
+
+
+def test_copy_skips_version_bookkeeping(tmp_path):
+    # The legacy unversioned storage_dir holds versions/ and CURRENT too
+    versions = IndexVersions(str(tmp_path))
+    with open(os.path.join(tmp_path, "index.sqlite"), "w") as f:
+        f.write("legacy")
+    with open(os.path.join(tmp_path, "vectors.json.tmp"), "w") as f:
+        f.write("partial")
+    build(versions, 1)
+    versions.publish(1)
+
+    directory = versions.create(2, str(tmp_path))
+    assert sorted(os.listdir(directory)) == ["index.sqlite"]
+
+
+def test_prune_keeps_newest_and_live(tmp_path):
+    versions = IndexVersions(str(tmp_path))
+    for version in range(1, 6):
+        build(versions, version)
+    versions.publish(2)
+
+    versions.prune(3)
+    # The live version plus the two newest others
+    assert versions.list() == [2, 4, 5]
+    assert versions.current() == 2
+
+    versions.prune(1)
+    assert versions.list() == [2]
+
+
+def test_rollback_by_republishing(tmp_path):
+    versions = IndexVersions(str(tmp_path))
+    for version in (1, 2, 3):
+        build(versions, version, content=str(version))
+        versions.publish(version)
+
+    versions.publish(2)
+    assert versions.current() == 2
+    assert read(versions.path(versions.current())) == "2"
+    versions.discard(3)
+    assert versions.list() == [1, 2]
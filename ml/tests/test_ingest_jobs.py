@@ -0,0 +1,73 @@
+import threading
+import time
+
+from rag.ingest_jobs import IngestJobQueue
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class BlockingRun:
+    """run_fn that blocks until released, recording the keys it ran."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.keys = []
+
+    def __call__(self, key, report):
+        self.keys.append(key)
+        self.started.set()
+        report("a.pdf", "done", {"nodes": 1})
+        self.release.wait(5)
+        return {"key": key}
+
+
+def test_identical_queued_requests_share_a_job():
+    run = BlockingRun()
+    jobs = IngestJobQueue(run)
+    running, created = jobs.submit("x")
+    assert created
+    run.started.wait(5)
+
+    # The running job may have hashed the files already: one follow-up job
+    follow_up, created = jobs.submit("x")
+    assert created and follow_up.id != running.id
+    same, created = jobs.submit("x")
+    assert not created and same is follow_up
+    other, created = jobs.submit("y")
+    assert created
+
+    run.release.set()
+    wait_for(lambda: other.status == "completed")
+    assert run.keys == ["x", "x", "y"]
+    assert follow_up.status == "completed"
+    assert jobs.get(running.id).to_dict()["summary"]["key"] == "x"
+    assert running.to_dict()["file_counts"] == {"done": 1}
+
+
+def test_failed_run_fails_the_job():
+    def run(key, report):
+        raise RuntimeError("persist failed")
+
+    jobs = IngestJobQueue(run)
+    job, _ = jobs.submit("x")
+    wait_for(lambda: job.status in ("completed", "failed"))
+    assert job.status == "failed"
+    assert job.error == "persist failed"
+    assert job.to_dict()["duration_seconds"] is not None
+
+
+def test_history_is_bounded():
+    jobs = IngestJobQueue(lambda key, report: {}, max_jobs=2)
+    submitted = []
+    for key in range(4):
+        job, _ = jobs.submit(key)
+        wait_for(lambda: job.status == "completed")
+        submitted.append(job)
+    assert jobs.get(submitted[0].id) is None
+    assert jobs.get(submitted[-1].id) is submitted[-1]
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("llama_index.embeddings.huggingface")
+
+from llama_index.core.embeddings import MockEmbedding
+
+from rag.model_registry import embed_queries, get_embed_model
+
+QUERIES = [
+    "What are the areas of improvement in my resume?",
+    "Which skills should I highlight?",
+    "Which skills should I highlight?",
+]
+
+
+@pytest.fixture(scope="module")
+def embed_model():
+    try:
+        return get_embed_model()
+    except OSError as e:  # weights not cached and no network
+        pytest.skip(f"Embedding model unavailable: {e}")
+
+
+def test_embed_queries_matches_get_query_embedding(embed_model):
+    batched = embed_queries(embed_model, QUERIES)
+    expected = [embed_model.get_query_embedding(query) for query in QUERIES]
+    np.testing.assert_allclose(batched, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_embed_queries_other_models():
+    embed_model = MockEmbedding(embed_dim=4)
+    assert embed_queries(embed_model, QUERIES) == [
+        embed_model.get_query_embedding(query) for query in QUERIES
+    ]
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+semantic_cache = pytest.importorskip("rag.semantic_cache")
+
+from rag.semantic_cache import SemanticCache, normalize_question
+
+VECTORS = {
+    "what are my strengths": [1.0, 0.0, 0.0],
+    "what are my weaknesses": [0.0, 1.0, 0.0],
+    "which skills should i learn": [0.0, 0.0, 1.0],
+}
+
+
+def embed(text):
+    return VECTORS.get(text, [0.6, 0.8, 0.0])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(
+        semantic_cache, "time", SimpleNamespace(monotonic=lambda: now.value)
+    )
+    return now
+
+
+def add(cache, question, value):
+    cache.add(question, cache.embed(question), value)
+
+
+def test_normalize_question():
+    assert normalize_question("  What are   my Strengths?! ") == "what are my strengths"
+
+
+def test_hit_above_threshold_only():
+    cache = SemanticCache(threshold=0.9, embed_fn=embed)
+    add(cache, "What are my strengths?", "strengths")
+    assert cache.lookup(cache.embed("what are my STRENGTHS")) == "strengths"
+    # [0.6, 0.8, 0] is 0.6 similar to the cached question
+    assert cache.lookup(cache.embed("something else")) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire(clock):
+    cache = SemanticCache(ttl=60, embed_fn=embed)
+    add(cache, "What are my strengths?", "strengths")
+    clock.value += 59
+    assert cache.lookup(cache.embed("what are my strengths")) == "strengths"
+    clock.value += 1
+    assert cache.lookup(cache.embed("what are my strengths")) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = SemanticCache(max_entries=2, embed_fn=embed)
+    add(cache, "what are my strengths", "strengths")
+    add(cache, "what are my weaknesses", "weaknesses")
+    # A hit makes strengths the most recently used
+    assert cache.lookup(cache.embed("what are my strengths")) == "strengths"
+    add(cache, "which skills should I learn", "skills")
+
+    assert cache.lookup(cache.embed("what are my weaknesses")) is None
+    assert cache.lookup(cache.embed("what are my strengths")) == "strengths"
+    assert cache.lookup(cache.embed("which skills should i learn")) == "skills"
+    assert cache.stats()["evictions"] == 1